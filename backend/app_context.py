@@ -0,0 +1,158 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Any, Optional
+
+from llama_index.core import Settings
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms.llm import LLM
+
+from embedding_cache import CachedEmbedding, DEFAULT_EMBEDDING_CACHE_DIR, embed_model_id
+from llm_scheduler import ScheduledEmbedding, ScheduledLLM, bind_schedulers, get_scheduler
+from tavily import close_tavily_client, get_tavily_client
+from gri_catalog import GRICatalog, load_gri_catalog
+from gri_index import GRIIndex, load_gri_index
+from parse_cache import shutdown_parse_pool
+from startup import startup_timer
+
+
+logger = getLogger(__name__)
+
+# Serve every session from the deterministic fakes in fakes.py, for load tests.
+USE_FAKE_MODELS = (os.getenv("FAKE_MODELS") or "").lower() in ("1", "true", "yes")
+# GRI index embedded with the fake embedding model, built on first start in fake mode.
+FAKE_GRI_PERSIST_DIR = "storage/fake_gri"
+
+
+@dataclass
+class AppContext:
+    """Process-wide resources shared by every session.
+
+    Built once when the app starts and handed to each workflow explicitly, so
+    concurrent sessions never reconfigure clients or global settings.
+    """
+
+    llm: LLM
+    embed_model: BaseEmbedding
+    tracer_provider: Optional[Any] = None
+    gri_index: Optional[GRIIndex] = None
+    gri_catalog: Optional[GRICatalog] = None
+
+
+def create_llm() -> LLM:
+    openai_key = os.getenv("OPENAI_API_KEY")
+    if USE_FAKE_MODELS:
+        from fakes import FakeLLM
+
+        llm = FakeLLM(
+            latency=float(os.getenv("FAKE_LLM_LATENCY") or 0.5),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND") or 50),
+        )
+    elif openai_key and len(openai_key) > 1:
+        print("OpenAI")
+        # Provider integrations are imported only when configured, they are slow to import.
+        openai = startup_timer.import_component("llm", "llama_index.llms.openai")
+        llm = openai.OpenAI(model="gpt-4o")
+    else:
+        nvidia = startup_timer.import_component("llm", "llama_index.llms.nvidia")
+        llm = nvidia.NVIDIA(model="meta/llama-3.2-70b-instruct")
+    return ScheduledLLM(llm, get_scheduler(llm.metadata.model_name, "LLM"))
+
+
+def create_embed_model() -> BaseEmbedding:
+    if USE_FAKE_MODELS:
+        from fakes import FakeEmbedding
+
+        embed_model = FakeEmbedding(latency=float(os.getenv("FAKE_EMBED_LATENCY") or 0.05))
+    else:
+        nvidia = startup_timer.import_component("embed_model", "llama_index.embeddings.nvidia")
+        embed_model = nvidia.NVIDIAEmbedding(model="NV-Embed-QA", truncate="END")
+    # Scheduled below the cache, so cache hits do not count against the budget.
+    embed_model = ScheduledEmbedding(embed_model, get_scheduler(embed_model_id(embed_model), "EMBED"))
+    embedding_cache_dir = os.getenv("EMBEDDING_CACHE_DIR", DEFAULT_EMBEDDING_CACHE_DIR)
+    if embedding_cache_dir:
+        embed_model = CachedEmbedding(embed_model, cache_dir=embedding_cache_dir)
+    return embed_model
+
+
+def load_fake_gri_index(embed_model: BaseEmbedding) -> GRIIndex:
+    from build_gri_index import build_gri_index
+
+    if not os.path.exists(os.path.join(FAKE_GRI_PERSIST_DIR, "manifest.json")):
+        print("\n> Building the GRI index with fake embeddings\n")
+        build_gri_index(embed_model, persist_dir=FAKE_GRI_PERSIST_DIR)
+    return load_gri_index(FAKE_GRI_PERSIST_DIR)
+
+
+def setup_tracing() -> Optional[Any]:
+    """Register the Phoenix tracer provider once, when Phoenix is configured."""
+    client_headers = os.getenv("PHOENIX_CLIENT_HEADERS")
+    if not (client_headers and client_headers.startswith("api_key=")):
+        return None
+
+    phoenix_otel = startup_timer.import_component("tracing", "phoenix.otel")
+    instrumentation = startup_timer.import_component("tracing", "openinference.instrumentation.llama_index")
+    tracer_provider = phoenix_otel.register(
+        project_name="esg-insight-ai-app",
+        verbose=False,
+        batch=True
+        )
+    instrumentation.LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider,skip_dep_check=True)
+    return tracer_provider
+
+
+async def create_app_context() -> AppContext:
+    """Create the models and clients; the GRI index is loaded by `warm_up` or on first use."""
+    with startup_timer.measure("tracing"):
+        tracer_provider = setup_tracing()
+    with startup_timer.measure("llm"):
+        llm = create_llm()
+    with startup_timer.measure("embed_model"):
+        embed_model = create_embed_model()
+    # Sync model calls from worker threads are admitted through this loop.
+    bind_schedulers()
+
+    # Fallback for llama-index components that are not handed a model explicitly.
+    Settings.llm = llm
+    Settings.embed_model = embed_model
+
+    gri_index = None
+    if USE_FAKE_MODELS:
+        # The GRI workflow would load the default index, embedded with the real model.
+        with startup_timer.measure("gri_index"):
+            gri_index = await asyncio.to_thread(load_fake_gri_index, embed_model)
+
+    with startup_timer.measure("gri_catalog"):
+        gri_catalog = load_gri_catalog()
+    if gri_catalog is None:
+        print("\n> No GRI reporting requirements catalog found, run gri_catalog.py to build one\n")
+
+    return AppContext(
+        llm=llm,
+        embed_model=embed_model,
+        tracer_provider=tracer_provider,
+        gri_index=gri_index,
+        gri_catalog=gri_catalog,
+    )
+
+
+async def warm_up(app_context: AppContext) -> None:
+    """Preload the GRI index and the Tavily client, which the first session would otherwise wait for."""
+    if app_context.gri_index is None:
+        try:
+            with startup_timer.measure("gri_index"):
+                app_context.gri_index = await asyncio.to_thread(load_gri_index)
+        except Exception as e:
+            # The GRI workflow loads the index on demand and reports the error then.
+            logger.warning(f"Could not preload GRI index: {e}")
+
+    with startup_timer.measure("tavily"):
+        get_tavily_client()
+
+
+async def close_app_context(app_context: AppContext) -> None:
+    await close_tavily_client()
+    shutdown_parse_pool()
+    if app_context.tracer_provider is not None:
+        app_context.tracer_provider.shutdown()
@@ -0,0 +1,320 @@
+"""Batch ESG materiality analysis for a portfolio of companies.
+
+Every company runs through ESGMaterialityAnalysisWorkflow with the
+input-required prompts auto-accepted. All runs share one AppContext, so LLM,
+embedding and search clients and their caches are shared too. Each result is
+appended to a JSONL file as soon as it is ready. Companies already in that
+file are skipped, so an interrupted batch resumes where it stopped.
+
+The company list is a CSV with a `company_name` column and an optional
+`docs_dir` column, a JSONL file with the same keys, or plain text with one
+company per line.
+
+Usage:
+    python batch.py companies.csv --output storage/batches/portfolio.jsonl [--concurrency 4] [--parquet]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from llama_index.core.workflow.handler import WorkflowHandler
+
+from app_context import AppContext
+from company_index import company_docs_dir, has_company_docs
+from llm_scheduler import batch_priority
+from metrics import start_run
+from session import INPUT_REQUIRED_TYPES, apply_user_response, event_to_message
+from workflows.esg_materiality_analysis_workflow import ESGMaterialityAnalysisWorkflow
+
+
+logger = getLogger(__name__)
+
+DEFAULT_BATCH_DIR = "storage/batches"
+# Batch ids name results files, so only the uuid hex ids start_batch generates are accepted.
+BATCH_ID_RE = re.compile(r"[0-9a-f]{32}")
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY") or 4)
+# Parquet is rewritten from the JSONL file after this many new results.
+PARQUET_EVERY = 25
+AUTO_ACCEPT = {"response": "yes"}
+
+
+@dataclass
+class BatchCompany:
+    company_name: str
+    docs_dir: Optional[str] = None
+
+
+def load_companies(path: str) -> List[BatchCompany]:
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    elif path.endswith(".jsonl"):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path) as f:
+            rows = [{"company_name": line.strip()} for line in f if line.strip()]
+    return [
+        BatchCompany(row["company_name"].strip(), (row.get("docs_dir") or "").strip() or None)
+        for row in rows
+        if row.get("company_name", "").strip()
+    ]
+
+
+def stage_company_docs(company: BatchCompany) -> None:
+    """Copy a company's docs folder to where get_company_index looks for it."""
+    if not company.docs_dir:
+        return
+    target_dir = company_docs_dir(company.company_name)
+    os.makedirs(target_dir, exist_ok=True)
+    for name in os.listdir(company.docs_dir):
+        source = os.path.join(company.docs_dir, name)
+        target = os.path.join(target_dir, name)
+        if os.path.isfile(source) and (
+            not os.path.exists(target) or os.path.getmtime(source) > os.path.getmtime(target)
+        ):
+            shutil.copy2(source, target)
+
+
+async def analyze_company(app_context: AppContext, company: BatchCompany, timeout: float = 120.0 * 10) -> dict:
+    """Run one analysis end to end, accepting every proposal, and return its record."""
+    start = time.perf_counter()
+    run_metrics = start_run()
+    record = {
+        "company_name": company.company_name,
+        "status": "completed",
+        "company_details": None,
+        "gri_topics": None,
+        "topic_assesments": [],
+        "un_sdg_list": None,
+        # "none" when the company has no documents and was assessed from web search only.
+        "docs": None,
+        "error": None,
+    }
+    try:
+        # Batch calls queue behind interactive sessions for LLM and embedding capacity.
+        with batch_priority():
+            await asyncio.to_thread(stage_company_docs, company)
+            record["docs"] = "company_docs" if await asyncio.to_thread(has_company_docs, company.company_name) else "none"
+            workflow = ESGMaterialityAnalysisWorkflow(
+                llm=app_context.llm,
+                embed_model=app_context.embed_model,
+                gri_index=app_context.gri_index,
+                gri_catalog=app_context.gri_catalog,
+                timeout=timeout,
+            )
+            handler: WorkflowHandler = workflow.run(company_name=company.company_name)
+            async for event in handler.stream_events():
+                message = event_to_message(event)
+                if message is None:
+                    continue
+                if message["type"] == "company_details":
+                    record["company_details"] = message["payload"]
+                elif message["type"] == "gri_topics":
+                    record["gri_topics"] = message["payload"]
+                elif message["type"] == "topic_assesment":
+                    record["topic_assesments"].append(message["payload"])
+                elif message["type"] in INPUT_REQUIRED_TYPES:
+                    await apply_user_response(handler, message["type"], AUTO_ACCEPT)
+            record["un_sdg_list"] = await handler
+    except Exception as e:
+        logger.exception(f"Batch analysis failed for {company.company_name}")
+        record["status"] = "failed"
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start
+    run_metrics.finish()
+    record["timing"] = run_metrics.summary()
+    return record
+
+
+class ResultWriter:
+    """Appends one JSON line per company and optionally mirrors the file to Parquet."""
+
+    def __init__(self, path: str, parquet: bool = False) -> None:
+        self.path = path
+        self.parquet_path = os.path.splitext(path)[0] + ".parquet" if parquet else None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._since_parquet = 0
+
+    def read(self) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A line cut short by a crash; the company is simply run again.
+                    continue
+        return records
+
+    def completed_companies(self) -> Set[str]:
+        return {record["company_name"] for record in self.read() if record["status"] == "completed"}
+
+    def append(self, record: dict) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self._since_parquet += 1
+        if self.parquet_path and self._since_parquet >= PARQUET_EVERY:
+            self.write_parquet()
+
+    def write_parquet(self) -> None:
+        if not self.parquet_path:
+            return
+        import pandas as pd
+
+        # Keep the latest attempt per company, with nested fields as JSON strings.
+        latest: Dict[str, dict] = {record["company_name"]: record for record in self.read()}
+        frame = pd.DataFrame(
+            [
+                {key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in record.items()}
+                for record in latest.values()
+            ]
+        )
+        frame.to_parquet(self.parquet_path, index=False)
+        self._since_parquet = 0
+
+
+@dataclass
+class BatchRun:
+    batch_id: str
+    output_path: str
+    total: int = 0
+    skipped: int = 0
+    completed: int = 0
+    failed: int = 0
+    status: str = "running"
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def companies_per_hour(self) -> float:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        done = self.completed + self.failed
+        return done / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "batch_id": self.batch_id,
+            "output_path": self.output_path,
+            "status": self.status,
+            "total": self.total,
+            "skipped": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "companies_per_hour": round(self.companies_per_hour, 2),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+async def run_batch(
+    app_context: AppContext,
+    companies: List[BatchCompany],
+    output_path: str,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    parquet: bool = False,
+    batch: Optional[BatchRun] = None,
+) -> BatchRun:
+    writer = ResultWriter(output_path, parquet=parquet)
+    done = writer.completed_companies()
+    pending = [company for company in companies if company.company_name not in done]
+
+    batch = batch or BatchRun(batch_id=uuid.uuid4().hex, output_path=output_path)
+    batch.total = len(companies)
+    batch.skipped = len(companies) - len(pending)
+    print(f"\n> Batch {batch.batch_id}: {len(pending)} companies to analyze, {batch.skipped} already done\n")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(company: BatchCompany) -> None:
+        async with semaphore:
+            record = await analyze_company(app_context, company)
+        writer.append(record)
+        if record["status"] == "completed":
+            batch.completed += 1
+        else:
+            batch.failed += 1
+        print(
+            f"> [{batch.completed + batch.failed}/{len(pending)}] {company.company_name}: {record['status']} "
+            f"in {record['seconds']:.0f}s ({batch.companies_per_hour:.1f} companies/hour)"
+        )
+
+    try:
+        await asyncio.gather(*[run_one(company) for company in pending])
+        batch.status = "completed"
+    except asyncio.CancelledError:
+        batch.status = "interrupted"
+        raise
+    finally:
+        batch.finished_at = time.time()
+        writer.write_parquet()
+    return batch
+
+
+def start_batch(
+    app_context: AppContext,
+    companies: List[BatchCompany],
+    batch_id: Optional[str] = None,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    parquet: bool = False,
+) -> "tuple[BatchRun, asyncio.Task]":
+    """Start a batch in the background; reusing a batch_id resumes that batch's results file."""
+    batch_id = batch_id or uuid.uuid4().hex
+    if not isinstance(batch_id, str) or not BATCH_ID_RE.fullmatch(batch_id):
+        raise ValueError(f"Invalid batch id {batch_id!r}.")
+    if concurrency < 1:
+        raise ValueError(f"Batch concurrency must be at least 1, got {concurrency}.")
+    batch = BatchRun(batch_id=batch_id, output_path=os.path.join(DEFAULT_BATCH_DIR, f"{batch_id}.jsonl"))
+    task = asyncio.create_task(
+        run_batch(app_context, companies, batch.output_path, concurrency=concurrency, parquet=parquet, batch=batch)
+    )
+    return batch, task
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("companies", help="CSV, JSONL or text file listing the companies")
+    parser.add_argument("--output", default=os.path.join(DEFAULT_BATCH_DIR, "batch.jsonl"))
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY, help="Companies analyzed at the same time")
+    parser.add_argument("--parquet", action="store_true", help="Also write the results as Parquet")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    from app_context import close_app_context, create_app_context, warm_up
+
+    async def run() -> BatchRun:
+        app_context = await create_app_context()
+        await warm_up(app_context)
+        try:
+            return await run_batch(
+                app_context,
+                load_companies(args.companies),
+                args.output,
+                concurrency=args.concurrency,
+                parquet=args.parquet,
+            )
+        finally:
+            await close_app_context(app_context)
+
+    batch = asyncio.run(run())
+    print(json.dumps(batch.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Offline benchmark of the analysis workflows against fake models and a stub search.
+
+Runs GRIWorkflow, CompanyDocsWorkflow, CompanySearchWorkflow and the full
+ESGMaterialityAnalysisWorkflow (proposals auto-accepted) with FakeLLM,
+FakeEmbedding and a local TavilyStub from fakes.py. Nothing goes over the
+network, and every run makes the same calls with the same simulated latency.
+
+For each scenario it reports:
+- wall and CPU time
+- peak memory of the run (VmHWM, reset before each run, and its growth over
+  the RSS at the start; where /proc does not allow that,
+  `process_peak_rss_mb`, the peak of the whole process)
+- per-step latency and LLM, embedding and search call counts
+
+The report is JSON so reports of two versions can be diffed. Pass `--baseline`
+to print the differences to an earlier report.
+
+Usage:
+    python benchmark.py --output storage/benchmarks/report.json [--scenarios gri,esg] [--repeat 3] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from llama_index.core import Settings
+
+import company_index
+from app_context import AppContext
+from batch import BatchCompany, analyze_company
+from build_gri_index import DEFAULT_GRI_DATA_DIR, build_gri_index
+from fakes import FakeEmbedding, FakeLLM, TavilyStub, fake_text
+from gri_catalog import reporting_requirements_query
+from gri_index import load_gri_index
+from llm_scheduler import ScheduledEmbedding, ScheduledLLM, bind_schedulers, get_scheduler
+from metrics import start_run
+from tavily import close_tavily_client, get_tavily_client
+from workflows.company_docs_workflow import CompanyDocsWorkflow
+from workflows.company_search_workflow import CompanySearchWorkflow
+from workflows.gri_workflow import get_gri_workflow
+
+
+DEFAULT_WORK_DIR = "storage/benchmark"
+DEFAULT_OUTPUT = "storage/benchmarks/benchmark.json"
+SCENARIOS = ("gri", "company_docs", "company_search", "esg")
+COMPANY_NAME = "Benchmark Industries"
+GRI_TOPIC = "GRI 305 - Emissions"
+DOC_TOPICS = (["emissions", "climate", "energy"], ["safety", "injuries", "health"], ["diversity", "employees", "training"])
+
+
+def write_company_docs(company_name: str, num_docs: int, words_per_doc: int) -> None:
+    docs_dir = company_index.company_docs_dir(company_name)
+    shutil.rmtree(docs_dir, ignore_errors=True)
+    os.makedirs(docs_dir)
+    for i in range(num_docs):
+        text = fake_text(f"{company_name} report {i}", words_per_doc, topic_words=DOC_TOPICS[i % len(DOC_TOPICS)])
+        with open(os.path.join(docs_dir, f"report_{i}.txt"), "w") as f:
+            f.write(text)
+
+
+def reset_company_index() -> None:
+    """Drop built company indexes so every run parses and embeds the docs again."""
+    shutil.rmtree(company_index.COMPANY_INDEX_DIR, ignore_errors=True)
+    company_index._indexes.clear()
+
+
+async def bench_gri(app_context: AppContext) -> dict:
+    run_metrics = start_run()
+    workflow = get_gri_workflow(llm=app_context.llm, embed_model=app_context.embed_model, index=app_context.gri_index)
+    await workflow.run(query=reporting_requirements_query(GRI_TOPIC))
+    run_metrics.finish()
+    return run_metrics.summary()
+
+
+async def bench_company_docs(app_context: AppContext) -> dict:
+    run_metrics = start_run()
+    index = await company_index.get_company_index(COMPANY_NAME, app_context.embed_model)
+    workflow = CompanyDocsWorkflow(
+        index=index, llm=app_context.llm, embed_model=app_context.embed_model, timeout=120.0 * 4
+    )
+    await workflow.run(query=f"Prepare an assesment report in about 200 words on gri topic {GRI_TOPIC}")
+    run_metrics.finish()
+    return run_metrics.summary()
+
+
+async def bench_company_search(app_context: AppContext) -> dict:
+    run_metrics = start_run()
+    workflow = CompanySearchWorkflow(llm=app_context.llm, embed_model=app_context.embed_model, timeout=120.0 * 4)
+    await workflow.run(
+        query=f"Find out GICS Sector, GICS Industry Group, GICS Industry and high level description for company {COMPANY_NAME}"
+    )
+    run_metrics.finish()
+    return run_metrics.summary()
+
+
+async def bench_esg(app_context: AppContext) -> dict:
+    record = await analyze_company(app_context, BatchCompany(COMPANY_NAME))
+    if record["status"] != "completed":
+        raise RuntimeError(record["error"])
+    return record["timing"]
+
+
+BENCHMARKS: Dict[str, Callable[[AppContext], Awaitable[dict]]] = {
+    "gri": bench_gri,
+    "company_docs": bench_company_docs,
+    "company_search": bench_company_search,
+    "esg": bench_esg,
+}
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS (VmHWM) of this process; False where that is not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def rss_mb(field: str) -> float:
+    """VmRSS (current) or VmHWM (peak) of this process from /proc."""
+    with open("/proc/self/status") as f:
+        match = re.search(rf"^{field}:\s+(\d+) kB", f.read(), re.MULTILINE)
+    return int(match.group(1)) / 1024
+
+
+async def measure(benchmark: Callable[[AppContext], Awaitable[dict]], app_context: AppContext, trace_memory: bool) -> dict:
+    reset_company_index()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    peak_reset = reset_peak_rss()
+    start_rss = rss_mb("VmRSS") if peak_reset else None
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    summary = await benchmark(app_context)
+    result = {
+        "wall_seconds": time.perf_counter() - start,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "summary": summary,
+    }
+    if peak_reset:
+        result["peak_rss_mb"] = rss_mb("VmHWM")
+        result["peak_rss_delta_mb"] = result["peak_rss_mb"] - start_rss
+    else:
+        # ru_maxrss is in kilobytes on Linux, and covers everything the process ran before.
+        result["process_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if trace_memory:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    return result
+
+
+def aggregate(runs: List[dict]) -> dict:
+    """Median over repeated runs of the timings, counts and per-step numbers."""
+    def median(values):
+        return round(statistics.median(values), 4)
+
+    summaries = [run["summary"] for run in runs]
+    result = {
+        "runs": len(runs),
+        "wall_seconds": median([run["wall_seconds"] for run in runs]),
+        "wall_seconds_min": round(min(run["wall_seconds"] for run in runs), 4),
+        "cpu_seconds": median([run["cpu_seconds"] for run in runs]),
+    }
+    for key in ("peak_rss_mb", "peak_rss_delta_mb", "process_peak_rss_mb", "peak_traced_mb"):
+        if key in runs[0]:
+            result[key] = round(max(run[key] for run in runs), 1)
+    for key in ("llm_calls", "prompt_tokens", "completion_tokens", "embedding_requests", "embedded_texts", "search_calls"):
+        result[key] = median([summary[key] for summary in summaries])
+    step_names = sorted({name for summary in summaries for name in summary["steps"]})
+    result["steps"] = {
+        name: {
+            key: median([summary["steps"].get(name, {}).get(key, 0) for summary in summaries])
+            for key in ("calls", "seconds", "llm_calls", "embedding_requests", "search_calls")
+        }
+        for name in step_names
+    }
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Lines describing how `report` differs from `baseline`, scenario by scenario."""
+    def change(new: float, old: float) -> str:
+        if not old:
+            return f"{old} -> {new}"
+        return f"{old} -> {new} ({(new - old) / old:+.1%})"
+
+    lines = [f"Compared with {baseline.get('revision') or 'baseline'}:"]
+    for name, result in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None or "error" in result or "error" in old:
+            continue
+        lines.append(f"  {name}: wall {change(result['wall_seconds'], old['wall_seconds'])}s, cpu {change(result['cpu_seconds'], old['cpu_seconds'])}s")
+        for key in ("llm_calls", "embedding_requests", "search_calls"):
+            if result[key] != old[key]:
+                lines.append(f"    {key}: {change(result[key], old[key])}")
+        for step, values in result["steps"].items():
+            old_seconds = old["steps"].get(step, {}).get("seconds", 0)
+            if abs(values["seconds"] - old_seconds) > max(0.05, 0.1 * old_seconds):
+                lines.append(f"    {step}: {change(values['seconds'], old_seconds)}s")
+    return lines
+
+
+async def run_benchmarks(args: argparse.Namespace) -> dict:
+    stub = TavilyStub(latency=args.search_latency, num_results=args.search_results)
+    os.environ["TAVILY_BASE_URL"] = stub.start()
+    os.environ["TAVILY_API_KEY"] = "benchmark"
+    # Cached searches would make later runs faster than the first.
+    os.environ["SEARCH_CACHE_TTL"] = "0"
+
+    fake_llm = FakeLLM(
+        latency=args.llm_latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens
+    )
+    fake_embed_model = FakeEmbedding(latency=args.embed_latency)
+    llm = ScheduledLLM(fake_llm, get_scheduler(fake_llm.model_name, "LLM"))
+    embed_model = ScheduledEmbedding(fake_embed_model, get_scheduler(fake_embed_model.model_name, "EMBED"))
+    Settings.llm = llm
+    Settings.embed_model = embed_model
+    bind_schedulers()
+
+    print(f"\n> Building the GRI index from {args.gri_data_dir} with fake embeddings\n")
+    await asyncio.to_thread(build_gri_index, fake_embed_model, data_dir=args.gri_data_dir, persist_dir="storage/gri")
+    app_context = AppContext(
+        llm=llm,
+        embed_model=embed_model,
+        gri_index=load_gri_index("storage/gri"),
+        # Without the catalog every topic goes through the live GRI workflow.
+        gri_catalog=None,
+    )
+    write_company_docs(COMPANY_NAME, args.company_docs, args.words_per_doc)
+    get_tavily_client()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    scenarios = {}
+    try:
+        for name in args.scenarios:
+            runs = []
+            try:
+                for i in range(args.repeat):
+                    runs.append(await measure(BENCHMARKS[name], app_context, args.tracemalloc))
+                    print(f"> {name} run {i + 1}/{args.repeat}: {runs[-1]['wall_seconds']:.2f}s")
+                scenarios[name] = aggregate(runs)
+            except Exception as e:
+                print(f"> {name} failed: {e}")
+                scenarios[name] = {"error": f"{e.__class__.__name__}: {e}"}
+    finally:
+        await close_tavily_client()
+        stub.stop()
+
+    return {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline", "work_dir", "gri_data_dir")
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the report keeps medians")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", help="Earlier report to compare with")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="Scratch directory for indexes and company docs")
+    parser.add_argument("--gri-data-dir", default=DEFAULT_GRI_DATA_DIR)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=150, help="Length of free-text answers")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Seconds per embedding request")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Seconds per search")
+    parser.add_argument("--search-results", type=int, default=5)
+    parser.add_argument("--company-docs", type=int, default=3)
+    parser.add_argument("--words-per-doc", type=int, default=2000)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report peak Python heap; slows the runs down")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Paths given on the command line are relative to where the command runs.
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    args.gri_data_dir = os.path.abspath(args.gri_data_dir)
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.chdir(args.work_dir)
+
+    report = asyncio.run(run_benchmarks(args))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({name: result.get("wall_seconds", result.get("error")) for name, result in report["scenarios"].items()}, indent=2))
+    print(f"\n> Report written to {output}\n")
+
+    if baseline:
+        with open(baseline) as f:
+            print("\n".join(compare(report, json.load(f))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Build the GRI vector index from the standards in data/gri.
+
+PDFs are parsed in a process pool and their chunks and embeddings are kept in
+a build cache keyed by file content hash, so only new or changed PDFs are
+parsed and embedded again. The FAISS index is then rebuilt from the cached
+vectors with the requested index type.
+
+Usage:
+    python build_gri_index.py [--index-type flat|ivf|hnsw] [--workers N] [--full]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from embedding_cache import embed_model_id
+from gri_index import DEFAULT_GRI_PERSIST_DIR, FAISS_FILE, NODE_STORE_FILE, NodeStore
+from gri_standards import gri_metadata
+
+
+DEFAULT_GRI_DATA_DIR = "data/gri"
+BUILD_CACHE_FILE = "build_cache.sqlite"
+MANIFEST_FILE = "manifest.json"
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+
+def parse_file(path: str) -> List[Document]:
+    """Parse one PDF; runs inside the process pool."""
+    return SimpleDirectoryReader(input_files=[path]).load_data()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """Chunks and embeddings of every parsed PDF, keyed by file content hash."""
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                file_hash TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                PRIMARY KEY (file_hash, seq)
+            )"""
+        )
+
+    def get_meta(self, key: str) -> str:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM chunks")
+        self.conn.commit()
+
+    def cached_hashes(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT DISTINCT file_hash FROM chunks")}
+
+    def add(self, file_hash: str, nodes: List[BaseNode], embeddings: List[List[float]]) -> None:
+        self.conn.execute("DELETE FROM chunks WHERE file_hash = ?", (file_hash,))
+        self.conn.executemany(
+            "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+            (
+                (
+                    file_hash,
+                    seq,
+                    json.dumps(doc_to_json(node)),
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                )
+                for seq, (node, embedding) in enumerate(zip(nodes, embeddings))
+            ),
+        )
+        self.conn.commit()
+
+    def remove_except(self, keep_hashes: set) -> None:
+        for file_hash in self.cached_hashes() - keep_hashes:
+            self.conn.execute("DELETE FROM chunks WHERE file_hash = ?", (file_hash,))
+        self.conn.commit()
+
+    def load(self, file_hashes: List[str]):
+        nodes, vectors = [], []
+        for file_hash in file_hashes:
+            for data, embedding in self.conn.execute(
+                "SELECT data, embedding FROM chunks WHERE file_hash = ? ORDER BY seq",
+                (file_hash,),
+            ):
+                nodes.append(json_to_doc(json.loads(data)))
+                vectors.append(np.frombuffer(embedding, dtype=np.float32))
+        return nodes, np.vstack(vectors) if vectors else np.zeros((0, 0), np.float32)
+
+
+def annotate_nodes(nodes: List[BaseNode]) -> None:
+    """Attach the standard's code, title, year and kind parsed from the file name.
+
+    The fields are kept out of the embedded and LLM text, so cached embeddings
+    stay valid and prompts do not grow.
+    """
+    for node in nodes:
+        metadata = gri_metadata(node.metadata.get("file_name", ""))
+        node.metadata.update(metadata)
+        for key in metadata:
+            if key not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(key)
+            if key not in node.excluded_llm_metadata_keys:
+                node.excluded_llm_metadata_keys.append(key)
+
+
+def create_faiss_index(vectors: np.ndarray, index_type: str) -> faiss.Index:
+    num_vectors, dimension = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "ivf":
+        nlist = max(1, int(np.sqrt(num_vectors)))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, nlist)
+        index.train(vectors)
+        index.nprobe = max(1, nlist // 8)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+    else:
+        raise ValueError(f"Unknown index type {index_type}, expected one of {INDEX_TYPES}.")
+    index.add(vectors)
+    return index
+
+
+def evaluate_index(
+    index_type: str, vectors: np.ndarray, top_k: int = 5, num_queries: int = 200
+) -> Dict[str, float]:
+    """Compare recall@k and per-query latency of `index_type` against an exact flat index.
+
+    The queries are chunks held out of both indexes, so they are not already
+    in the index and, for IVF, played no part in training it.
+    """
+    rng = np.random.default_rng(0)
+    num_queries = min(num_queries, len(vectors) // 5)
+    if num_queries == 0:
+        return {}
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rng.choice(len(vectors), num_queries, replace=False)] = True
+    queries, indexed = vectors[held_out], vectors[~held_out]
+    top_k = min(top_k, len(indexed))
+
+    index = create_faiss_index(indexed, index_type)
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(indexed)
+
+    def timed_search(search_index: faiss.Index):
+        start = time.perf_counter()
+        ids = [search_index.search(query[np.newaxis, :], top_k)[1][0] for query in queries]
+        return ids, (time.perf_counter() - start) / len(queries) * 1000
+
+    exact, flat_ms = timed_search(baseline)
+    approximate, index_ms = timed_search(index)
+
+    recall = np.mean(
+        [len(set(a) & set(b)) / top_k for a, b in zip(exact, approximate)]
+    )
+    return {
+        "eval_queries": num_queries,
+        f"recall@{top_k}": float(recall),
+        "flat_latency_ms": flat_ms,
+        "index_latency_ms": index_ms,
+    }
+
+
+def build_gri_index(
+    embed_model: BaseEmbedding,
+    data_dir: str = DEFAULT_GRI_DATA_DIR,
+    persist_dir: str = DEFAULT_GRI_PERSIST_DIR,
+    index_type: str = "flat",
+    workers: int = None,
+    full: bool = False,
+) -> dict:
+    start = time.perf_counter()
+    os.makedirs(persist_dir, exist_ok=True)
+    cache = BuildCache(os.path.join(persist_dir, BUILD_CACHE_FILE))
+    if full or cache.get_meta("embed_model") != embed_model_id(embed_model):
+        cache.clear()
+        cache.set_meta("embed_model", embed_model_id(embed_model))
+
+    files = {
+        name: file_sha256(os.path.join(data_dir, name))
+        for name in sorted(os.listdir(data_dir))
+        if name.lower().endswith(".pdf")
+    }
+    cached = cache.cached_hashes()
+    to_parse = [name for name, file_hash in files.items() if file_hash not in cached]
+    cache.remove_except(set(files.values()))
+    print(f"\n> {len(files) - len(to_parse)} GRI PDFs unchanged, {len(to_parse)} to parse\n")
+
+    if to_parse:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = pool.map(parse_file, [os.path.join(data_dir, name) for name in to_parse])
+            for name, documents in zip(to_parse, parsed):
+                nodes = run_transformations(documents, Settings.transformations)
+                embeddings = embed_model.get_text_embedding_batch(
+                    [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+                )
+                cache.add(files[name], nodes, embeddings)
+                print(f"> Indexed {name}: {len(nodes)} chunks")
+
+    nodes, vectors = cache.load(list(files.values()))
+    if not nodes:
+        raise ValueError(f"No GRI content found in {data_dir}.")
+    annotate_nodes(nodes)
+
+    faiss_index = create_faiss_index(vectors, index_type)
+    faiss.write_index(faiss_index, os.path.join(persist_dir, FAISS_FILE))
+    NodeStore.create(
+        os.path.join(persist_dir, NODE_STORE_FILE), dict(enumerate(nodes))
+    )
+    manifest = {
+        "embed_model": embed_model_id(embed_model),
+        "dimension": int(vectors.shape[1]),
+        "index_type": index_type,
+        "num_nodes": len(nodes),
+        "files": files,
+    }
+    with open(os.path.join(persist_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    report = {
+        "index_type": index_type,
+        "num_files": len(files),
+        "parsed_files": len(to_parse),
+        "num_nodes": len(nodes),
+        "dimension": int(vectors.shape[1]),
+        "build_seconds": time.perf_counter() - start,
+    }
+    report.update(evaluate_index(index_type, vectors))
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes")
+    parser.add_argument("--data-dir", default=DEFAULT_GRI_DATA_DIR)
+    parser.add_argument("--persist-dir", default=DEFAULT_GRI_PERSIST_DIR)
+    parser.add_argument("--full", action="store_true", help="Ignore the build cache")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from app_context import create_embed_model
+
+    load_dotenv()
+    report = build_gri_index(
+        create_embed_model(),
+        data_dir=args.data_dir,
+        persist_dir=args.persist_dir,
+        index_type=args.index_type,
+        workers=args.workers,
+        full=args.full,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
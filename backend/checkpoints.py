@@ -0,0 +1,123 @@
+"""Checkpoints of ESGMaterialityAnalysisWorkflow runs.
+
+A checkpoint records the outputs of every finished step of a run: company
+details, GRI topics, reporting requirements and topic assessments, plus the
+stage the run reached. Steps write to it as they finish, so a run that was
+paused for user input or cut off by a restart can resume without repeating
+the LLM and search calls behind those outputs.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+
+DEFAULT_CHECKPOINT_DIR = "storage/checkpoints"
+# Checkpoints of sessions nobody resumed are swept after this many seconds.
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL") or 7 * 24 * 3600)
+# Run ids are uuid4 hex; anything else from a client is not a checkpoint name.
+RUN_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Stages in the order a run passes through them.
+STARTED = "started"
+AWAITING_COMPANY_DETAILS = "awaiting_company_details"
+AWAITING_GRI_TOPICS = "awaiting_gri_topics"
+ASSESSING = "assessing"
+COMPLETED = "completed"
+
+
+class RunCheckpoint:
+    """Step outputs of one run, rewritten to disk after every update."""
+
+    def __init__(self, path: str, state: Dict[str, Any]) -> None:
+        self.path = path
+        self.state = state
+
+    @property
+    def run_id(self) -> str:
+        return self.state["run_id"]
+
+    @property
+    def stage(self) -> str:
+        return self.state["stage"]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.state.get(key, default)
+
+    def update(self, stage: Optional[str] = None, **values: Any) -> None:
+        if stage is not None:
+            self.state["stage"] = stage
+        self.state.update(values)
+        self.state["updated_at"] = time.time()
+        self.save()
+
+    def set_topic_value(self, key: str, gri_topic: str, value: Any) -> None:
+        """Record a per-topic output such as the reporting requirements of one topic."""
+        self.state.setdefault(key, {})[gri_topic] = value
+        self.update()
+
+    def save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+class CheckpointStore:
+    """One JSON checkpoint file per run under `checkpoint_dir`."""
+
+    def __init__(self, checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR) -> None:
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _path(self, run_id: str) -> str:
+        if not is_run_id(run_id):
+            raise ValueError(f"Invalid run id {run_id!r}.")
+        return os.path.join(self.checkpoint_dir, f"{run_id}.json")
+
+    def create(self, company_name: str, run_id: Optional[str] = None) -> RunCheckpoint:
+        run_id = run_id or uuid.uuid4().hex
+        now = time.time()
+        checkpoint = RunCheckpoint(
+            self._path(run_id),
+            {
+                "run_id": run_id,
+                "company_name": company_name,
+                "stage": STARTED,
+                "created_at": now,
+                "updated_at": now,
+            },
+        )
+        checkpoint.save()
+        return checkpoint
+
+    def load(self, run_id: str) -> Optional[RunCheckpoint]:
+        if not is_run_id(run_id):
+            return None
+        path = self._path(run_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return RunCheckpoint(path, json.load(f))
+
+    def delete(self, run_id: str) -> None:
+        path = self._path(run_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def sweep(self, ttl: float = CHECKPOINT_TTL) -> int:
+        """Delete checkpoints not updated for `ttl` seconds, e.g. of sessions that errored or disconnected."""
+        cutoff = time.time() - ttl
+        removed = 0
+        for name in os.listdir(self.checkpoint_dir):
+            path = os.path.join(self.checkpoint_dir, name)
+            if name.endswith((".json", ".json.tmp")) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+def is_run_id(run_id: Any) -> bool:
+    return isinstance(run_id, str) and RUN_ID_RE.fullmatch(run_id) is not None
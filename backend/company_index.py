@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import os
+from logging import getLogger
+from typing import Dict, List, Optional
+
+import faiss
+from llama_index.core import (
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+from embedding_cache import embed_model_id
+from parse_cache import load_documents
+
+
+logger = getLogger(__name__)
+
+COMPANY_DOCS_DIR = "data/company_docs"
+COMPANY_INDEX_DIR = "storage/company_docs"
+MANIFEST_FILE = "manifest.json"
+
+_indexes: Dict[str, VectorStoreIndex] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+
+
+def company_docs_dir(company_name: str) -> str:
+    """The company's documents folder; raises ValueError for names that are not a single path segment."""
+    if not company_name.strip() or company_name in (".", "..") or "/" in company_name or "\\" in company_name:
+        raise ValueError(f"Invalid company name {company_name!r}.")
+    return os.path.join(COMPANY_DOCS_DIR, company_name)
+
+
+def company_index_dir(company_name: str) -> str:
+    company_docs_dir(company_name)
+    return os.path.join(COMPANY_INDEX_DIR, company_name)
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_company_files(docs_dir: str) -> List[str]:
+    # Mirrors SimpleDirectoryReader defaults: top level only, hidden files skipped.
+    return sorted(
+        name
+        for name in os.listdir(docs_dir)
+        if not name.startswith(".") and os.path.isfile(os.path.join(docs_dir, name))
+    )
+
+
+def _load_manifest(persist_dir: str) -> dict:
+    manifest_path = os.path.join(persist_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"embed_model": None, "files": {}, "docs": {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _save_manifest(persist_dir: str, manifest: dict) -> None:
+    manifest_path = os.path.join(persist_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _scan_files(docs_dir: str, previous: dict) -> dict:
+    """Return {file name: {sha256, size, mtime}}, only re-hashing changed files."""
+    files = {}
+    for name in _list_company_files(docs_dir):
+        path = os.path.join(docs_dir, name)
+        stat = os.stat(path)
+        known = previous.get(name)
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            files[name] = known
+        else:
+            files[name] = {
+                "sha256": file_sha256(path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+    return files
+
+
+def has_company_docs(company_name: str) -> bool:
+    """Whether the company has any documents to index; a name that cannot be a folder has none."""
+    try:
+        docs_dir = company_docs_dir(company_name)
+    except ValueError:
+        return False
+    return os.path.isdir(docs_dir) and bool(_list_company_files(docs_dir))
+
+
+def company_file_hashes(company_name: str) -> Dict[str, str]:
+    """{sha256: file name} of a company's documents, reusing the manifest's hashes of unchanged files."""
+    docs_dir = company_docs_dir(company_name)
+    if not os.path.isdir(docs_dir):
+        return {}
+    manifest = _load_manifest(company_index_dir(company_name))
+    return {meta["sha256"]: name for name, meta in _scan_files(docs_dir, manifest["files"]).items()}
+
+
+def _load_persisted_index(persist_dir: str, embed_model: BaseEmbedding) -> VectorStoreIndex:
+    vector_store = FaissVectorStore.from_persist_dir(persist_dir)
+    storage_context = StorageContext.from_defaults(
+        vector_store=vector_store, persist_dir=persist_dir
+    )
+    return load_index_from_storage(storage_context=storage_context, embed_model=embed_model)
+
+
+def _new_index(
+    nodes: List[BaseNode], dimension: int, embed_model: BaseEmbedding
+) -> VectorStoreIndex:
+    vector_store = FaissVectorStore(faiss_index=faiss.IndexFlatL2(dimension))
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    return VectorStoreIndex(
+        nodes=nodes, storage_context=storage_context, embed_model=embed_model
+    )
+
+
+def _chunk_and_embed(documents: List[Document], embed_model: BaseEmbedding) -> List[BaseNode]:
+    nodes = run_transformations(documents, Settings.transformations)
+    embeddings = embed_model.get_text_embedding_batch(
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    )
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    return nodes
+
+
+def _rebuild(
+    index: VectorStoreIndex, keep_node_ids: List[str], new_nodes: List[BaseNode], embed_model: BaseEmbedding
+) -> Optional[VectorStoreIndex]:
+    """A new index of the kept nodes of `index` plus `new_nodes`; `index` is left untouched.
+
+    FaissVectorStore does not support deletes, but the flat index keeps every
+    vector, so surviving nodes are re-added without calling the embedding model.
+    Building a new object instead of inserting into the cached one keeps
+    sessions that are querying it unaffected until the cache entry is swapped.
+    """
+    faiss_index = index.vector_store.client
+    positions = {
+        node_id: int(position)
+        for position, node_id in index.index_struct.nodes_dict.items()
+    }
+    vectors = faiss_index.reconstruct_n(0, faiss_index.ntotal)
+    nodes = index.docstore.get_nodes(keep_node_ids)
+    for node in nodes:
+        node.embedding = vectors[positions[node.node_id]].tolist()
+    nodes.extend(new_nodes)
+    if not nodes:
+        return None
+    return _new_index(nodes, faiss_index.d, embed_model)
+
+
+def sync_company_index(company_name: str, embed_model: BaseEmbedding) -> VectorStoreIndex:
+    """Build or incrementally update the persisted index for a company's documents.
+
+    Files are tracked by content hash in a manifest next to the FAISS index, so
+    unchanged files are never parsed or embedded again. Added files are parsed,
+    embedded and appended; removed files are dropped from the index.
+    """
+    docs_dir = company_docs_dir(company_name)
+    persist_dir = company_index_dir(company_name)
+    if not os.path.isdir(docs_dir):
+        raise ValueError(f"Directory {docs_dir} does not exist.")
+
+    manifest = _load_manifest(persist_dir)
+    files = _scan_files(docs_dir, manifest["files"])
+    if not files:
+        raise ValueError(f"No files found in {docs_dir}.")
+
+    index = _indexes.get(company_name)
+    if manifest["embed_model"] != embed_model_id(embed_model):
+        # Vectors from a different model are not comparable, start over.
+        manifest = {"embed_model": embed_model_id(embed_model), "files": {}, "docs": {}}
+        index = None
+    elif index is None and manifest["docs"]:
+        index = _load_persisted_index(persist_dir, embed_model)
+
+    current_hashes = {meta["sha256"] for meta in files.values()}
+    removed = [h for h in manifest["docs"] if h not in current_hashes]
+    added: Dict[str, str] = {}
+    for name, meta in files.items():
+        if meta["sha256"] not in manifest["docs"] and meta["sha256"] not in added:
+            added[meta["sha256"]] = name
+
+    if not removed and not added and index is not None:
+        manifest["files"] = files
+        _save_manifest(persist_dir, manifest)
+        _indexes[company_name] = index
+        return index
+
+    if removed:
+        print(f"\n> Removing {len(removed)} files from {company_name} index\n")
+        for doc_hash in removed:
+            del manifest["docs"][doc_hash]
+
+    new_nodes: List[BaseNode] = []
+    if added:
+        print(f"\n> Indexing {len(added)} new files for {company_name}\n")
+        # Parsed text comes from the parse cache; uncached files are extracted in parallel.
+        documents = load_documents({doc_hash: os.path.join(docs_dir, name) for doc_hash, name in added.items()})
+        for doc_hash, name in added.items():
+            nodes = _chunk_and_embed(documents[doc_hash], embed_model)
+            manifest["docs"][doc_hash] = [node.node_id for node in nodes]
+            new_nodes.extend(nodes)
+
+    # The cached index may be in use by other sessions, so changes go into a new one.
+    if index is not None:
+        keep_node_ids = [
+            node_id
+            for doc_hash, node_ids in manifest["docs"].items()
+            if doc_hash not in added
+            for node_id in node_ids
+        ]
+        index = _rebuild(index, keep_node_ids, new_nodes, embed_model)
+    elif new_nodes:
+        index = _new_index(new_nodes, len(new_nodes[0].embedding), embed_model)
+
+    if index is None:
+        raise ValueError(f"No indexable content found in {docs_dir}.")
+
+    os.makedirs(persist_dir, exist_ok=True)
+    index.storage_context.persist(persist_dir=persist_dir)
+    manifest["files"] = files
+    _save_manifest(persist_dir, manifest)
+    # Swapped in whole; callers holding the previous index keep a consistent one.
+    _indexes[company_name] = index
+    return index
+
+
+async def get_company_index(company_name: str, embed_model: BaseEmbedding) -> VectorStoreIndex:
+    """Return the up-to-date index for a company, shared by all concurrent callers."""
+    lock = _locks.setdefault(company_name, asyncio.Lock())
+    async with lock:
+        return await asyncio.to_thread(sync_company_index, company_name, embed_model)
@@ -1,35 +1,126 @@
-from typing import List
+import asyncio
+from typing import List, Set
 
-from llama_index.core.schema import Document
+import numpy as np
+from llama_index.core.schema import Document, MetadataMode, NodeWithScore, TextNode
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.text_splitter import SentenceSplitter
-from llama_index.core import VectorStoreIndex
-from llama_index.core.postprocessor import SimilarityPostprocessor
 
 
-async def get_compressed_context(
-    query: str, docs: List[Document], embed_model: BaseEmbedding
-) -> str:
-    index = VectorStoreIndex.from_documents(
-        docs,
-        embed_model=embed_model,
-        transformations=[SentenceSplitter()],
-    )
+DEFAULT_TOP_K = 5
+DEFAULT_SIMILARITY_CUTOFF = 0.8
+# A sub-query is answered from the document pool when it has this many matching chunks.
+DEFAULT_POOL_MIN_HITS = 3
 
-    retriever = index.as_retriever(similarity_top_k=5)
 
-    nodes = retriever.retrieve(query)
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
 
-    processor = SimilarityPostprocessor(similarity_cutoff=0.8)
-    filtered_nodes = processor.postprocess_nodes(nodes)
-    # print(filtered_nodes)
-    print(
-        f"\n> Filtered {len(filtered_nodes)} nodes from {len(nodes)} nodes for subquery: {query}\n"
-    )
 
+class CompressionEngine:
+    """In-memory top-k retrieval over chunks of scraped documents.
+
+    Documents are split and embedded in one batch as they are added, and the
+    normalized chunk embeddings are kept in a single matrix. Queries are then
+    answered together with one matrix product, so every sub-query of a search
+    run shares the same chunks and embeddings.
+    """
+
+    def __init__(self, embed_model: BaseEmbedding, text_splitter: SentenceSplitter = None) -> None:
+        self.embed_model = embed_model
+        self.text_splitter = text_splitter or SentenceSplitter()
+        self.chunks: List[TextNode] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    async def add_documents(self, docs: List[Document]) -> None:
+        chunks = self.text_splitter.get_nodes_from_documents(docs)
+        if not chunks:
+            return
+        embeddings = await self.embed_model.aget_text_embedding_batch(
+            [chunk.get_content(metadata_mode=MetadataMode.EMBED) for chunk in chunks]
+        )
+        matrix = _normalize(np.asarray(embeddings, dtype=np.float32))
+        self._matrix = matrix if not self.chunks else np.vstack([self._matrix, matrix])
+        self.chunks.extend(chunks)
+
+    async def retrieve(
+        self,
+        queries: List[str],
+        top_k: int = DEFAULT_TOP_K,
+        similarity_cutoff: float = DEFAULT_SIMILARITY_CUTOFF,
+    ) -> List[List[NodeWithScore]]:
+        """Return the chunks scoring at least `similarity_cutoff` among the top k, per query."""
+        if not self.chunks or not queries:
+            return [[] for _ in queries]
+
+        query_embeddings = await asyncio.gather(
+            *[self.embed_model.aget_query_embedding(query) for query in queries]
+        )
+        query_matrix = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        scores = query_matrix @ self._matrix.T
+
+        k = min(top_k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        return [
+            [
+                NodeWithScore(node=self.chunks[idx], score=float(score))
+                for idx, score in zip(row, row_scores)
+                if score >= similarity_cutoff
+            ]
+            for row, row_scores in zip(top, top_scores)
+        ]
+
+
+class DocumentPool(CompressionEngine):
+    """Scraped pages of one analysis run, shared by all of its search workflows.
+
+    Pages are added once per URL, so their chunks and embeddings are computed
+    once however many sub-queries, revisions or topics scrape them again.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        text_splitter: SentenceSplitter = None,
+        min_hits: int = DEFAULT_POOL_MIN_HITS,
+    ) -> None:
+        super().__init__(embed_model, text_splitter)
+        self.min_hits = min_hits
+        self.urls: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def add_documents(self, docs: List[Document]) -> None:
+        async with self._lock:
+            new_docs = []
+            for doc in docs:
+                url = doc.metadata.get("source")
+                if url in self.urls:
+                    continue
+                if url:
+                    self.urls.add(url)
+                new_docs.append(doc)
+            await super().add_documents(new_docs)
+
+    async def covers(self, query: str, similarity_cutoff: float = DEFAULT_SIMILARITY_CUTOFF) -> bool:
+        """Whether the pool already holds enough matching chunks to answer `query`."""
+        (nodes,) = await self.retrieve([query], top_k=self.min_hits, similarity_cutoff=similarity_cutoff)
+        return len(nodes) >= self.min_hits
+
+
+def format_context(nodes: List[NodeWithScore]) -> str:
     context = ""
 
-    for node_with_score in filtered_nodes:
+    for node_with_score in nodes:
         node = node_with_score.node
         node_info = (
             f"---\nSource: {node.metadata.get('source', 'Unknown')}\n"
@@ -39,3 +130,15 @@ async def get_compressed_context(
         context += node_info + "\n"
 
     return context
+
+
+async def get_compressed_context(
+    query: str, docs: List[Document], embed_model: BaseEmbedding
+) -> str:
+    engine = CompressionEngine(embed_model)
+    await engine.add_documents(docs)
+    (filtered_nodes,) = await engine.retrieve([query])
+    print(
+        f"\n> Filtered {len(filtered_nodes)} nodes from {len(engine)} chunks for subquery: {query}\n"
+    )
+    return format_context(filtered_nodes)
@@ -0,0 +1,237 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.base.embeddings.base import Embedding
+
+from metrics import record_cache_lookups
+
+
+DEFAULT_EMBEDDING_CACHE_DIR = "storage/embeddings"
+
+KEY_SIZE = 32  # sha256 digest
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.bin"
+META_FILE = "meta.json"
+
+
+def embed_model_id(embed_model: BaseEmbedding) -> str:
+    """The model an embedding model calls; NVIDIAEmbedding sets `model` and leaves `model_name` 'unknown'."""
+    return getattr(embed_model, "model", None) or embed_model.model_name
+
+
+class EmbeddingStore:
+    """Append-only on-disk store of float32 vectors addressed by 32-byte keys.
+
+    Vectors live in one flat float32 file that is memory-mapped for reads, and
+    `keys.bin` holds the digest of each row in the same order. Appends take an
+    exclusive file lock, so several processes can share one store directory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _refresh(self) -> None:
+        """Pick up rows appended since the last refresh, possibly by another process."""
+        if self.dim is None:
+            return
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        keys_path = os.path.join(self.path, KEYS_FILE)
+        if not (os.path.exists(keys_path) and os.path.exists(vectors_path)):
+            return
+        # A crash between the two appends can leave extra vectors; keys are the source of truth.
+        num_rows = min(
+            os.path.getsize(keys_path) // KEY_SIZE,
+            os.path.getsize(vectors_path) // (4 * self.dim),
+        )
+        if num_rows == len(self._rows) and self._vectors is not None:
+            return
+        with open(keys_path, "rb") as f:
+            f.seek(len(self._rows) * KEY_SIZE)
+            data = f.read((num_rows - len(self._rows)) * KEY_SIZE)
+        for offset in range(0, len(data), KEY_SIZE):
+            self._rows.setdefault(data[offset : offset + KEY_SIZE], len(self._rows))
+        self._vectors = (
+            np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(num_rows, self.dim))
+            if num_rows
+            else None
+        )
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            self._refresh()
+            return [
+                np.array(self._vectors[self._rows[key]]) if key in self._rows else None
+                for key in keys
+            ]
+
+    def add_many(self, keys: Sequence[bytes], vectors: Sequence[Embedding]) -> None:
+        if not keys:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = array.shape[1]
+                with open(os.path.join(self.path, META_FILE), "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if array.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {array.shape[1]} does not match cache dimension {self.dim}."
+                )
+            with open(os.path.join(self.path, KEYS_FILE), "ab") as keys_file:
+                fcntl.flock(keys_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    new = [
+                        i for i, key in enumerate(keys) if key not in self._rows
+                    ]
+                    if new:
+                        with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+                            f.write(array[new].tobytes())
+                        keys_file.write(b"".join(keys[i] for i in new))
+                        keys_file.flush()
+                    self._refresh()
+                finally:
+                    fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(path: str) -> EmbeddingStore:
+    """Return the process-wide store for `path`, opening it on first use."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path)
+        return _stores[path]
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that caches vectors by a hash of model name and text.
+
+    Batches are looked up in the cache first and only the misses are sent to
+    the wrapped model. Query and passage embeddings are keyed separately since
+    models such as NV-Embed-QA embed them differently.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_dir: str = DEFAULT_EMBEDDING_CACHE_DIR,
+        embed_batch_size: int = 512,
+        **kwargs,
+    ) -> None:
+        super().__init__(
+            model_name=embed_model_id(embed_model),
+            embed_batch_size=embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        safe_name = re.sub(r"[^\w.-]", "_", embed_model_id(embed_model))
+        self._store = get_embedding_store(os.path.join(cache_dir, safe_name))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._store),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+    def _key(self, kind: str, text: str) -> bytes:
+        return hashlib.sha256(
+            f"{self.model_name}\x00{kind}\x00{text}".encode("utf-8")
+        ).digest()
+
+    def _lookup(
+        self, kind: str, texts: List[str]
+    ) -> Tuple[List[bytes], List[Optional[np.ndarray]], List[str]]:
+        keys = [self._key(kind, text) for text in texts]
+        cached = self._store.get_many(keys)
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, cached):
+            if vector is None:
+                missing.setdefault(key, text)
+        self._hits += len(texts) - len(missing)
+        self._misses += len(missing)
+        record_cache_lookups("embedding", len(texts) - len(missing), len(missing))
+        return keys, cached, list(missing.values())
+
+    def _merge(
+        self,
+        kind: str,
+        keys: List[bytes],
+        cached: List[Optional[np.ndarray]],
+        missing_texts: List[str],
+        fetched: List[Embedding],
+    ) -> List[Embedding]:
+        fetched_keys = [self._key(kind, text) for text in missing_texts]
+        self._store.add_many(fetched_keys, fetched)
+        fetched_by_key = dict(zip(fetched_keys, fetched))
+        return [
+            vector.tolist() if vector is not None else list(fetched_by_key[key])
+            for key, vector in zip(keys, cached)
+        ]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._lookup("query", [query])
+        fetched = [self._embed_model.get_query_embedding(query)] if missing else []
+        return self._merge("query", keys, cached, missing, fetched)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        keys, cached, missing = self._lookup("query", [query])
+        fetched = [await self._embed_model.aget_query_embedding(query)] if missing else []
+        return self._merge("query", keys, cached, missing, fetched)[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, cached, missing = self._lookup("text", texts)
+        fetched = self._embed_model.get_text_embedding_batch(missing) if missing else []
+        return self._merge("text", keys, cached, missing, fetched)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys, cached, missing = self._lookup("text", texts)
+        fetched = (
+            await self._embed_model.aget_text_embedding_batch(missing) if missing else []
+        )
+        return self._merge("text", keys, cached, missing, fetched)
@@ -0,0 +1,121 @@
+"""Compare ranking quality and latency of the GRI rerank modes.
+
+For every GRI standard in data/gri the reporting-requirements query is run
+against the GRI index, and a retrieved node counts as relevant when it is
+requirement text of that standard: from its PDF and stating a "shall"
+requirement, not guidance or background. HybridRerank is evaluated without its
+code match bonus, which rewards the source PDF and would score itself; in
+production the code pre-filter makes that bonus a no-op anyway. Each mode
+reranks the same candidates and is scored on precision@n, MRR and latency per
+node.
+
+Usage:
+    python eval_rerank.py [--top-k 10] [--top-n 3] [--rankgpt]
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from typing import Dict, List
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from gri_catalog import DEFAULT_GRI_DATA_DIR, reporting_requirements_query
+from gri_index import load_gri_index
+from gri_standards import list_gri_standards, parse_gri_file_name
+from rerank import HybridRerank
+
+
+# GRI states requirements with "shall"; guidance uses "should" and "can".
+REQUIREMENT_RE = re.compile(r"\bshall\b", re.IGNORECASE)
+
+
+def _is_relevant(node: NodeWithScore, code: str) -> bool:
+    standard = parse_gri_file_name(node.node.metadata.get("file_name", ""))
+    if standard is None or standard.code != code:
+        return False
+    return REQUIREMENT_RE.search(node.node.get_content(metadata_mode=MetadataMode.NONE)) is not None
+
+
+class RetrievalOrder(BaseNodePostprocessor):
+    """Baseline that keeps the vector search order."""
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        return nodes
+
+
+def evaluate_reranker(
+    reranker: BaseNodePostprocessor,
+    cases: List[dict],
+    top_n: int,
+) -> Dict[str, float]:
+    precisions, reciprocal_ranks = [], []
+    elapsed, num_nodes = 0.0, 0
+    for case in cases:
+        start = time.perf_counter()
+        ranked = reranker.postprocess_nodes(case["nodes"], query_str=case["query"])
+        elapsed += time.perf_counter() - start
+        num_nodes += len(case["nodes"])
+
+        relevant = [_is_relevant(node, case["code"]) for node in ranked[:top_n]]
+        precisions.append(sum(relevant) / top_n)
+        reciprocal_ranks.append(
+            next((1 / (rank + 1) for rank, hit in enumerate(relevant) if hit), 0.0)
+        )
+    return {
+        f"precision@{top_n}": sum(precisions) / len(cases),
+        "mrr": sum(reciprocal_ranks) / len(cases),
+        "ms_per_node": elapsed / num_nodes * 1000,
+        "ms_per_query": elapsed / len(cases) * 1000,
+    }
+
+
+async def build_cases(embed_model, data_dir: str, top_k: int) -> List[dict]:
+    index = load_gri_index()
+    # Without the code pre-filter every candidate would be relevant.
+    retriever = index.as_retriever(
+        similarity_top_k=top_k, embed_model=embed_model, filter_by_code=False
+    )
+    standards = {standard.code: standard for standard in list_gri_standards(data_dir)}
+    cases = []
+    for code, standard in standards.items():
+        query = reporting_requirements_query(f"{code} - {standard.title}")
+        nodes = await retriever.aretrieve(query)
+        cases.append({"code": code, "query": query, "nodes": nodes})
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top-k", type=int, default=10, help="Candidates retrieved per query")
+    parser.add_argument("--top-n", type=int, default=3, help="Nodes kept after reranking")
+    parser.add_argument("--data-dir", default=DEFAULT_GRI_DATA_DIR)
+    parser.add_argument("--rankgpt", action="store_true", help="Also evaluate RankGPT (calls the LLM)")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from app_context import create_embed_model, create_llm
+
+    load_dotenv()
+    cases = asyncio.run(build_cases(create_embed_model(), args.data_dir, args.top_k))
+
+    rerankers = {
+        "retrieval": RetrievalOrder(),
+        "hybrid": HybridRerank(top_n=args.top_n, code_match_bonus=0.0),
+    }
+    if args.rankgpt:
+        from llama_index.postprocessor.rankgpt_rerank import RankGPTRerank
+
+        rerankers["rankgpt"] = RankGPTRerank(top_n=args.top_n, llm=create_llm())
+
+    report = {
+        name: evaluate_reranker(reranker, cases, args.top_n)
+        for name, reranker in rerankers.items()
+    }
+    print(json.dumps({"num_queries": len(cases), "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Deterministic local stand-ins for the LLM, embedding model and Tavily search.
+
+FakeLLM and FakeEmbedding implement the llama-index LLM and BaseEmbedding
+interfaces. They return canned outputs shaped like the real ones: sub-queries,
+company-details JSON, GRI topic lists and UN SDG lists parse as the workflows
+expect. Their latency and token counts are configurable. TavilyStub serves a
+local `/search` endpoint that returns generated pages, so TavilyClient can be
+pointed at it through TAVILY_BASE_URL.
+
+The same input always gives the same output, so runs against the fakes are
+reproducible without NIM or Tavily credits. Used by benchmark.py and the load
+generator. The stub can also run on its own:
+
+    python fakes.py --port 8765 --latency 0.2
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from fastapi import Body, FastAPI
+from llama_index.core.base.embeddings.base import Embedding
+from llama_index.core.base.llms.types import (
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms.custom import CustomLLM
+
+
+VOCABULARY = (
+    "emissions energy water waste biodiversity supplier employees safety training diversity governance "
+    "board policy risk climate target scope disclosure reporting materiality community customers privacy "
+    "ethics compliance tax procurement human rights health incidents injuries recycling renewable "
+    "efficiency intensity baseline reduction strategy management stakeholders impact performance"
+).split()
+
+GRI_TOPICS = [
+    "GRI 305 - Emissions",
+    "GRI 403 - Occupational Health and Safety",
+    "GRI 405 - Diversity and Equal Opportunity",
+    "GRI 302 - Energy",
+    "GRI 303 - Water and Effluents",
+    "GRI 306 - Waste",
+]
+UN_SDGS = ["Climate Action", "Decent Work and Economic Growth", "Gender Equality", "Affordable and Clean Energy"]
+SUB_QUERY_SUFFIXES = ["overview", "sustainability report", "ESG news", "annual report", "GICS classification"]
+
+
+def _rng(*parts: Any) -> random.Random:
+    seed = hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(seed[:8], "big"))
+
+
+def fake_text(seed: str, num_words: int, topic_words: Optional[List[str]] = None) -> str:
+    """`num_words` words of plausible ESG prose, the same for the same seed."""
+    rng = _rng(seed)
+    words = list(VOCABULARY) + (topic_words or []) * 3
+    sentences = []
+    while num_words > 0:
+        length = min(num_words, rng.randint(8, 16))
+        sentence = " ".join(rng.choice(words) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        num_words -= length
+    return " ".join(sentences)
+
+
+def fake_answer(prompt: str, completion_tokens: int) -> str:
+    """Canned answer for the prompts in llm_prompts.py and subquery.py, free text otherwise."""
+    match = re.search(r"Write (\d+) google search queries", prompt)
+    if match:
+        task = re.search(r'task: "(.*?)"', prompt, re.S)
+        # Commas separate the queries, so the subject is built from words only.
+        subject = " ".join(re.findall(r"\w+", task.group(1) if task else prompt)[:8])
+        return ", ".join(f"{subject} {suffix}" for suffix in SUB_QUERY_SUFFIXES[: int(match.group(1))])
+    if "create a JSON object" in prompt:
+        return json.dumps(
+            {
+                "gics_sector": "Industrials",
+                "gics_industry_group": "Capital Goods",
+                "gics_industry": "Machinery",
+                "company_description": fake_text(prompt[-200:], 40),
+            }
+        )
+    if "applicable GRI topics" in prompt or "applicable gri topics" in prompt:
+        match = re.search(r"List Top (\d+)", prompt)
+        return ", ".join(GRI_TOPICS[: int(match.group(1)) if match else 3])
+    if "UN SDG" in prompt:
+        return ", ".join(UN_SDGS[:3])
+    if "neatly formatted markdown" in prompt:
+        context = re.search(r"-{5,}\n(.*?)\n\s*-{5,}", prompt, re.S)
+        return (context.group(1) if context else prompt).strip()
+    if "passage" in prompt.lower() and "rank" in prompt.lower():
+        # RankGPT: keep the retrieved order.
+        numbers = sorted({int(number) for number in re.findall(r"\[(\d+)\]", prompt)})
+        return " > ".join(f"[{number}]" for number in numbers)
+    return fake_text(prompt, completion_tokens)
+
+
+class FakeLLM(CustomLLM):
+    """LLM returning `fake_answer` after `latency` seconds plus `tokens_per_second` pacing.
+
+    Responses report their token counts in `additional_kwargs` like the OpenAI
+    and NVIDIA clients do, so metrics see exact numbers.
+    """
+
+    model_name: str = "fake-llm"
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+    completion_tokens: int = 150
+    context_window: int = 128000
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.completion_tokens,
+            model_name=self.model_name,
+            is_chat_model=False,
+        )
+
+    def _answer(self, prompt: str) -> tuple:
+        text = fake_answer(prompt, self.completion_tokens)
+        tokens = re.findall(r"\S+\s*", text) or [text]
+        counts = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens)}
+        return text, tokens, counts
+
+    def _duration(self, num_tokens: int) -> float:
+        return self.latency + (num_tokens / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text, tokens, counts = self._answer(prompt)
+        time.sleep(self._duration(len(tokens)))
+        return CompletionResponse(text=text, additional_kwargs=counts)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text, tokens, counts = self._answer(prompt)
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.latency)
+            so_far = ""
+            for token in tokens:
+                if self.tokens_per_second:
+                    time.sleep(1 / self.tokens_per_second)
+                so_far += token
+                yield CompletionResponse(text=so_far, delta=token)
+            yield CompletionResponse(text=so_far, delta="", additional_kwargs=counts)
+
+        return gen()
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text, tokens, counts = self._answer(prompt)
+        await asyncio.sleep(self._duration(len(tokens)))
+        return CompletionResponse(text=text, additional_kwargs=counts)
+
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        text, tokens, counts = self._answer(prompt)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            await asyncio.sleep(self.latency)
+            so_far = ""
+            for token in tokens:
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                so_far += token
+                yield CompletionResponse(text=so_far, delta=token)
+            yield CompletionResponse(text=so_far, delta="", additional_kwargs=counts)
+
+        return gen()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Hashed bag-of-words vectors, so texts sharing words are similar, after a fixed delay.
+
+    Each request takes `latency` seconds plus `latency_per_text` per text in the batch.
+    """
+
+    model_name: str = "fake-embedding"
+    dimension: int = 384
+    latency: float = 0.01
+    latency_per_text: float = 0.0005
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _vector(self, text: str) -> Embedding:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "big") % self.dimension] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _delay(self, num_texts: int) -> float:
+        return self.latency + self.latency_per_text * num_texts
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        time.sleep(self._delay(1))
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        await asyncio.sleep(self._delay(1))
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        time.sleep(self._delay(len(texts)))
+        return [self._vector(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [self._vector(text) for text in texts]
+
+
+def fake_search_results(query: str, num_results: int = 5, words_per_page: int = 600, shared_results: int = 1) -> List[dict]:
+    """Tavily-shaped results for `query`.
+
+    The first `shared_results` pages depend only on the query's first two
+    words, usually the company name, so different queries about one company
+    return some of the same URLs, as real searches do.
+    """
+    words = re.findall(r"\w+", query.lower())
+    subject = "-".join(words[:2]) or "query"
+    results = []
+    for i in range(num_results):
+        key = subject if i < shared_results else query
+        page_id = hashlib.sha1(f"{key}\x00{i}".encode("utf-8")).hexdigest()[:12]
+        content = fake_text(page_id, words_per_page, topic_words=words)
+        results.append(
+            {
+                "url": f"https://search.stub/{subject}/{page_id}",
+                "title": f"{' '.join(words[:6]).title()} ({i + 1})",
+                "content": content[:300],
+                "raw_content": content,
+                "score": round(1.0 - i / (num_results + 1), 3),
+            }
+        )
+    return results
+
+
+def create_tavily_stub_app(
+    num_results: int = 5, words_per_page: int = 600, latency: float = 0.1, shared_results: int = 1
+) -> FastAPI:
+    app = FastAPI()
+    app.state.searches = 0
+
+    @app.post("/search")
+    async def search(body: dict = Body(...)):
+        app.state.searches += 1
+        await asyncio.sleep(latency)
+        query = body.get("query", "")
+        return {
+            "query": query,
+            "results": fake_search_results(query, num_results, words_per_page, shared_results),
+        }
+
+    return app
+
+
+class TavilyStub:
+    """Runs the stub app with uvicorn in a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options: Any) -> None:
+        import uvicorn
+
+        self.app = create_tavily_stub_app(**options)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self.host = host
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def searches(self) -> int:
+        return self.app.state.searches
+
+    @property
+    def base_url(self) -> str:
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    def start(self, timeout: float = 10.0) -> str:
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Tavily stub did not start.")
+            time.sleep(0.01)
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the Tavily search stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per search")
+    parser.add_argument("--results", type=int, default=5, help="Results per search")
+    parser.add_argument("--words-per-page", type=int, default=600)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    print(f"\n> Tavily stub on http://{args.host}:{args.port}, set TAVILY_BASE_URL to use it\n")
+    uvicorn.run(
+        create_tavily_stub_app(args.results, args.words_per_page, args.latency),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Precomputed reporting requirements for every GRI standard in the corpus.
+
+The GRI standards are static, so the answer to "list top 3 reporting
+requirements for GRI topic X" is computed once per standard with GRIWorkflow
+and served from a local lookup table afterwards.
+
+Usage:
+    python gri_catalog.py [--concurrency N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms.llm import LLM
+
+from gri_standards import extract_gri_code, list_gri_standards, normalize_title
+
+
+DEFAULT_CATALOG_PATH = "storage/gri/reporting_requirements.json"
+DEFAULT_GRI_DATA_DIR = "data/gri"
+# The form the topic prompts ask for: "305 - Emissions" or "305: Emissions".
+LEADING_CODE_RE = re.compile(r"^\s*(\d{1,3})\s*[-:]")
+
+
+def reporting_requirements_query(gri_topic: str) -> str:
+    return f"""List top 3 reporting requirements for GRI topic: {gri_topic}. 
+            Do not include any headings or subheading in the assesment.
+            Return reporting requirements as formatted markdown but without ```markdown string."""
+
+
+class GRICatalog:
+    """Reporting requirements by canonical GRI code, e.g. "305"."""
+
+    def __init__(self, entries: Dict[str, dict]) -> None:
+        self.entries = entries
+        # Titles resolve to the most recent standard, e.g. Biodiversity -> 101 (2024) over 304 (2016).
+        self._codes_by_title: Dict[str, str] = {}
+        for code, entry in sorted(entries.items(), key=lambda item: item[1]["year"]):
+            self._codes_by_title[normalize_title(entry["title"])] = code
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOG_PATH) -> "GRICatalog":
+        with open(path) as f:
+            return cls(json.load(f)["requirements"])
+
+    def save(self, path: str = DEFAULT_CATALOG_PATH) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"requirements": self.entries}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def resolve_code(self, gri_topic: str) -> Optional[str]:
+        """Map an LLM-produced topic such as "305 - Emissions" to a code in the catalog.
+
+        A "GRI nnn" code or a leading "nnn -" code is trusted when the catalog
+        has it; otherwise the topic is matched by title, so a number elsewhere
+        in the text cannot pick a standard.
+        """
+        for code in (extract_gri_code(gri_topic, require_prefix=True), _leading_code(gri_topic)):
+            if code in self.entries:
+                return code
+        words = [
+            word for word in normalize_title(gri_topic).split()
+            if word != "gri" and not word.isdigit()
+        ]
+        return self._codes_by_title.get(" ".join(words))
+
+    def lookup(self, gri_topic: str) -> Optional[str]:
+        code = self.resolve_code(gri_topic)
+        if code is None:
+            return None
+        return self.entries[code]["reporting_requirements"]
+
+
+def _leading_code(gri_topic: str) -> Optional[str]:
+    match = LEADING_CODE_RE.match(gri_topic)
+    return match.group(1) if match else None
+
+
+_catalogs: Dict[str, Optional[GRICatalog]] = {}
+_catalogs_lock = threading.Lock()
+
+
+def load_gri_catalog(path: str = DEFAULT_CATALOG_PATH) -> Optional[GRICatalog]:
+    """Return the process-wide catalog, or None if it has not been built yet."""
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = GRICatalog.load(path) if os.path.exists(path) else None
+        return _catalogs[path]
+
+
+async def build_gri_catalog(
+    llm: LLM,
+    embed_model: BaseEmbedding,
+    data_dir: str = DEFAULT_GRI_DATA_DIR,
+    path: str = DEFAULT_CATALOG_PATH,
+    concurrency: int = 4,
+) -> GRICatalog:
+    from workflows.gri_workflow import get_gri_workflow
+
+    standards = {}
+    for standard in list_gri_standards(data_dir):
+        if standard.code not in standards or standard.year > standards[standard.code].year:
+            standards[standard.code] = standard
+
+    gri_workflow = get_gri_workflow(llm=llm, embed_model=embed_model)
+    semaphore = asyncio.Semaphore(concurrency)
+    entries: Dict[str, dict] = {}
+
+    async def precompute(code: str) -> None:
+        standard = standards[code]
+        gri_topic = f"{code} - {standard.title}"
+        async with semaphore:
+            reporting_requirements = await gri_workflow.run(
+                query=reporting_requirements_query(gri_topic)
+            )
+        entries[code] = {
+            "title": standard.title,
+            "year": standard.year,
+            "reporting_requirements": reporting_requirements,
+        }
+        print(f"> Reporting requirements ready for GRI {gri_topic}")
+
+    await asyncio.gather(*[precompute(code) for code in standards])
+    catalog = GRICatalog(dict(sorted(entries.items(), key=lambda item: int(item[0]))))
+    catalog.save(path)
+    return catalog
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--data-dir", default=DEFAULT_GRI_DATA_DIR)
+    parser.add_argument("--output", default=DEFAULT_CATALOG_PATH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from app_context import create_embed_model, create_llm
+
+    load_dotenv()
+    catalog = asyncio.run(
+        build_gri_catalog(
+            create_llm(),
+            create_embed_model(),
+            data_dir=args.data_dir,
+            path=args.output,
+            concurrency=args.concurrency,
+        )
+    )
+    print(f"\n> Wrote reporting requirements for {len(catalog)} GRI standards to {args.output}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from gri_standards import extract_gri_code, parse_gri_file_name
+from rerank import VECTOR_SCORE_KEY, tokenize
+
+
+logger = getLogger(__name__)
+
+DEFAULT_GRI_PERSIST_DIR = "./storage/gri"
+FAISS_FILE = "default__vector_store.json"
+DOCSTORE_FILE = "docstore.json"
+INDEX_STORE_FILE = "index_store.json"
+NODE_STORE_FILE = "nodes.sqlite"
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+MAX_KEYWORD_TERMS = 32
+
+
+def read_faiss_index(path: str) -> faiss.Index:
+    """Read a FAISS index memory-mapped from disk when the index type allows it."""
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def node_gri_code(node: BaseNode) -> Optional[str]:
+    """GRI standard number of a node, from its metadata or its source file name."""
+    code = node.metadata.get("gri_code")
+    if code is None:
+        standard = parse_gri_file_name(node.metadata.get("file_name", ""))
+        code = standard.code if standard else None
+    return code
+
+
+class NodeStore:
+    """Compact SQLite store of nodes addressed by their FAISS row position.
+
+    Each node is kept as zlib-compressed docstore JSON, so lookups only
+    decode the handful of rows a query returns. Rows carry the GRI code of
+    their standard for pre-filtering, and node text is indexed in an FTS5
+    table for BM25 keyword search. Connections are per thread, which makes
+    reads safe from concurrent workflow runs.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def create(path: str, nodes_by_position: Dict[int, BaseNode]) -> "NodeStore":
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        conn.execute(
+            """CREATE TABLE nodes (
+                position INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                gri_code TEXT,
+                data BLOB NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX nodes_gri_code ON nodes (gri_code)")
+        conn.execute("CREATE VIRTUAL TABLE nodes_fts USING fts5(text, content='')")
+        conn.executemany(
+            "INSERT INTO nodes VALUES (?, ?, ?, ?)",
+            (
+                (
+                    position,
+                    node.node_id,
+                    node_gri_code(node),
+                    zlib.compress(json.dumps(doc_to_json(node)).encode("utf-8")),
+                )
+                for position, node in nodes_by_position.items()
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO nodes_fts (rowid, text) VALUES (?, ?)",
+            (
+                (position, node.get_content(metadata_mode=MetadataMode.NONE))
+                for position, node in nodes_by_position.items()
+            ),
+        )
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+        return NodeStore(path)
+
+    def get_nodes(self, positions: List[int]) -> Dict[int, BaseNode]:
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        rows = self._conn.execute(
+            f"SELECT position, data FROM nodes WHERE position IN ({placeholders})",
+            [int(position) for position in positions],
+        ).fetchall()
+        return {
+            position: json_to_doc(json.loads(zlib.decompress(data)))
+            for position, data in rows
+        }
+
+    def get_all_nodes(self) -> Dict[int, BaseNode]:
+        rows = self._conn.execute("SELECT position, data FROM nodes").fetchall()
+        return {
+            position: json_to_doc(json.loads(zlib.decompress(data)))
+            for position, data in rows
+        }
+
+    def has_keyword_index(self) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'nodes_fts'"
+        ).fetchone()
+        return row is not None
+
+    def gri_codes(self) -> set:
+        rows = self._conn.execute("SELECT DISTINCT gri_code FROM nodes WHERE gri_code IS NOT NULL")
+        return {row[0] for row in rows}
+
+    def positions_for_code(self, gri_code: str) -> List[int]:
+        rows = self._conn.execute("SELECT position FROM nodes WHERE gri_code = ?", (gri_code,))
+        return [row[0] for row in rows]
+
+    def keyword_search(
+        self, query_str: str, top_k: int, positions: Optional[List[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """BM25 search over node text; returns (position, score) with higher scores first."""
+        terms = list(dict.fromkeys(tokenize(query_str)))[:MAX_KEYWORD_TERMS]
+        if not terms:
+            return []
+        sql = "SELECT rowid, bm25(nodes_fts) FROM nodes_fts WHERE nodes_fts MATCH ?"
+        params: list = [" OR ".join(f'"{term}"' for term in terms)]
+        if positions is not None:
+            sql += f" AND rowid IN ({','.join('?' * len(positions))})"
+            params.extend(positions)
+        sql += " ORDER BY bm25(nodes_fts) LIMIT ?"
+        params.append(top_k)
+        # FTS5 bm25() is lower-is-better, flip the sign.
+        return [(position, -score) for position, score in self._conn.execute(sql, params)]
+
+
+def _migrate_docstore(persist_dir: str, node_store_path: str) -> NodeStore:
+    """Convert the JSON docstore written by VectorStoreIndex into a NodeStore."""
+    print(f"\n> Converting GRI docstore in {persist_dir} to {NODE_STORE_FILE}\n")
+    with open(os.path.join(persist_dir, INDEX_STORE_FILE)) as f:
+        index_store = json.load(f)["index_store/data"]
+    (index_struct,) = index_store.values()
+    nodes_dict = json.loads(index_struct["__data__"])["nodes_dict"]
+    with open(os.path.join(persist_dir, DOCSTORE_FILE)) as f:
+        docstore = json.load(f)["docstore/data"]
+    nodes_by_position = {
+        int(position): json_to_doc(docstore[node_id])
+        for position, node_id in nodes_dict.items()
+        if node_id in docstore
+    }
+    return NodeStore.create(node_store_path, nodes_by_position)
+
+
+def _upgrade_node_store(node_store: NodeStore) -> NodeStore:
+    """Rewrite a NodeStore built before GRI codes and keyword search were stored."""
+    print(f"\n> Adding GRI codes and keyword index to {node_store.path}\n")
+    return NodeStore.create(node_store.path, node_store.get_all_nodes())
+
+
+def _search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Search parameters restricted to `selector` that keep the index's tuning."""
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _reciprocal_rank_fusion(*rankings: List[int]) -> Dict[int, float]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return scores
+
+
+class GRIIndex:
+    """Read-only GRI index shared by every GRIWorkflow run in the process."""
+
+    def __init__(self, persist_dir: str = DEFAULT_GRI_PERSIST_DIR) -> None:
+        self.persist_dir = persist_dir
+        self.faiss_index = read_faiss_index(os.path.join(persist_dir, FAISS_FILE))
+        node_store_path = os.path.join(persist_dir, NODE_STORE_FILE)
+        docstore_path = os.path.join(persist_dir, DOCSTORE_FILE)
+        if os.path.exists(docstore_path) and (
+            not os.path.exists(node_store_path)
+            or os.path.getmtime(docstore_path) > os.path.getmtime(node_store_path)
+        ):
+            self.node_store = _migrate_docstore(persist_dir, node_store_path)
+        else:
+            self.node_store = NodeStore(node_store_path)
+        if not self.node_store.has_keyword_index():
+            self.node_store = _upgrade_node_store(self.node_store)
+        self.gri_codes = self.node_store.gri_codes()
+
+    def _to_similarity(self, scores: np.ndarray) -> np.ndarray:
+        # L2 indexes return distances; map them to a similarity where higher is better.
+        if self.faiss_index.metric_type == faiss.METRIC_L2:
+            return 1.0 / (1.0 + scores)
+        return scores
+
+    def vector_search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        positions: Optional[List[int]] = None,
+    ) -> List[Tuple[int, float]]:
+        query = np.asarray(query_embedding, dtype=np.float32)[np.newaxis, :]
+        if positions is None:
+            scores, ids = self.faiss_index.search(query, top_k)
+        else:
+            selector = faiss.IDSelectorBatch(np.asarray(positions, dtype=np.int64))
+            scores, ids = self.faiss_index.search(
+                query, top_k, params=_search_parameters(self.faiss_index, selector)
+            )
+        scores = self._to_similarity(scores)
+        return [
+            (int(position), float(score))
+            for position, score in zip(ids[0], scores[0])
+            if position >= 0
+        ]
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        query_str: Optional[str] = None,
+        gri_code: Optional[str] = None,
+    ) -> List[NodeWithScore]:
+        """Vector search, fused with BM25 keyword search when `query_str` is given.
+
+        When `gri_code` names a standard in the index, only its chunks are
+        searched. Fused results are scored by reciprocal rank fusion and keep
+        their vector similarity in VECTOR_SCORE_KEY metadata for reranking.
+        """
+        positions = None
+        if gri_code is not None and gri_code in self.gri_codes:
+            positions = self.node_store.positions_for_code(gri_code)
+
+        hits = self.vector_search(query_embedding, top_k, positions)
+        similarities = None
+        if query_str:
+            keyword_hits = self.node_store.keyword_search(query_str, top_k, positions)
+            fused = _reciprocal_rank_fusion(
+                [position for position, _ in hits],
+                [position for position, _ in keyword_hits],
+            )
+            similarities = dict(hits)
+            hits = sorted(fused.items(), key=lambda hit: hit[1], reverse=True)[:top_k]
+            keyword_only = [position for position, _ in hits if position not in similarities]
+            if keyword_only:
+                similarities.update(self.vector_search(query_embedding, len(keyword_only), keyword_only))
+
+        nodes = self.node_store.get_nodes([position for position, _ in hits])
+        if similarities is not None:
+            for position, node in nodes.items():
+                node.metadata[VECTOR_SCORE_KEY] = similarities.get(position)
+                node.excluded_embed_metadata_keys.append(VECTOR_SCORE_KEY)
+                node.excluded_llm_metadata_keys.append(VECTOR_SCORE_KEY)
+        return [
+            NodeWithScore(node=nodes[position], score=score)
+            for position, score in hits
+            if position in nodes
+        ]
+
+    def as_retriever(
+        self,
+        similarity_top_k: int = 5,
+        embed_model: Optional[BaseEmbedding] = None,
+        filter_by_code: bool = True,
+    ) -> "GRIRetriever":
+        return GRIRetriever(
+            index=self,
+            similarity_top_k=similarity_top_k,
+            embed_model=embed_model or Settings.embed_model,
+            filter_by_code=filter_by_code,
+        )
+
+
+class GRIRetriever(BaseRetriever):
+    """Hybrid retriever; queries naming a standard ("GRI 305") only search that standard."""
+
+    def __init__(
+        self,
+        index: GRIIndex,
+        similarity_top_k: int,
+        embed_model: BaseEmbedding,
+        filter_by_code: bool = True,
+    ) -> None:
+        super().__init__()
+        self._index = index
+        self._similarity_top_k = similarity_top_k
+        self._embed_model = embed_model
+        self._filter_by_code = filter_by_code
+
+    def _search(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        gri_code = None
+        if self._filter_by_code:
+            gri_code = extract_gri_code(query_bundle.query_str, require_prefix=True)
+        return self._index.search(
+            query_bundle.embedding,
+            self._similarity_top_k,
+            query_str=query_bundle.query_str,
+            gri_code=gri_code,
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return self._search(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return self._search(query_bundle)
+
+
+_gri_indexes: Dict[str, GRIIndex] = {}
+_gri_indexes_lock = threading.Lock()
+
+
+def load_gri_index(persist_dir: str = DEFAULT_GRI_PERSIST_DIR) -> GRIIndex:
+    """Return the process-wide GRI index for `persist_dir`, loading it on first use."""
+    with _gri_indexes_lock:
+        if persist_dir not in _gri_indexes:
+            _gri_indexes[persist_dir] = GRIIndex(persist_dir)
+        return _gri_indexes[persist_dir]
@@ -0,0 +1,82 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+GRI_FILE_NAME_RE = re.compile(
+    r"^GRI (?P<code>\d+)_\s*(?P<title>.+?)\s+(?P<year>\d{4})(?:\s*-\s*English)?\.pdf$",
+    re.IGNORECASE,
+)
+GRI_CODE_RE = re.compile(r"(?<!\d)(\d{1,3})(?!\d)")
+GRI_PREFIXED_CODE_RE = re.compile(r"\bGRI(?:\s+topic)?\s*:?\s*(\d{1,3})(?!\d)", re.IGNORECASE)
+
+UNIVERSAL_CODES = {"1", "2", "3"}
+SECTOR_CODES = {"11", "12", "13", "14"}
+
+
+@dataclass(frozen=True)
+class GRIStandard:
+    code: str
+    title: str
+    year: int
+    file_name: str
+
+    @property
+    def kind(self) -> str:
+        """"universal" (GRI 1-3), "sector" (GRI 11-14) or "topic"."""
+        if self.code in UNIVERSAL_CODES:
+            return "universal"
+        if self.code in SECTOR_CODES:
+            return "sector"
+        return "topic"
+
+    def metadata(self) -> Dict[str, object]:
+        return {
+            "gri_code": self.code,
+            "gri_title": self.title,
+            "gri_year": self.year,
+            "gri_kind": self.kind,
+        }
+
+
+def parse_gri_file_name(file_name: str) -> Optional[GRIStandard]:
+    """Parse names like "GRI 305_ Emissions 2016.pdf"; returns None for e.g. the glossary."""
+    match = GRI_FILE_NAME_RE.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    return GRIStandard(
+        code=match["code"],
+        title=match["title"].strip(),
+        year=int(match["year"]),
+        file_name=os.path.basename(file_name),
+    )
+
+
+def gri_metadata(file_name: str) -> Dict[str, object]:
+    """Node metadata for a chunk of `file_name`; empty for files that are not a standard."""
+    standard = parse_gri_file_name(file_name)
+    return standard.metadata() if standard else {}
+
+
+def list_gri_standards(data_dir: str) -> List[GRIStandard]:
+    standards = [parse_gri_file_name(name) for name in sorted(os.listdir(data_dir))]
+    return [standard for standard in standards if standard is not None]
+
+
+def extract_gri_code(text: str, require_prefix: bool = False) -> Optional[str]:
+    """Return the standard number in text such as "305 - Emissions" or "GRI 305-1".
+
+    A number right after "GRI" or "GRI topic:" wins over the first bare number,
+    so "List top 3 ... GRI topic: 305 - Emissions" resolves to 305. With
+    `require_prefix` bare numbers are ignored.
+    """
+    match = GRI_PREFIXED_CODE_RE.search(text)
+    if match is None and not require_prefix:
+        match = GRI_CODE_RE.search(text)
+    return match.group(1) if match else None
+
+
+def normalize_title(title: str) -> str:
+    title = title.lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title).split())
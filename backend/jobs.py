@@ -0,0 +1,301 @@
+"""Detached analysis jobs.
+
+A job runs ESGMaterialityAnalysisWorkflow in the background, independent of
+any client connection. Every client message the run produces is buffered with
+a sequence number, so clients can attach, drop and re-attach to the stream
+from any point and answer pending `input_required_*` prompts on reconnect.
+Per-token "token" messages only go to attached clients; they are neither
+buffered nor saved, since the final text arrives in the durable message that
+follows them.
+Job state is saved as JSON under storage/jobs for listing and result lookup,
+and each run is checkpointed so unfinished jobs resume after a restart.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import AsyncIterator, Dict, List, Optional
+
+from llama_index.core.workflow.handler import WorkflowHandler
+
+from app_context import AppContext
+from checkpoints import CheckpointStore
+from metrics import start_run
+from session import INPUT_REQUIRED_TYPES, apply_user_response, event_to_message
+from workflows.esg_materiality_analysis_workflow import ESGMaterialityAnalysisWorkflow
+
+
+logger = getLogger(__name__)
+
+DEFAULT_JOB_STORE_DIR = "storage/jobs"
+# Detached runs may wait on a user for a while, so they get a longer timeout than /query.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT") or 3600)
+
+RUNNING = "running"
+WAITING_FOR_INPUT = "waiting_for_input"
+COMPLETED = "completed"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+FINISHED_STATUSES = (COMPLETED, FAILED, INTERRUPTED)
+
+# Streamed to attached clients as they happen, but not replayed.
+LIVE_MESSAGE_TYPES = ("token",)
+# Messages a resumed run sends again from its checkpoint.
+RESTORED_MESSAGE_TYPES = ("company_details", "gri_topics", "topic_assesment") + INPUT_REQUIRED_TYPES
+
+
+class JobNotFoundError(KeyError):
+    pass
+
+
+class JobStateError(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    job_id: str
+    company_name: str
+    status: str = RUNNING
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    messages: List[dict] = field(default_factory=list)
+    pending_input: Optional[dict] = None
+    result: Optional[list] = None
+    error: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self._subscribers: List[asyncio.Queue] = []
+        self._responses: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "company_name": self.company_name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "num_messages": len(self.messages),
+            "pending_input": self.pending_input,
+            "error": self.error,
+        }
+
+    def to_json(self) -> dict:
+        data = self.summary()
+        data["messages"] = self.messages
+        data["result"] = self.result
+        return data
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Job":
+        return cls(
+            job_id=data["job_id"],
+            company_name=data["company_name"],
+            status=data["status"],
+            created_at=data["created_at"],
+            updated_at=data["updated_at"],
+            messages=data["messages"],
+            pending_input=data["pending_input"],
+            result=data["result"],
+            error=data["error"],
+        )
+
+    async def publish(self, message: dict) -> dict:
+        if message["type"] not in LIVE_MESSAGE_TYPES:
+            message = {"seq": len(self.messages), **message}
+            self.messages.append(message)
+            self.updated_at = time.time()
+        for queue in self._subscribers:
+            queue.put_nowait(message)
+        return message
+
+    async def set_status(self, status: str) -> None:
+        self.status = status
+        self.updated_at = time.time()
+        if self.finished:
+            for queue in self._subscribers:
+                queue.put_nowait(None)
+
+    async def stream(self, after: int = 0) -> AsyncIterator[dict]:
+        """Yield buffered messages with seq >= `after`, then new ones until the job finishes."""
+        # Subscribed before the replay, with no await in between, so nothing published is missed.
+        # Only a job already finished at that point ends with the replay; one finishing
+        # later ends the queue with None, after the messages published meanwhile.
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        finished = self.finished
+        try:
+            for message in self.messages[after:]:
+                yield message
+            if finished:
+                return
+            while (message := await queue.get()) is not None:
+                if message.get("seq", after) >= after:
+                    yield message
+        finally:
+            self._subscribers.remove(queue)
+
+
+class JobStore:
+    """One JSON file per job."""
+
+    def __init__(self, store_dir: str = DEFAULT_JOB_STORE_DIR) -> None:
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.store_dir, f"{job_id}.json")
+
+    def save(self, job: Job) -> None:
+        path = self._path(job.job_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job.to_json(), f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str) -> Optional[Job]:
+        path = self._path(job_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return Job.from_json(json.load(f))
+
+    def load_all(self) -> List[Job]:
+        jobs = []
+        for name in sorted(os.listdir(self.store_dir)):
+            if name.endswith(".json"):
+                job = self.load(name[: -len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+
+class JobManager:
+    """Runs analysis jobs in the background and keeps their message buffers."""
+
+    def __init__(
+        self,
+        app_context: AppContext,
+        store: Optional[JobStore] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+    ) -> None:
+        self.app_context = app_context
+        self.store = store or JobStore()
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.jobs: Dict[str, Job] = {}
+        for job in self.store.load_all():
+            if not job.finished and self.checkpoints.load(job.job_id) is None:
+                # Nothing to resume from; its buffer is still readable.
+                job.status = INTERRUPTED
+                job.pending_input = None
+                self.store.save(job)
+            self.jobs[job.job_id] = job
+
+    def resume_jobs(self) -> None:
+        """Restart the runs of unfinished jobs from their checkpoints."""
+        for job in self.jobs.values():
+            if not job.finished and job._task is None:
+                print(f"\n> Resuming job {job.job_id} for {job.company_name}\n")
+                job.status = RUNNING
+                job.pending_input = None
+                job._task = asyncio.create_task(self._run(job))
+
+    def submit(self, company_name: str) -> Job:
+        job = Job(job_id=uuid.uuid4().hex, company_name=company_name)
+        self.jobs[job.job_id] = job
+        self.store.save(job)
+        job._task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(job_id)
+        return job
+
+    def list_jobs(self) -> List[dict]:
+        jobs = sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return [job.summary() for job in jobs]
+
+    async def respond(self, job_id: str, response: dict) -> None:
+        """Answer the job's pending `input_required_*` prompt."""
+        job = self.get(job_id)
+        if job.status != WAITING_FOR_INPUT:
+            raise JobStateError(f"Job {job_id} is {job.status}, not waiting for input.")
+        answer = str(response.get("response", "")).lower()
+        if answer not in ("yes", "no") or (answer == "no" and not response.get("comment")):
+            raise ValueError('Expected {"response": "yes"} or {"response": "no", "comment": ...}.')
+        job.pending_input = None
+        await job.set_status(RUNNING)
+        await job._responses.put(response)
+
+    async def _run(self, job: Job) -> None:
+        checkpoint = self.checkpoints.load(job.job_id)
+        # A resumed run re-sends the results it restores; clients already have them.
+        already_sent = set()
+        if checkpoint is None:
+            checkpoint = self.checkpoints.create(job.company_name, run_id=job.job_id)
+        else:
+            already_sent = {
+                json.dumps({"type": message["type"], "payload": message["payload"]}, sort_keys=True)
+                for message in job.messages
+                if message["type"] in RESTORED_MESSAGE_TYPES
+            }
+
+        workflow = ESGMaterialityAnalysisWorkflow(
+            llm=self.app_context.llm,
+            embed_model=self.app_context.embed_model,
+            gri_index=self.app_context.gri_index,
+            gri_catalog=self.app_context.gri_catalog,
+            checkpoint=checkpoint,
+            timeout=JOB_TIMEOUT,
+        )
+        run_metrics = start_run()
+        try:
+            handler: WorkflowHandler = workflow.run(company_name=job.company_name)
+            async for event in handler.stream_events():
+                message = event_to_message(event)
+                if message is None:
+                    continue
+                if json.dumps(message, sort_keys=True) not in already_sent:
+                    message = await job.publish(message)
+                if message["type"] in INPUT_REQUIRED_TYPES:
+                    job.pending_input = message
+                    await job.set_status(WAITING_FOR_INPUT)
+                    self.store.save(job)
+                    response = await job._responses.get()
+                    await apply_user_response(handler, message["type"], response)
+                    # Anything sent after an answer is new, even if it looks the same.
+                    already_sent.clear()
+                    self.store.save(job)
+
+            job.result = await handler
+            run_metrics.finish()
+            await job.publish({"type": "un_sdg_list", "payload": job.result, "timing": run_metrics.summary()})
+            await job.set_status(COMPLETED)
+            self.checkpoints.delete(job.job_id)
+        except asyncio.CancelledError:
+            # Left unfinished on purpose, the next process resumes it from the checkpoint.
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} failed")
+            job.error = str(e)
+            await job.publish({"type": "error", "payload": str(e)})
+            await job.set_status(FAILED)
+        finally:
+            self.store.save(job)
+
+    async def close(self) -> None:
+        """Stop running jobs on shutdown; they resume from their checkpoints on the next start."""
+        tasks = [job._task for job in self.jobs.values() if job._task and not job._task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
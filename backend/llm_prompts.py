@@ -1,7 +1,21 @@
+from typing import Callable, Optional
+
 from llama_index.core.llms.llm import LLM
 from llama_index.core.prompts.base import PromptTemplate
 
 
+async def apredict_streaming(llm: LLM, prompt: PromptTemplate, on_token: Optional[Callable[[str], None]] = None, **prompt_args) -> str:
+    """Like llm.apredict, but hands each generated token to `on_token` as it arrives."""
+    if on_token is None:
+        return await llm.apredict(prompt, **prompt_args)
+
+    response = ""
+    async for delta in await llm.astream(prompt, **prompt_args):
+        response += delta
+        on_token(delta)
+    return response
+
+
 async def generate_structured_output(context:str, schema:str, llm: LLM) -> str:
     extraction_prompt = PromptTemplate("""
     Context information is below:
@@ -46,7 +60,7 @@ async def generate_formatted_markdown_text(context: str, llm: LLM) -> str:
 
     return str(response)
 
-async def consolidate_assesment(assesment_1: str,assesment_2: str,llm: LLM) -> str:
+async def consolidate_assesment(assesment_1: str,assesment_2: str,llm: LLM, on_token: Optional[Callable[[str], None]] = None) -> str:
     prompt = PromptTemplate("""
     Rewrite a final 150 word assesment summary using the below 2 assesments. 
     
@@ -64,8 +78,10 @@ async def consolidate_assesment(assesment_1: str,assesment_2: str,llm: LLM) -> s
 
     """)
 
-    response = await llm.apredict(
+    response = await apredict_streaming(
+        llm,
         prompt,
+        on_token,
         assesment_1 = assesment_1,
         assesment_2 = assesment_2,
     )
@@ -160,7 +176,7 @@ Return nothing before or after the comma seperate values of GRI topics
 
     return gri_topics
 
-async def get_applicable_un_sdg_list(company_name:str,assesment:str,llm:LLM):
+async def get_applicable_un_sdg_list(company_name:str,assesment:str,llm:LLM, on_token: Optional[Callable[[str], None]] = None):
     prompt = PromptTemplate(
         """
 List applicable UN SDG for company {company_name} based on below assesment by GRI topics.
@@ -172,8 +188,10 @@ You must respond with the UN SDG name separated by comma in the following format
 Return nothing before or after the comma seperate values of UN SDG goals
 """
     )
-    response = await llm.apredict(
+    response = await apredict_streaming(
+        llm,
         prompt,
+        on_token,
         company_name=company_name,
         assesment=assesment,
     )
@@ -0,0 +1,571 @@
+"""Central scheduling of LLM and embedding requests.
+
+Every model call goes through a RequestScheduler for its model. The scheduler:
+
+- keeps per-minute request and token budgets with token buckets,
+- admits queued calls by priority, so interactive sessions go ahead of batch
+  runs (see `request_priority` and `batch_priority`),
+- adjusts the number of calls in flight AIMD-style: the limit grows by one per
+  window of successful calls and halves on a 429 or a latency spike,
+- exposes queue depth, in-flight calls and throttling counts via `stats()`.
+
+ScheduledLLM and ScheduledEmbedding wrap any llama-index LLM or embedding
+model, MockLLM and MockEmbedding included, so the scheduler also works with a
+local fake model.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from llama_index.core.base.embeddings.base import Embedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms.llm import LLM
+
+from embedding_cache import embed_model_id
+from metrics import record_embedding_batch, record_llm_call
+
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+# Lower values are admitted first.
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+# Rough size of a completion, charged against the token budget up front.
+DEFAULT_COMPLETION_TOKENS = 256
+CHARS_PER_TOKEN = 4
+
+
+@contextmanager
+def batch_priority() -> Iterator[None]:
+    """Run the model calls made inside the block, and the tasks it starts, at batch priority."""
+    token = request_priority.set(BATCH)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def messages_text(messages: Sequence[ChatMessage]) -> str:
+    return "".join(str(message.content or "") for message in messages)
+
+
+def response_text(response: Any) -> str:
+    message = getattr(response, "message", None)
+    if message is not None:
+        return str(message.content or "")
+    return getattr(response, "text", None) or ""
+
+
+def response_token_counts(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """Prompt and completion tokens reported by the provider, None where it reports none."""
+    counts = getattr(response, "additional_kwargs", None) or {}
+    if "prompt_tokens" not in counts:
+        raw = getattr(response, "raw", None)
+        usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+        if isinstance(usage, dict):
+            counts = usage
+        elif usage is not None:
+            counts = {
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None),
+            }
+    return counts.get("prompt_tokens"), counts.get("completion_tokens")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for 429 errors from the OpenAI, NVIDIA or httpx clients."""
+    for candidate in (error, getattr(error, "response", None)):
+        if getattr(candidate, "status_code", None) == 429 or getattr(candidate, "status", None) == 429:
+            return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth.
+
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken; requests larger than the bucket wait for a full one."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """Priority queue, rate limits and adaptive concurrency for one model.
+
+    Must be used from a single event loop. Sync calls from worker threads are
+    admitted through that loop (see `call`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        latency_spike_factor: float = 3.0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.latency_spike_factor = latency_spike_factor
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.latency_spikes = 0
+        self.total_wait = 0.0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, max_concurrency: int = 16) -> "RequestScheduler":
+        return cls(
+            name,
+            requests_per_minute=float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE") or 0),
+            tokens_per_minute=float(os.getenv(f"{prefix}_TOKENS_PER_MINUTE") or 0),
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY") or max_concurrency),
+            min_concurrency=int(os.getenv(f"{prefix}_MIN_CONCURRENCY") or 1),
+        )
+
+    def stats(self) -> dict:
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                queued[name] = queued.get(name, 0) + 1
+        admitted = self.completed + self.failed + self.in_flight
+        return {
+            "name": self.name,
+            "queued": queued,
+            "queue_depth": sum(queued.values()),
+            "in_flight": self.in_flight,
+            "concurrency_limit": int(self.limit),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "latency_spikes": self.latency_spikes,
+            "avg_latency": self._latency_ewma or 0.0,
+            "avg_queue_wait": self.total_wait / admitted if admitted else 0.0,
+        }
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new loop (e.g. a second asyncio.run in a script); waiters of the old one are gone.
+            self._loop = loop
+            self._waiters = []
+            self._retry_handle = None
+            self.in_flight = 0
+        return loop
+
+    def _dispatch(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            priority, seq, tokens, future = self._waiters[0]
+            if future.done():
+                # Cancelled while queued.
+                heapq.heappop(self._waiters)
+                continue
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                if self._retry_handle is None:
+                    self._retry_handle = self._loop.call_later(wait, self._retry_dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _retry_dispatch(self) -> None:
+        self._retry_handle = None
+        self._dispatch()
+
+    async def acquire(self, tokens: int = 1, priority: Optional[int] = None) -> float:
+        """Wait for a slot and budget for a call of about `tokens` tokens; returns its start time."""
+        loop = self._bind_loop()
+        priority = request_priority.get() if priority is None else priority
+        queued_at = time.monotonic()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled; hand the slot back.
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+        started = time.monotonic()
+        self.total_wait += started - queued_at
+        return started
+
+    def release(self, started: float, error: Optional[BaseException] = None) -> None:
+        """Return a slot and adapt the concurrency limit to how the call went."""
+        self.in_flight = max(0, self.in_flight - 1)
+        latency = time.monotonic() - started
+        if error is not None and is_rate_limit_error(error):
+            self.rate_limited += 1
+            self.failed += 1
+            self._decrease(f"rate limited ({error.__class__.__name__})")
+        elif error is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+            if (
+                self._latency_ewma is not None
+                and self.completed > 10
+                and latency > self.latency_spike_factor * self._latency_ewma
+            ):
+                self.latency_spikes += 1
+                self._decrease(f"latency spike ({latency:.1f}s vs {self._latency_ewma:.1f}s avg)")
+            else:
+                # Additive increase: about +1 per `limit` successful calls.
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._latency_ewma = (
+                latency if self._latency_ewma is None else 0.9 * self._latency_ewma + 0.1 * latency
+            )
+        if self._loop is not None:
+            self._dispatch()
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        # Calls that were in flight together usually fail together; count them as one signal.
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+        logger.warning(f"{self.name}: {reason}, concurrency limit lowered to {int(self.limit)}")
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 1) -> T:
+        """Run `call` once admitted, retrying rate-limited attempts with backoff."""
+        attempt = 0
+        while True:
+            started = await self.acquire(tokens)
+            try:
+                result = await call()
+            except Exception as e:
+                self.release(started, e)
+                if is_rate_limit_error(e) and attempt < self.max_retries:
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+            except BaseException as e:
+                self.release(started, e)
+                raise
+            self.release(started)
+            return result
+
+    def call(self, call: Callable[[], T], tokens: int = 1) -> T:
+        """Sync variant of `run` for calls made from worker threads.
+
+        Admission happens on the scheduler's loop. Sync calls made on the loop
+        thread itself, or before the loop is known, cannot wait for it and run
+        straight away.
+        """
+        loop = self._loop
+        on_loop = False
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            pass
+        if loop is None or on_loop or loop.is_closed() or not loop.is_running():
+            return call()
+
+        attempt = 0
+        while True:
+            # The loop runs acquire in its own context, so pass this thread's priority along.
+            started = asyncio.run_coroutine_threadsafe(self.acquire(tokens, request_priority.get()), loop).result()
+            try:
+                result = call()
+            except Exception as e:
+                loop.call_soon_threadsafe(self.release, started, e)
+                if is_rate_limit_error(e) and attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+            loop.call_soon_threadsafe(self.release, started, None)
+            return result
+
+    def bind(self) -> None:
+        """Remember the running loop so worker-thread calls can be scheduled on it."""
+        self._bind_loop()
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str, prefix: str, max_concurrency: int = 16) -> RequestScheduler:
+    """Return the process-wide scheduler for a model, configured from `{prefix}_*` env vars."""
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = RequestScheduler.from_env(name, prefix, max_concurrency=max_concurrency)
+        return _schedulers[name]
+
+
+def bind_schedulers() -> None:
+    """Bind every scheduler to the running loop; call once from the app's loop at startup."""
+    for scheduler in list(_schedulers.values()):
+        scheduler.bind()
+
+
+def scheduler_stats() -> List[dict]:
+    return [scheduler.stats() for scheduler in _schedulers.values()]
+
+
+class ScheduledLLM(LLM):
+    """LLM wrapper that sends every call of the wrapped LLM through a RequestScheduler.
+
+    Streaming calls hold their slot until the stream is consumed.
+    """
+
+    _llm: LLM = PrivateAttr()
+    _scheduler: RequestScheduler = PrivateAttr()
+
+    def __init__(self, llm: LLM, scheduler: RequestScheduler, **kwargs: Any) -> None:
+        super().__init__(
+            callback_manager=llm.callback_manager,
+            system_prompt=llm.system_prompt,
+            messages_to_prompt=llm.messages_to_prompt,
+            completion_to_prompt=llm.completion_to_prompt,
+            **kwargs,
+        )
+        self._llm = llm
+        self._scheduler = scheduler
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledLLM"
+
+    @property
+    def llm(self) -> LLM:
+        return self._llm
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        return self._scheduler
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    def _tokens(self, text: str) -> int:
+        num_output = self._llm.metadata.num_output
+        completion = num_output if 0 < num_output < DEFAULT_COMPLETION_TOKENS else DEFAULT_COMPLETION_TOKENS
+        return estimate_tokens(text) + completion
+
+    def _record(self, prompt: str, response: Any, started: float) -> None:
+        prompt_tokens, completion_tokens = response_token_counts(response)
+        record_llm_call(
+            self._llm.metadata.model_name,
+            prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+            completion_tokens if completion_tokens is not None else estimate_tokens(response_text(response)),
+            time.perf_counter() - started,
+        )
+
+    async def _arun(self, call: Callable[[], Awaitable[T]], prompt: str) -> T:
+        started = time.perf_counter()
+        response = await self._scheduler.run(call, self._tokens(prompt))
+        self._record(prompt, response, started)
+        return response
+
+    def _run(self, call: Callable[[], T], prompt: str) -> T:
+        started = time.perf_counter()
+        response = self._scheduler.call(call, self._tokens(prompt))
+        self._record(prompt, response, started)
+        return response
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._run(lambda: self._llm.chat(messages, **kwargs), messages_text(messages))
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._run(lambda: self._llm.complete(prompt, formatted=formatted, **kwargs), prompt)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        # Sync streams are only used by offline tooling; they are admitted but not held or metered.
+        return self._scheduler.call(
+            lambda: self._llm.stream_chat(messages, **kwargs), self._tokens(messages_text(messages))
+        )
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self._scheduler.call(
+            lambda: self._llm.stream_complete(prompt, formatted=formatted, **kwargs), self._tokens(prompt)
+        )
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._arun(lambda: self._llm.achat(messages, **kwargs), messages_text(messages))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._arun(lambda: self._llm.acomplete(prompt, formatted=formatted, **kwargs), prompt)
+
+    async def _held_stream(self, open_stream: Callable[[], Awaitable[AsyncGenerator]], prompt: str) -> AsyncGenerator:
+        started = await self._scheduler.acquire(self._tokens(prompt))
+        call_started = time.perf_counter()
+        try:
+            stream = await open_stream()
+        except BaseException as e:
+            self._scheduler.release(started, e)
+            raise
+
+        async def gen() -> AsyncGenerator:
+            error = None
+            # Stream chunks carry the text so far, so the last one has the whole answer.
+            response = None
+            try:
+                async for response in stream:
+                    yield response
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._scheduler.release(started, error)
+                if response is not None:
+                    self._record(prompt, response, call_started)
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        return await self._held_stream(lambda: self._llm.astream_chat(messages, **kwargs), messages_text(messages))
+
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        return await self._held_stream(
+            lambda: self._llm.astream_complete(prompt, formatted=formatted, **kwargs), prompt
+        )
+
+
+class ScheduledEmbedding(BaseEmbedding):
+    """Embedding model wrapper that sends every call through a RequestScheduler.
+
+    Wrap it in CachedEmbedding rather than the other way round, so cache hits
+    do not use up the budget.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _scheduler: RequestScheduler = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, scheduler: RequestScheduler, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=embed_model_id(embed_model),
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._scheduler = scheduler
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    @property
+    def scheduler(self) -> RequestScheduler:
+        return self._scheduler
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        record_embedding_batch(self.model_name, 1)
+        return self._scheduler.call(lambda: self._embed_model.get_query_embedding(query), estimate_tokens(query))
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        record_embedding_batch(self.model_name, 1)
+        return await self._scheduler.run(
+            lambda: self._embed_model.aget_query_embedding(query), estimate_tokens(query)
+        )
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        record_embedding_batch(self.model_name, len(texts))
+        return self._scheduler.call(
+            lambda: self._embed_model.get_text_embedding_batch(texts),
+            sum(estimate_tokens(text) for text in texts),
+        )
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        record_embedding_batch(self.model_name, len(texts))
+        return await self._scheduler.run(
+            lambda: self._embed_model.aget_text_embedding_batch(texts),
+            sum(estimate_tokens(text) for text in texts),
+        )
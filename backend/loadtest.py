@@ -0,0 +1,450 @@
+"""Load generator that replays the /query websocket protocol with many simulated analysts.
+
+Each simulated analyst opens `/query`, sends a company name and answers
+`input_required_company_details` and `input_required_gri_topics` with scripted
+yes/no responses after a random think time, until the final `un_sdg_list`
+arrives. Concurrency is ramped up in stages; in every stage each analyst starts
+a new session as soon as the previous one ends, until the stage is over.
+
+Per stage it reports:
+- session throughput (completed sessions per minute)
+- session duration and per-message latency percentiles
+- failure rate (error messages, dropped connections, timeouts)
+- event loop lag of the backend (from its /metrics) and of the generator itself
+
+A stage is marked saturated when throughput grows less than 10% over the
+previous stage, more than 1% of its sessions fail, or its p99 session duration
+doubles against the first stage. The last unsaturated stage is the number of
+concurrent sessions the backend sustains.
+
+Point it at a running backend, or let it start one wired to the fakes in
+fakes.py (FAKE_MODELS=1 and a local Tavily stub) with `--spawn-backend`.
+Before the first stage, every simulated company gets fake reports uploaded
+through /upload, and the run waits until they are indexed. This always
+happens with `--spawn-backend`, and with `--seed-docs` for a `--url` backend.
+A spawned backend runs in a scratch directory that is removed afterwards, so
+its uploads, indexes and caches never reach the real data/ and storage/.
+
+    python loadtest.py --spawn-backend --stages 1,2,4,8,16 --stage-duration 120 --output storage/loadtests/report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+from prometheus_client.parser import text_string_to_metric_families
+
+from fakes import fake_text
+
+
+DEFAULT_URL = "http://127.0.0.1:8000"
+DEFAULT_OUTPUT = "storage/loadtests/loadtest.json"
+LAG_METRIC = "esg_event_loop_lag_seconds"
+# Saturation thresholds, see the module docstring.
+MIN_THROUGHPUT_GAIN = 0.10
+MAX_FAILURE_RATE = 0.01
+MAX_DURATION_GROWTH = 2.0
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class SessionResult:
+    ok: bool
+    seconds: float
+    error: Optional[str] = None
+    # Seconds from the previous send or receive to each message, by message type.
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+
+
+def percentiles(values: List[float]) -> dict:
+    """p50/p90/p99 and max by nearest rank, or an empty dict without values."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+    return {"count": len(ordered), "p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "max": round(ordered[-1], 4)}
+
+
+def company_name(args: argparse.Namespace, i: int) -> str:
+    return f"{args.company_prefix} {i % args.companies}"
+
+
+def parse_answers(value: str) -> List[str]:
+    answers = [answer.strip().lower() for answer in value.split(",") if answer.strip()]
+    for answer in answers:
+        if answer not in ("yes", "no"):
+            raise argparse.ArgumentTypeError(f"Expected yes or no, got {answer!r}")
+    return answers
+
+
+class Analyst:
+    """One simulated analyst running /query sessions back to back."""
+
+    def __init__(self, ws_url: str, args: argparse.Namespace, worker: int) -> None:
+        self.ws_url = ws_url
+        self.args = args
+        self.worker = worker
+        self.sessions = 0
+
+    def answer(self, input_type: str, asked: int) -> dict:
+        # Questions beyond the script are accepted so every session ends.
+        script = self.args.company_answers if input_type == "input_required_company_details" else self.args.topic_answers
+        answer = script[asked] if asked < len(script) else "yes"
+        if answer == "no":
+            return {"response": "no", "comment": self.args.comment}
+        return {"response": "yes"}
+
+    async def run_session(self, rng: random.Random) -> SessionResult:
+        name = company_name(self.args, self.worker + self.sessions)
+        latencies: Dict[str, List[float]] = {}
+        asked: Dict[str, int] = {}
+        start = last = time.perf_counter()
+        async with websockets.connect(f"{self.ws_url}/query", max_size=None, open_timeout=30) as ws:
+            await ws.send(json.dumps({"company_name": name}))
+            last = time.perf_counter()
+            async for raw in ws:
+                now = time.perf_counter()
+                message = json.loads(raw)
+                message_type = message.get("type", "unknown")
+                latencies.setdefault(message_type, []).append(now - last)
+                last = now
+                if message_type == "error":
+                    return SessionResult(False, now - start, f"error: {message.get('payload')}", latencies)
+                if message_type == "un_sdg_list":
+                    return SessionResult(True, now - start, latencies=latencies)
+                if message_type.startswith("input_required_"):
+                    await asyncio.sleep(rng.uniform(self.args.think_min, self.args.think_max))
+                    response = self.answer(message_type, asked.get(message_type, 0))
+                    asked[message_type] = asked.get(message_type, 0) + 1
+                    await ws.send(json.dumps(response))
+                    last = time.perf_counter()
+        return SessionResult(False, time.perf_counter() - start, "connection closed before un_sdg_list", latencies)
+
+    async def run(self, deadline: float, results: List[SessionResult]) -> None:
+        while time.perf_counter() < deadline:
+            rng = random.Random(f"{self.args.seed}-{self.worker}-{self.sessions}")
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self.run_session(rng), self.args.session_timeout)
+            except asyncio.TimeoutError:
+                result = SessionResult(False, time.perf_counter() - start, "timeout")
+            except Exception as e:
+                result = SessionResult(False, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            self.sessions += 1
+            results.append(result)
+            if not result.ok:
+                print(f"> analyst {self.worker}: {result.error}")
+
+
+async def monitor_client_lag(samples: List[float], interval: float = 0.1) -> None:
+    """Lag of the generator's own loop; if high, the generator is the bottleneck."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+async def scrape_lag(client: httpx.AsyncClient) -> Optional[dict]:
+    """Cumulative buckets, sum and count of the backend's event loop lag histogram."""
+    try:
+        response = await client.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"> Could not scrape /metrics: {e}")
+        return None
+    for family in text_string_to_metric_families(response.text):
+        if family.name != LAG_METRIC:
+            continue
+        histogram = {"buckets": {}, "sum": 0.0, "count": 0.0}
+        for sample in family.samples:
+            if sample.name.endswith("_bucket"):
+                histogram["buckets"][float(sample.labels["le"])] = sample.value
+            elif sample.name.endswith("_sum"):
+                histogram["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                histogram["count"] = sample.value
+        return histogram
+    return None
+
+
+def lag_between(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Mean and p99 upper bound of the backend's loop lag between two scrapes."""
+    if not before or not after:
+        return {}
+    count = after["count"] - before["count"]
+    if count <= 0:
+        return {}
+    p99 = None
+    for bound in sorted(after["buckets"]):
+        if after["buckets"][bound] - before["buckets"].get(bound, 0) >= 0.99 * count:
+            p99 = bound
+            break
+    return {"samples": int(count), "mean": round((after["sum"] - before["sum"]) / count, 4), "p99_le": p99}
+
+
+async def run_stage(concurrency: int, ws_url: str, client: httpx.AsyncClient, args: argparse.Namespace) -> dict:
+    print(f"\n> Stage: {concurrency} concurrent sessions for {args.stage_duration:.0f}s\n")
+    results: List[SessionResult] = []
+    client_lag: List[float] = []
+    lag_task = asyncio.create_task(monitor_client_lag(client_lag))
+    lag_before = await scrape_lag(client)
+    start = time.perf_counter()
+    analysts = [Analyst(ws_url, args, worker) for worker in range(concurrency)]
+    # Staggered starts, so sessions do not all hit the same step at once.
+    tasks = []
+    for analyst in analysts:
+        tasks.append(asyncio.create_task(analyst.run(start + args.stage_duration, results)))
+        await asyncio.sleep(args.ramp_interval)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    lag_after = await scrape_lag(client)
+    lag_task.cancel()
+
+    completed = [result for result in results if result.ok]
+    failures: Dict[str, int] = {}
+    for result in results:
+        if not result.ok:
+            reason = result.error.split(":")[0]
+            failures[reason] = failures.get(reason, 0) + 1
+    message_latencies: Dict[str, List[float]] = {}
+    for result in results:
+        for message_type, values in result.latencies.items():
+            message_latencies.setdefault(message_type, []).extend(values)
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 1),
+        "sessions": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "failure_rate": round((len(results) - len(completed)) / max(1, len(results)), 4),
+        "failures": failures,
+        "sessions_per_minute": round(len(completed) / elapsed * 60, 2),
+        "session_seconds": percentiles([result.seconds for result in completed]),
+        "message_seconds": {name: percentiles(values) for name, values in sorted(message_latencies.items())},
+        "backend_loop_lag": lag_between(lag_before, lag_after),
+        "client_loop_lag": percentiles(client_lag),
+    }
+
+
+def find_saturation(stages: List[dict]) -> dict:
+    """The first stage that stops scaling, and the last one that still did."""
+    sustained = None
+    for i, stage in enumerate(stages):
+        reasons = []
+        if stage["failure_rate"] > MAX_FAILURE_RATE:
+            reasons.append(f"{stage['failure_rate']:.1%} of sessions failed")
+        if i > 0 and stage["concurrency"] > stages[i - 1]["concurrency"]:
+            previous = stages[i - 1]["sessions_per_minute"]
+            if stage["sessions_per_minute"] < previous * (1 + MIN_THROUGHPUT_GAIN):
+                reasons.append(f"throughput {stage['sessions_per_minute']}/min vs {previous}/min")
+        first_p99 = stages[0]["session_seconds"].get("p99")
+        p99 = stage["session_seconds"].get("p99")
+        if i > 0 and first_p99 and p99 and p99 > first_p99 * MAX_DURATION_GROWTH:
+            reasons.append(f"p99 session {p99}s vs {first_p99}s")
+        if reasons:
+            return {"max_sustained_concurrency": sustained, "saturated_at": stage["concurrency"], "reasons": reasons}
+        sustained = stage["concurrency"]
+    return {"max_sustained_concurrency": sustained, "saturated_at": None, "reasons": []}
+
+
+def print_stage(stage: dict) -> None:
+    session = stage["session_seconds"]
+    backend_lag = stage["backend_loop_lag"]
+    print(
+        f"> {stage['concurrency']:>4} sessions: {stage['completed']} completed, {stage['failed']} failed, "
+        f"{stage['sessions_per_minute']}/min, session p50 {session.get('p50')}s p99 {session.get('p99')}s, "
+        f"backend lag mean {backend_lag.get('mean')}s p99 <= {backend_lag.get('p99_le')}s, "
+        f"client lag p99 {stage['client_loop_lag'].get('p99')}s"
+    )
+    for name, values in stage["message_seconds"].items():
+        if name in ("progress", "token"):
+            continue
+        print(f">      {name}: p50 {values['p50']}s p90 {values['p90']}s p99 {values['p99']}s")
+
+
+def start_process(command: List[str], env: dict, log_path: str, cwd: str = BACKEND_DIR) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1)
+    raise RuntimeError(f"Backend not ready after {timeout:.0f}s")
+
+
+def make_work_dir() -> str:
+    """Scratch working directory for a spawned backend, sharing only the GRI standards."""
+    work_dir = tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(os.path.join(work_dir, "data"))
+    os.symlink(os.path.join(BACKEND_DIR, "data", "gri"), os.path.join(work_dir, "data", "gri"))
+    return work_dir
+
+
+def spawn_backend(args: argparse.Namespace, log_dir: str, work_dir: str) -> List[subprocess.Popen]:
+    """Start a Tavily stub and a backend on fake models, the backend in `work_dir`; returns both processes."""
+    stub = start_process(
+        [sys.executable, "fakes.py", "--port", str(args.stub_port), "--latency", str(args.search_latency)],
+        dict(os.environ),
+        os.path.join(log_dir, "tavily_stub.log"),
+    )
+    env = {
+        **os.environ,
+        "FAKE_MODELS": "1",
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_EMBED_LATENCY": str(args.embed_latency),
+        "TAVILY_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+        "TAVILY_API_KEY": "loadtest",
+        # Every session searches again, as distinct companies would at the reporting peak.
+        "SEARCH_CACHE_TTL": os.getenv("SEARCH_CACHE_TTL", "0"),
+    }
+    backend = start_process(
+        [
+            sys.executable, "-m", "uvicorn", "run:app", "--app-dir", BACKEND_DIR,
+            "--host", "127.0.0.1", "--port", str(args.backend_port),
+        ],
+        env,
+        os.path.join(log_dir, "backend.log"),
+        cwd=work_dir,
+    )
+    return [stub, backend]
+
+
+async def seed_company_docs(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+    """Upload fake reports for every simulated company and wait until they are indexed."""
+    names = [company_name(args, i) for i in range(args.companies)]
+    print(f"\n> Uploading {args.docs_per_company} reports for each of {len(names)} companies\n")
+    for name in names:
+        files = [
+            ("files", (f"report_{i}.txt", fake_text(f"{name} report {i}", args.words_per_doc).encode("utf-8")))
+            for i in range(args.docs_per_company)
+        ]
+        response = await client.post("/upload", data={"company_name": name}, files=files, timeout=120)
+        response.raise_for_status()
+    for name in names:
+        while True:
+            response = await client.get(f"/upload/{name}/status")
+            # 404: the reports were already there from an earlier run, so nothing was ingested.
+            if response.status_code == 404:
+                break
+            response.raise_for_status()
+            status = response.json()
+            if status["status"] == "failed":
+                raise RuntimeError(f"Ingestion of {name} failed: {status['error']}")
+            if status["status"] == "completed":
+                break
+            await asyncio.sleep(0.5)
+
+
+async def run_loadtest(args: argparse.Namespace) -> dict:
+    output = os.path.abspath(args.output)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    base_url = f"http://127.0.0.1:{args.backend_port}" if args.spawn_backend else args.url.rstrip("/")
+    ws_url = "ws" + base_url[len("http"):]
+    processes: List[subprocess.Popen] = []
+    work_dir = None
+    stages = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        try:
+            if args.spawn_backend:
+                print(f"\n> Starting a backend on fake models at {base_url}, logs in {os.path.dirname(output)}\n")
+                work_dir = make_work_dir()
+                processes = spawn_backend(args, os.path.dirname(output), work_dir)
+                await wait_until_ready(client, processes[-1], args.startup_timeout)
+            if args.spawn_backend or args.seed_docs:
+                await seed_company_docs(client, args)
+            for concurrency in args.stages:
+                stage = await run_stage(concurrency, ws_url, client, args)
+                stages.append(stage)
+                print_stage(stage)
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait()
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "target": base_url,
+        "fake_backend": args.spawn_backend,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "options": {key: value for key, value in vars(args).items() if key != "output"},
+        "stages": stages,
+        "saturation": find_saturation(stages),
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    saturation = report["saturation"]
+    if saturation["saturated_at"] is None:
+        print(f"\n> No saturation up to {args.stages[-1]} concurrent sessions\n")
+    else:
+        print(
+            f"\n> Saturated at {saturation['saturated_at']} concurrent sessions "
+            f"({'; '.join(saturation['reasons'])}), sustained {saturation['max_sustained_concurrency']}\n"
+        )
+    print(f"\n> Report written to {output}\n")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=DEFAULT_URL, help="Backend to test, ignored with --spawn-backend")
+    parser.add_argument("--stages", type=lambda value: [int(n) for n in value.split(",")], default=[1, 2, 4, 8, 16],
+                        help="Concurrent sessions per stage, comma separated")
+    parser.add_argument("--stage-duration", type=float, default=120.0, help="Seconds new sessions start in each stage")
+    parser.add_argument("--ramp-interval", type=float, default=0.5, help="Seconds between analyst starts in a stage")
+    parser.add_argument("--session-timeout", type=float, default=1200.0)
+    parser.add_argument("--think-min", type=float, default=1.0, help="Shortest think time before an answer, in seconds")
+    parser.add_argument("--think-max", type=float, default=5.0)
+    parser.add_argument("--company-answers", type=parse_answers, default=["yes"],
+                        help="Answers to the company details questions in order, e.g. no,yes")
+    parser.add_argument("--topic-answers", type=parse_answers, default=["yes"],
+                        help="Answers to the GRI topics questions in order")
+    parser.add_argument("--comment", default="Please focus on the company's main business segment.",
+                        help="Comment sent with a no")
+    parser.add_argument("--companies", type=int, default=50, help="Distinct company names to cycle through")
+    parser.add_argument("--company-prefix", default="Loadtest Company")
+    parser.add_argument("--seed-docs", action="store_true",
+                        help="Upload fake reports for the companies first; always done with --spawn-backend")
+    parser.add_argument("--docs-per-company", type=int, default=2)
+    parser.add_argument("--words-per-doc", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the think times")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--spawn-backend", action="store_true", help="Start a backend on fake models and a Tavily stub")
+    parser.add_argument("--backend-port", type=int, default=8100)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=600.0, help="Includes building the fake GRI index")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Fake embedding seconds per request")
+    parser.add_argument("--search-latency", type=float, default=0.5, help="Tavily stub seconds per search")
+    args = parser.parse_args()
+    asyncio.run(run_loadtest(args))
+
+
+if __name__ == "__main__":
+    main()
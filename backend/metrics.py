@@ -0,0 +1,238 @@
+"""Prometheus metrics and per-run timing summaries.
+
+Workflow classes decorated with `instrument_steps` record the wall time of
+every step. LLM calls, token counts, embedding batches, web searches and cache
+lookups are recorded where they happen (ScheduledLLM, ScheduledEmbedding,
+TavilyClient and the caches) and labelled with the step that made them.
+
+Besides the process-wide Prometheus metrics served on /metrics, the same
+numbers are summed per run: start a run with `start_run()` before calling
+`workflow.run(...)` and every step task of that run, including nested
+workflows, adds to the RunMetrics it returns.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+STEP_SECONDS = Histogram(
+    "esg_step_seconds",
+    "Wall time of workflow steps",
+    ["workflow", "step"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+RUN_SECONDS = Histogram(
+    "esg_run_seconds",
+    "Wall time of analysis runs",
+    buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+LLM_CALLS = Counter("esg_llm_calls_total", "LLM calls", ["model", "step"])
+LLM_TOKENS = Counter("esg_llm_tokens_total", "LLM tokens", ["model", "step", "kind"])
+LLM_SECONDS = Histogram("esg_llm_call_seconds", "Latency of LLM calls", ["model"])
+EMBEDDING_BATCH_SIZE = Histogram(
+    "esg_embedding_batch_size",
+    "Texts per embedding request sent to the model",
+    ["model", "step"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+SEARCH_CALLS = Counter("esg_search_calls_total", "Web searches sent to Tavily", ["step"])
+CACHE_LOOKUPS = Counter("esg_cache_lookups_total", "Cache lookups", ["cache", "result"])
+ACTIVE_SESSIONS = Gauge("esg_active_sessions", "Open /query websocket sessions")
+EVENT_LOOP_LAG = Histogram(
+    "esg_event_loop_lag_seconds",
+    "How late the event loop wakes a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+NO_STEP = "none"
+# Per-step counts summed into the run totals.
+COUNT_KEYS = (
+    "llm_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "embedding_requests",
+    "embedded_texts",
+    "search_calls",
+)
+
+current_step: contextvars.ContextVar[str] = contextvars.ContextVar("current_step", default=NO_STEP)
+
+
+class RunMetrics:
+    """Totals of one analysis run, returned by `summary()` with the run's result."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.steps: Dict[str, dict] = {}
+        self.caches: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _step(self, step: str) -> dict:
+        return self.steps.setdefault(step, {"calls": 0, "seconds": 0.0, **{key: 0 for key in COUNT_KEYS}})
+
+    def add(self, step: str, **values: float) -> None:
+        with self._lock:
+            totals = self._step(step)
+            for key, value in values.items():
+                totals[key] += value
+
+    def add_cache_lookups(self, cache: str, hits: int, misses: int) -> None:
+        with self._lock:
+            totals = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            totals["hits"] += hits
+            totals["misses"] += misses
+
+    def finish(self) -> None:
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            RUN_SECONDS.observe(self.finished - self.started)
+
+    def summary(self) -> dict:
+        with self._lock:
+            steps = {name: dict(values) for name, values in self.steps.items()}
+            caches = {
+                name: {**values, "hit_rate": values["hits"] / max(1, values["hits"] + values["misses"])}
+                for name, values in self.caches.items()
+            }
+        totals = {key: sum(values[key] for values in steps.values()) for key in COUNT_KEYS}
+        end = self.finished or time.perf_counter()
+        return {
+            "total_seconds": round(end - self.started, 3),
+            **totals,
+            "caches": caches,
+            "steps": {
+                name: {**values, "seconds": round(values["seconds"], 3)}
+                for name, values in sorted(steps.items(), key=lambda item: -item[1]["seconds"])
+            },
+        }
+
+
+current_run: contextvars.ContextVar[Optional[RunMetrics]] = contextvars.ContextVar("current_run", default=None)
+
+
+def start_run() -> RunMetrics:
+    """Collect the metrics of the run started next in this task."""
+    run = RunMetrics()
+    current_run.set(run)
+    return run
+
+
+def _add_to_run(**values: float) -> None:
+    run = current_run.get()
+    if run is not None:
+        run.add(current_step.get(), **values)
+
+
+def record_llm_call(model: str, prompt_tokens: int, completion_tokens: int, seconds: float) -> None:
+    step = current_step.get()
+    LLM_CALLS.labels(model, step).inc()
+    LLM_TOKENS.labels(model, step, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model, step, "completion").inc(completion_tokens)
+    LLM_SECONDS.labels(model).observe(seconds)
+    _add_to_run(llm_calls=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def record_embedding_batch(model: str, num_texts: int) -> None:
+    EMBEDDING_BATCH_SIZE.labels(model, current_step.get()).observe(num_texts)
+    _add_to_run(embedding_requests=1, embedded_texts=num_texts)
+
+
+def record_search_call() -> None:
+    SEARCH_CALLS.labels(current_step.get()).inc()
+    _add_to_run(search_calls=1)
+
+
+def record_cache_lookups(cache: str, hits: int, misses: int) -> None:
+    if hits:
+        CACHE_LOOKUPS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, "miss").inc(misses)
+    run = current_run.get()
+    if run is not None:
+        run.add_cache_lookups(cache, hits, misses)
+
+
+async def monitor_event_loop_lag(interval: float = 0.25) -> None:
+    """Record event loop lag until cancelled; run it as a task on the server's loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def _timed(workflow: str, step: str, func):
+    label = f"{workflow}.{step}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_step.set(label)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            current_step.reset(token)
+            STEP_SECONDS.labels(workflow, step).observe(seconds)
+            run = current_run.get()
+            if run is not None:
+                run.add(label, calls=1, seconds=seconds)
+
+    return wrapper
+
+
+def instrument_steps(cls):
+    """Class decorator timing every `@step` of a workflow class.
+
+    functools.wraps copies the step config set by `@step`, so the workflow
+    still finds and validates the wrapped steps. The config attribute is
+    `__step_config` in llama-index-core 0.11 and `_step_config` later on.
+    """
+    for name, value in list(vars(cls).items()):
+        if callable(value) and (hasattr(value, "__step_config") or hasattr(value, "_step_config")):
+            setattr(cls, name, _timed(cls.__name__, name, value))
+    return cls
+
+
+class SchedulerCollector:
+    """Reports the LLM and embedding scheduler queues at scrape time."""
+
+    def describe(self):
+        # Without describe() the registry calls collect() on registration, before llm_scheduler is importable.
+        return []
+
+    def collect(self):
+        from llm_scheduler import scheduler_stats
+
+        queue_depth = GaugeMetricFamily(
+            "esg_scheduler_queue_depth", "Model calls waiting for admission", labels=["model", "priority"]
+        )
+        in_flight = GaugeMetricFamily("esg_scheduler_in_flight", "Model calls in flight", labels=["model"])
+        limit = GaugeMetricFamily(
+            "esg_scheduler_concurrency_limit", "Current adaptive concurrency limit", labels=["model"]
+        )
+        rate_limited = CounterMetricFamily(
+            "esg_scheduler_rate_limited", "Model calls rejected with 429", labels=["model"]
+        )
+        for stats in scheduler_stats():
+            for priority, depth in stats["queued"].items():
+                queue_depth.add_metric([stats["name"], priority], depth)
+            in_flight.add_metric([stats["name"]], stats["in_flight"])
+            limit.add_metric([stats["name"]], stats["concurrency_limit"])
+            rate_limited.add_metric([stats["name"]], stats["rate_limited"])
+        yield from (queue_depth, in_flight, limit, rate_limited)
+
+
+REGISTRY.register(SchedulerCollector())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """The Prometheus exposition of all metrics and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
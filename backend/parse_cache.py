@@ -0,0 +1,178 @@
+"""Parsed text of documents, cached by file content hash.
+
+Text extraction is the slow part of indexing a company's reports. ParseCache
+keeps the text of every page, zlib-compressed, with its page metadata in
+SQLite, keyed by the file's sha256. A file is extracted once, however often it
+is re-indexed, renamed or uploaded for another company. File metadata (name,
+path, dates) is read from the file again on load, so it matches where the
+content lives now.
+
+`load_documents` extracts the files missing from the cache in a process pool
+of DOC_PARSE_WORKERS processes, so a cold folder of many PDFs scales with cores.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import Document
+
+from metrics import record_cache_lookups
+
+
+DEFAULT_PARSE_CACHE_PATH = "storage/parse_cache.sqlite"
+
+
+def available_cores() -> int:
+    # In a container this can be fewer than os.cpu_count().
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+DOC_PARSE_WORKERS = int(os.getenv("DOC_PARSE_WORKERS") or available_cores())
+
+_cache: Optional["ParseCache"] = None
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def parse_file(path: str) -> List[Document]:
+    """Extract one file into per-page documents; runs inside the process pool."""
+    return SimpleDirectoryReader(input_files=[path]).load_data()
+
+
+class ParseCache:
+    """Per-page text and metadata of parsed files in SQLite, keyed by content hash."""
+
+    def __init__(self, path: str = DEFAULT_PARSE_CACHE_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                sha256 TEXT PRIMARY KEY,
+                num_pages INTEGER NOT NULL,
+                excluded_embed_metadata_keys TEXT NOT NULL,
+                excluded_llm_metadata_keys TEXT NOT NULL,
+                parsed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                sha256 TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (sha256, page)
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, sha256: str, path: str) -> Optional[List[Document]]:
+        """The cached pages of a file as documents, with file metadata taken from `path`."""
+        with self._lock:
+            file_row = self._conn.execute(
+                "SELECT excluded_embed_metadata_keys, excluded_llm_metadata_keys FROM files WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+            if file_row is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT text, metadata FROM pages WHERE sha256 = ? ORDER BY page", (sha256,)
+            ).fetchall()
+        file_metadata = default_file_metadata_func(path)
+        return [
+            Document(
+                text=zlib.decompress(text).decode("utf-8"),
+                metadata={**json.loads(metadata), **file_metadata},
+                excluded_embed_metadata_keys=json.loads(file_row[0]),
+                excluded_llm_metadata_keys=json.loads(file_row[1]),
+            )
+            for text, metadata in rows
+        ]
+
+    def put(self, sha256: str, documents: List[Document]) -> None:
+        """Store the pages of a file, without the file metadata that `get` reads again."""
+        file_keys = set(default_file_metadata_func(documents[0].metadata["file_path"])) if documents else set()
+        pages = [
+            (
+                sha256,
+                page,
+                zlib.compress(document.text.encode("utf-8")),
+                json.dumps({key: value for key, value in document.metadata.items() if key not in file_keys}),
+            )
+            for page, document in enumerate(documents)
+        ]
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE sha256 = ?", (sha256,))
+            self._conn.executemany("INSERT INTO pages VALUES (?, ?, ?, ?)", pages)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (
+                    sha256,
+                    len(documents),
+                    json.dumps(documents[0].excluded_embed_metadata_keys if documents else []),
+                    json.dumps(documents[0].excluded_llm_metadata_keys if documents else []),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+
+def get_parse_cache() -> ParseCache:
+    global _cache
+    if _cache is None:
+        _cache = ParseCache()
+    return _cache
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the server process runs threads that a fork would copy mid-lock.
+            _pool = ProcessPoolExecutor(max_workers=DOC_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def load_documents(paths: Dict[str, str], cache: Optional[ParseCache] = None) -> Dict[str, List[Document]]:
+    """Documents of each {sha256: path}, from the cache or extracted in the process pool."""
+    cache = cache or get_parse_cache()
+    documents: Dict[str, List[Document]] = {}
+    for sha256, path in paths.items():
+        cached = cache.get(sha256, path)
+        if cached is not None:
+            documents[sha256] = cached
+    to_parse = {sha256: path for sha256, path in paths.items() if sha256 not in documents}
+    record_cache_lookups("parse", len(documents), len(to_parse))
+    if not to_parse:
+        return documents
+
+    print(f"\n> Extracting text from {len(to_parse)} files, {len(documents)} cached\n")
+    if len(to_parse) == 1 or DOC_PARSE_WORKERS <= 1:
+        parsed = map(parse_file, to_parse.values())
+    else:
+        parsed = _get_pool().map(parse_file, to_parse.values())
+    for sha256, file_documents in zip(to_parse, parsed):
+        cache.put(sha256, file_documents)
+        documents[sha256] = file_documents
+    return documents
@@ -0,0 +1,125 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from gri_standards import extract_gri_code, parse_gri_file_name
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Node metadata holding the embedding similarity when a retriever's scores are not similarities.
+VECTOR_SCORE_KEY = "vector_score"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25:
+    """Okapi BM25 term statistics for a corpus of tokenized documents."""
+
+    def __init__(self, corpus: Iterable[List[str]], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.doc_freq: Counter = Counter()
+        self.num_docs = 0
+        total_length = 0
+        for tokens in corpus:
+            self.doc_freq.update(set(tokens))
+            self.num_docs += 1
+            total_length += len(tokens)
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs else 0.0
+
+    def idf(self, term: str) -> float:
+        df = self.doc_freq.get(term, 0)
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, query_tokens: List[str], doc_tokens: List[str]) -> float:
+        if not doc_tokens:
+            return 0.0
+        term_freq = Counter(doc_tokens)
+        norm = self.k1 * (1 - self.b + self.b * len(doc_tokens) / (self.avg_doc_length or 1.0))
+        score = 0.0
+        for term in set(query_tokens):
+            tf = term_freq.get(term)
+            if tf:
+                score += self.idf(term) * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+
+def _min_max(values: List[float]) -> List[float]:
+    low, high = min(values), max(values)
+    if high == low:
+        return [1.0 if high > 0 else 0.0] * len(values)
+    return [(value - low) / (high - low) for value in values]
+
+
+def _vector_score(node: NodeWithScore) -> float:
+    score = node.node.metadata.get(VECTOR_SCORE_KEY, node.score)
+    return score or 0.0
+
+
+class HybridRerank(BaseNodePostprocessor):
+    """In-process reranker combining BM25, embedding similarity and a GRI code match.
+
+    Lexical and vector scores are min-max normalized over the candidates and
+    weighted, and nodes whose source PDF is the GRI standard named in the query
+    get a fixed bonus. The vector score is the node's VECTOR_SCORE_KEY metadata
+    when set, so fused retrieval scores, which already count keyword matches,
+    are not weighted in a second time. No model or network calls are made.
+    """
+
+    top_n: int = Field(default=3, description="Number of nodes to return.")
+    lexical_weight: float = Field(default=0.4)
+    vector_weight: float = Field(default=0.6)
+    code_match_bonus: float = Field(default=0.5)
+    bm25: Optional[BM25] = Field(
+        default=None,
+        description="Corpus-wide term statistics; candidates are used when missing.",
+    )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HybridRerank"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Query bundle must be provided.")
+        if not nodes:
+            return []
+
+        query_tokens = tokenize(query_bundle.query_str)
+        doc_tokens = [
+            tokenize(node.node.get_content(metadata_mode=MetadataMode.NONE)) for node in nodes
+        ]
+        bm25 = self.bm25 or BM25(doc_tokens)
+        lexical = _min_max([bm25.score(query_tokens, tokens) for tokens in doc_tokens])
+        vector = _min_max([_vector_score(node) for node in nodes])
+
+        query_code = extract_gri_code(query_bundle.query_str, require_prefix=True)
+        code_cache: Dict[str, Optional[str]] = {}
+
+        def node_code(node: NodeWithScore) -> Optional[str]:
+            file_name = node.node.metadata.get("file_name", "")
+            if file_name not in code_cache:
+                standard = parse_gri_file_name(file_name)
+                code_cache[file_name] = standard.code if standard else None
+            return code_cache[file_name]
+
+        reranked = []
+        for node, lexical_score, vector_score in zip(nodes, lexical, vector):
+            score = self.lexical_weight * lexical_score + self.vector_weight * vector_score
+            if query_code is not None and node_code(node) == query_code:
+                score += self.code_match_bonus
+            reranked.append(NodeWithScore(node=node.node, score=score))
+
+        reranked.sort(key=lambda node: node.score, reverse=True)
+        return reranked[: self.top_n]
@@ -1,26 +1,80 @@
-import os
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, Form
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import os
-import shutil
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
 import asyncio
 from dotenv import load_dotenv
-from llama_index.utils.workflow import draw_all_possible_flows
-from llama_index.llms.nvidia import NVIDIA
-from llama_index.embeddings.nvidia import NVIDIAEmbedding
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
 
+load_dotenv()
 
-from workflows.esg_materiality_analysis_workflow import *
-from llama_index.core.workflow.handler import WorkflowHandler
-from openinference.instrumentation.llama_index import LlamaIndexInstrumentor
-from phoenix.otel import register
-from llama_index.core import Settings
+from startup import WARM_UP, startup_timer
 
+with startup_timer.measure("fastapi", "import"):
+    from fastapi import Body, FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Form
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, Response
 
-app = FastAPI()
+# Provider and tracing integrations are not imported here, app_context imports the configured ones.
+with startup_timer.measure("backend_modules", "import"):
+    from workflows.esg_materiality_analysis_workflow import ESGMaterialityAnalysisWorkflow
+    from llama_index.core.workflow.handler import WorkflowHandler
+    from app_context import AppContext, create_app_context, close_app_context, warm_up
+    from checkpoints import CheckpointStore
+    from batch import BATCH_ID_RE, DEFAULT_BATCH_CONCURRENCY, BatchCompany, ResultWriter, start_batch
+    from llm_scheduler import scheduler_stats
+    from metrics import ACTIVE_SESSIONS, monitor_event_loop_lag, render_metrics, start_run
+    from jobs import JobManager, JobNotFoundError, JobStateError, COMPLETED
+    from session import INPUT_REQUIRED_TYPES, apply_user_response, event_to_message
+    from uploads import REJECTED, REPLACED, STORED, IngestionManager, UploadSizeLimit, store_uploads
+
+
+async def sweep_checkpoints(checkpoints: CheckpointStore, interval: float = 3600) -> None:
+    """Drop checkpoints of sessions that errored or disconnected and were never resumed."""
+    while True:
+        removed = await asyncio.to_thread(checkpoints.sweep)
+        if removed:
+            print(f"\n> Removed {removed} expired checkpoints\n")
+        await asyncio.sleep(interval)
+
+
+async def warm_up_app(app_context: AppContext) -> None:
+    try:
+        await warm_up(app_context)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        startup_timer.mark_ready(error=str(e))
+    else:
+        startup_timer.mark_ready()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients, tracing and the GRI index are set up once and shared by all sessions.
+    app.state.app_context = await create_app_context()
+    app.state.checkpoints = CheckpointStore()
+    checkpoint_sweeper = asyncio.create_task(sweep_checkpoints(app.state.checkpoints))
+    app.state.job_manager = JobManager(app.state.app_context, checkpoints=app.state.checkpoints)
+    app.state.job_manager.resume_jobs()
+    app.state.batches = {}
+    app.state.batch_tasks = {}
+    app.state.ingestions = IngestionManager(app.state.app_context.embed_model)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    # Requests are served during the warm-up; /ready reports 503 until it is done.
+    warm_up_task = asyncio.create_task(warm_up_app(app.state.app_context)) if WARM_UP else None
+    if warm_up_task is None:
+        startup_timer.mark_ready()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    lag_monitor.cancel()
+    checkpoint_sweeper.cancel()
+    for task in app.state.batch_tasks.values():
+        task.cancel()
+    await asyncio.gather(*app.state.batch_tasks.values(), return_exceptions=True)
+    await app.state.job_manager.close()
+    await app.state.ingestions.close()
+    await close_app_context(app.state.app_context)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS
 app.add_middleware(
@@ -30,138 +84,282 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allows all headers
 )
+# Refuse oversized uploads before their body is spooled to disk.
+app.add_middleware(UploadSizeLimit)
 
 @app.websocket("/query")
 async def query_endpoint(websocket: WebSocket):
     await websocket.accept()
-    load_dotenv()
-
-    client_headers = os.getenv("PHOENIX_CLIENT_HEADERS")
-    if client_headers and client_headers.startswith("api_key="):
-        tracer_provider = register(
-            project_name="esg-insight-ai-app", 
-            verbose=False,
-            batch=True
-            )
-        LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider,skip_dep_check=True)
-
-
-    openai_key = os.getenv("OPENAI_API_KEY")
-    if openai_key and len(openai_key) > 1:
-        llm = OpenAI(model="gpt-4o")
-        print("OpenAI")
-    else:
-        llm = NVIDIA(model="meta/llama-3.2-70b-instruct")
-    
-    embed_model = NVIDIAEmbedding(model="NV-Embed-QA", truncate="END")
-
-    Settings.llm = llm
-    Settings.embed_model = embed_model
-    workflow = ESGMaterialityAnalysisWorkflow(llm=llm,embed_model=embed_model, timeout=120.0 * 10)
+    app_context: AppContext = websocket.app.state.app_context
+    checkpoints: CheckpointStore = websocket.app.state.checkpoints
+    ACTIVE_SESSIONS.inc()
 
     try:
         query_data = await websocket.receive_json()
-        
-        handler: WorkflowHandler = workflow.run(company_name=query_data["company_name"])
-        async for event in handler.stream_events():
 
-            if isinstance(event, ProgressEvent):
-                await websocket.send_json({
-                    "type": "progress",
-                    "payload": str(event.msg)
-                })
-
-            if isinstance(event,InputRequiredOnCompanyDetailsEvent):
-                await websocket.send_json({
-                    "type": "input_required_company_details",
-                    "payload": event.payload
-                })
-                response = await websocket.receive_json()
-                if response["response"].lower() == "yes":
-                    gics_sector = await handler.ctx.get("gics_sector")
-                    gics_industry_group = await handler.ctx.get("gics_industry_group")
-                    gics_industry = await handler.ctx.get("gics_industry")
-                    company_description = await handler.ctx.get("company_description")
-                    handler.ctx.send_event(CompanyDetailsAvailableEvent(gics_sector=gics_sector,gics_industry_group=gics_industry_group
-                                                                        ,gics_industry=gics_industry,company_description=company_description, response=response["response"].lower()))
-                elif response["response"].lower() == "no":
-                    company_name = await handler.ctx.get("company_name")
-                    handler.ctx.send_event(UserInputOnCompanyDetailsEvent(company_name = company_name, user_input=response["comment"], response=response["response"].lower()))
-            
-            if isinstance(event,CompanyDetailsAvailableEvent):
-                await websocket.send_json({
-                    "type": "company_details",
-                    "payload": event.to_json()
-                })
-            
-            if isinstance(event,GRITopicsAvailableEvent):
-                await websocket.send_json({
-                    "type": "gri_topics",
-                    "payload": event.gri_topics
-                })
-
-            if isinstance(event, InputRequiredOnMaterialityTopicsEvent):
-                await websocket.send_json({
-                    "type": "input_required_gri_topics",
-                    "payload": event.payload
-                })
+        # Sending back the session_id of an unfinished session resumes it from its checkpoint.
+        session_id = query_data.get("session_id")
+        checkpoint = checkpoints.load(session_id) if session_id else None
+        if checkpoint is None:
+            checkpoint = checkpoints.create(query_data["company_name"])
+        await websocket.send_json({
+            "type": "session",
+            "payload": {"session_id": checkpoint.run_id}
+        })
+
+        workflow = ESGMaterialityAnalysisWorkflow(
+            llm=app_context.llm,
+            embed_model=app_context.embed_model,
+            gri_index=app_context.gri_index,
+            gri_catalog=app_context.gri_catalog,
+            checkpoint=checkpoint,
+            timeout=120.0 * 10,
+        )
+        run_metrics = start_run()
+        handler: WorkflowHandler = workflow.run(company_name=checkpoint.get("company_name"))
+        async for event in handler.stream_events():
+            message = event_to_message(event)
+            if message is None:
+                continue
+            await websocket.send_json(message)
+            if message["type"] in INPUT_REQUIRED_TYPES:
                 response = await websocket.receive_json()
-                if response["response"].lower() == "yes":
-                    gri_topics = await handler.ctx.get("gri_topics")
-                    handler.ctx.send_event(GRITopicsAvailableEvent(gri_topics = gri_topics, response=response["response"].lower()))
-                elif response["response"].lower() == "no":
-                    handler.ctx.send_event(UserInputOnMaterialityTopicsEvent(user_input=response["comment"], response=response["response"].lower()))
-
-            if isinstance(event,TopicAssesmentAvailableEvent):
-                await websocket.send_json({
-                    "type": "topic_assesment",
-                    "payload": event.to_json()
-                })
+                await apply_user_response(handler, message["type"], response)
         
         result = await handler
+        checkpoints.delete(checkpoint.run_id)
+        run_metrics.finish()
         await websocket.send_json({
             "type": "un_sdg_list", 
-            "payload": result
+            "payload": result,
+            "timing": run_metrics.summary()
         })
 
     except Exception as e:
         print("ERROR: "+ str(e))
         await websocket.send_json({"type": "error", "payload": str(e)})
     finally:
+        ACTIVE_SESSIONS.dec()
         await websocket.close()
     
 
-@app.post("/upload")
-async def upload_files(
-    company_name: str = Form(...),  # Form data
-    files: List[UploadFile] = File(...)  # List of files
-):
+def get_job_or_404(job_manager: JobManager, job_id: str):
+    try:
+        return job_manager.get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+
+@app.post("/jobs")
+async def submit_job(request: Dict[str, str] = Body(...)):
+    """Start an analysis that keeps running when no client is connected."""
+    company_name = request.get("company_name")
+    if not company_name:
+        raise HTTPException(status_code=422, detail="company_name is required")
+    job = app.state.job_manager.submit(company_name)
+    return JSONResponse(status_code=202, content=job.summary())
+
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": app.state.job_manager.list_jobs()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return get_job_or_404(app.state.job_manager, job_id).summary()
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = get_job_or_404(app.state.job_manager, job_id)
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    return {"job_id": job.job_id, "company_name": job.company_name, "messages": job.messages, "result": job.result}
+
+
+@app.post("/jobs/{job_id}/respond")
+async def respond_to_job(job_id: str, response: Dict[str, str] = Body(...)):
+    """Answer a pending input_required_* prompt, e.g. {"response": "yes"}."""
+    job_manager: JobManager = app.state.job_manager
+    get_job_or_404(job_manager, job_id)
+    try:
+        await job_manager.respond(job_id, response)
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return job_manager.get(job_id).summary()
+
+
+@app.websocket("/jobs/{job_id}/stream")
+async def job_stream_endpoint(websocket: WebSocket, job_id: str, after: int = 0):
+    """Replay a job's messages from seq `after`, then follow it live.
+
+    The first message is {"type": "job", "payload": <job summary>}. Answers to
+    input_required_* messages can be sent on the socket at any time; detaching
+    leaves the job running.
+    """
+    await websocket.accept()
+    job_manager: JobManager = websocket.app.state.job_manager
+    try:
+        job = job_manager.get(job_id)
+    except JobNotFoundError:
+        await websocket.send_json({"type": "error", "payload": f"Job {job_id} not found"})
+        await websocket.close()
+        return
+
+    async def receive_responses():
+        while True:
+            response = await websocket.receive_json()
+            try:
+                await job_manager.respond(job_id, response)
+            except (JobStateError, ValueError) as e:
+                await websocket.send_json({"type": "error", "payload": str(e)})
+
+    receiver = asyncio.create_task(receive_responses())
     try:
-        # Define the path where the files will be saved
-        UPLOAD_DIRECTORY = f"data/company_docs/{company_name}"
-        os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+        await websocket.send_json({"type": "job", "payload": job.summary()})
+        async for message in job.stream(after=after):
+            await websocket.send_json(message)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+@app.post("/batches")
+async def submit_batch(request: Dict[str, Any] = Body(...)):
+    """Analyze a list of companies with all prompts auto-accepted.
+
+    `companies` holds names or {"company_name"} objects; their documents are
+    uploaded with POST /upload. Passing the batch_id of an earlier batch
+    resumes it, skipping companies already done.
+    """
+    # docs_dir reads server paths, so it is only accepted by the batch.py CLI.
+    if any(isinstance(company, dict) and company.get("docs_dir") for company in request.get("companies", [])):
+        raise HTTPException(status_code=422, detail="docs_dir is not supported over REST, upload the documents with POST /upload")
+    names = [
+        company.get("company_name") if isinstance(company, dict) else company
+        for company in request.get("companies") or []
+    ]
+    if not names:
+        raise HTTPException(status_code=422, detail="companies is required")
+    if not all(isinstance(name, str) and name.strip() for name in names):
+        raise HTTPException(status_code=422, detail="companies must be names or {\"company_name\": ...} objects")
+    companies = [BatchCompany(name.strip()) for name in names]
+    batch_id = request.get("batch_id")
+    if batch_id is not None and not (
+        isinstance(batch_id, str) and (batch_id in app.state.batches or BATCH_ID_RE.fullmatch(batch_id))
+    ):
+        raise HTTPException(status_code=422, detail=f"Invalid batch id {batch_id!r}")
+    concurrency = request.get("concurrency", DEFAULT_BATCH_CONCURRENCY)
+    # bool is an int subclass, but "concurrency": true is not a number.
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        raise HTTPException(status_code=422, detail="concurrency must be an integer of at least 1")
+    if batch_id in app.state.batch_tasks and not app.state.batch_tasks[batch_id].done():
+        raise HTTPException(status_code=409, detail=f"Batch {batch_id} is already running")
+    batch, task = start_batch(
+        app.state.app_context,
+        companies,
+        batch_id=batch_id,
+        concurrency=concurrency,
+        parquet=bool(request.get("parquet")),
+    )
+    app.state.batches[batch.batch_id] = batch
+    app.state.batch_tasks[batch.batch_id] = task
+    return JSONResponse(status_code=202, content=batch.summary())
+
+
+@app.get("/batches")
+async def list_batches():
+    return {"batches": [batch.summary() for batch in app.state.batches.values()]}
+
 
-        # List to store information about uploaded files
-        uploaded_files = []
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    if batch_id not in app.state.batches:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return app.state.batches[batch_id].summary()
 
-        # Loop through the list of files
-        for file in files:
-            file_location = os.path.join(UPLOAD_DIRECTORY, file.filename)
 
-            # Save the uploaded file to the specified location
-            with open(file_location, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+@app.get("/batches/{batch_id}/results")
+async def get_batch_results(batch_id: str):
+    if batch_id not in app.state.batches:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return {"results": ResultWriter(app.state.batches[batch_id].output_path).read()}
 
-            uploaded_files.append(file.filename)
 
-        # Return success message with the list of uploaded files
-        return JSONResponse(content={"message": f"Files uploaded successfully!", "files": uploaded_files})
+@app.get("/health")
+async def health():
+    """Liveness probe."""
+    return {"status": "ok"}
 
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe, 503 until the warm-up is done; reports import and init seconds per component."""
+    summary = startup_timer.summary()
+    return JSONResponse(status_code=200 if startup_timer.ready else 503, content=summary)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Step latencies, LLM calls and tokens, embedding batches, searches and cache hits for Prometheus."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/scheduler")
+async def get_scheduler_stats():
+    """Queue depth, concurrency limit and throttling counts of the LLM and embedding schedulers."""
+    return {"schedulers": scheduler_stats()}
+
+
+@app.post("/upload")
+async def upload_files(
+    company_name: str = Form(...),  # Form data
+    files: List[UploadFile] = File(...),  # List of files
+    replace: bool = Form(False),  # Overwrite files of the same name instead of keeping both
+):
+    """Store a company's documents and start indexing the new ones in the background.
+
+    Files whose content the company already has are skipped. Poll
+    GET /upload/{company_name}/status for the indexing progress.
+    """
+    try:
+        results = await store_uploads(company_name, files, replace=replace)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         # Return error message if something goes wrong
         print(f"An error occurred while uploading the files: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred while uploading the files: {str(e)}")
 
+    if all(result["status"] == REJECTED for result in results):
+        raise HTTPException(status_code=413, detail=[result.get("detail") for result in results])
+
+    ingestion_manager: IngestionManager = app.state.ingestions
+    if any(result["status"] in (STORED, REPLACED) for result in results):
+        ingestion = ingestion_manager.schedule(company_name)
+    else:
+        ingestion = ingestion_manager.get(company_name)
+    return JSONResponse(content={
+        "message": "Files uploaded successfully!",
+        "files": [result["stored_as"] for result in results if result["stored_as"]],
+        "uploads": results,
+        "ingestion": ingestion.summary() if ingestion else None,
+    })
+
+
+@app.get("/upload/{company_name}/status")
+async def get_ingestion_status(company_name: str):
+    """Indexing status of a company's uploaded documents."""
+    ingestion = app.state.ingestions.get(company_name)
+    if ingestion is None:
+        raise HTTPException(status_code=404, detail=f"No uploads for {company_name}")
+    return ingestion.summary()
 
 
 if __name__ == "__main__":
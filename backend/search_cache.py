@@ -0,0 +1,127 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+
+DEFAULT_CACHE_PATH = "storage/search_cache.sqlite"
+
+
+def normalize_query(query: str) -> str:
+    """Collapse case, quotes, punctuation and whitespace so equivalent queries share a key."""
+    query = query.lower().strip().strip("\"'")
+    query = re.sub(r"[^\w\s-]", " ", query)
+    return " ".join(query.split())
+
+
+class SearchCache:
+    """Persistent TTL cache of web search results stored in SQLite.
+
+    Results are zlib-compressed JSON keyed by the normalized query. Entries
+    older than `ttl` seconds are treated as misses, and once more than
+    `max_entries` rows are stored the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON search_results (last_access)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["SearchCache"]:
+        """Build the cache from SEARCH_CACHE_* settings, or None when SEARCH_CACHE_TTL is 0."""
+        ttl = float(os.getenv("SEARCH_CACHE_TTL") or 7 * 24 * 3600)
+        if ttl <= 0:
+            return None
+        return cls(
+            path=os.getenv("SEARCH_CACHE_PATH") or DEFAULT_CACHE_PATH,
+            ttl=ttl,
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES") or 5000),
+        )
+
+    def get(self, query: str) -> Optional[List[dict]]:
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM search_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE search_results SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, query: str, results: List[dict]) -> None:
+        key = normalize_query(query)
+        payload = zlib.compress(json.dumps(results).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        self._conn.execute(
+            "DELETE FROM search_results WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM search_results").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                """DELETE FROM search_results WHERE key IN (
+                    SELECT key FROM search_results ORDER BY last_access LIMIT ?
+                )""",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM search_results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
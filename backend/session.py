@@ -0,0 +1,76 @@
+"""Translation between ESGMaterialityAnalysisWorkflow events and client messages.
+
+Shared by the interactive /query websocket and detached jobs, so both speak
+the same message protocol.
+"""
+from typing import Optional
+
+from llama_index.core.workflow.handler import WorkflowHandler
+
+from workflows.esg_materiality_analysis_workflow import (
+    CompanyDetailsAvailableEvent,
+    GRITopicsAvailableEvent,
+    InputRequiredOnCompanyDetailsEvent,
+    InputRequiredOnMaterialityTopicsEvent,
+    ProgressEvent,
+    TokenStreamEvent,
+    TopicAssesmentAvailableEvent,
+    UserInputOnCompanyDetailsEvent,
+    UserInputOnMaterialityTopicsEvent,
+)
+
+
+INPUT_REQUIRED_TYPES = ("input_required_company_details", "input_required_gri_topics")
+
+
+def event_to_message(event) -> Optional[dict]:
+    """Client message for a streamed workflow event, or None for internal events."""
+    if isinstance(event, ProgressEvent):
+        return {"type": "progress", "payload": str(event.msg)}
+    if isinstance(event, TokenStreamEvent):
+        return {"type": "token", "payload": event.to_json()}
+    if isinstance(event, InputRequiredOnCompanyDetailsEvent):
+        return {"type": "input_required_company_details", "payload": event.payload}
+    if isinstance(event, CompanyDetailsAvailableEvent):
+        return {"type": "company_details", "payload": event.to_json()}
+    if isinstance(event, GRITopicsAvailableEvent):
+        return {"type": "gri_topics", "payload": event.gri_topics}
+    if isinstance(event, InputRequiredOnMaterialityTopicsEvent):
+        return {"type": "input_required_gri_topics", "payload": event.payload}
+    if isinstance(event, TopicAssesmentAvailableEvent):
+        return {"type": "topic_assesment", "payload": event.to_json()}
+    return None
+
+
+async def apply_user_response(handler: WorkflowHandler, input_type: str, response: dict) -> None:
+    """Resume the workflow with the client's answer to an `input_required_*` message.
+
+    `response` is {"response": "yes"} to accept, or {"response": "no", "comment": ...}
+    to ask for a revision.
+    """
+    answer = response["response"].lower()
+    if input_type == "input_required_company_details":
+        if answer == "yes":
+            gics_sector = await handler.ctx.get("gics_sector")
+            gics_industry_group = await handler.ctx.get("gics_industry_group")
+            gics_industry = await handler.ctx.get("gics_industry")
+            company_description = await handler.ctx.get("company_description")
+            handler.ctx.send_event(CompanyDetailsAvailableEvent(gics_sector=gics_sector,gics_industry_group=gics_industry_group
+                                                                ,gics_industry=gics_industry,company_description=company_description, response=answer))
+        elif answer == "no":
+            company_name = await handler.ctx.get("company_name")
+            handler.ctx.send_event(UserInputOnCompanyDetailsEvent(company_name = company_name, user_input=response["comment"], response=answer))
+        else:
+            raise ValueError(f"Unexpected response {answer!r}, expected yes or no.")
+
+    elif input_type == "input_required_gri_topics":
+        if answer == "yes":
+            gri_topics = await handler.ctx.get("gri_topics")
+            handler.ctx.send_event(GRITopicsAvailableEvent(gri_topics = gri_topics, response=answer))
+        elif answer == "no":
+            handler.ctx.send_event(UserInputOnMaterialityTopicsEvent(user_input=response["comment"], response=answer))
+        else:
+            raise ValueError(f"Unexpected response {answer!r}, expected yes or no.")
+
+    else:
+        raise ValueError(f"Unknown input type {input_type}.")
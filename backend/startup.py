@@ -0,0 +1,72 @@
+"""Startup timing and readiness of the backend process.
+
+`startup_timer` records how long each component takes to import and to
+initialize: the backend modules, the configured LLM and embedding
+integrations, tracing, and the warm-up. GET /ready serves the timings, and
+they are printed once the process is ready. Integrations are imported through
+`import_component`, only when the configuration uses them.
+"""
+import importlib
+import os
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Optional
+
+
+# Preload the GRI index and clients before reporting ready; 0 serves at once and loads on first use.
+WARM_UP = (os.getenv("WARM_UP") or "1").lower() not in ("0", "false", "no")
+
+
+class StartupTimer:
+    """Seconds spent importing and initializing each component since the process started."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.ready_seconds: Optional[float] = None
+        self.components: Dict[str, Dict[str, float]] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_seconds is not None
+
+    def record(self, component: str, phase: str, seconds: float) -> None:
+        phases = self.components.setdefault(component, {})
+        phases[phase] = round(phases.get(phase, 0.0) + seconds, 3)
+
+    @contextmanager
+    def measure(self, component: str, phase: str = "init"):
+        start = time.perf_counter()
+        imported = self.components.get(component, {}).get("import", 0.0)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if phase != "import":
+                # Imports made inside the block are already recorded as their own phase.
+                seconds -= self.components.get(component, {}).get("import", 0.0) - imported
+            self.record(component, phase, seconds)
+
+    def import_component(self, component: str, module: str) -> ModuleType:
+        with self.measure(component, "import"):
+            return importlib.import_module(module)
+
+    def mark_ready(self, error: Optional[str] = None) -> None:
+        self.ready_seconds = round(time.perf_counter() - self.started, 3)
+        self.error = error
+        print(f"\n> Ready after {self.ready_seconds}s\n")
+        for component, phases in self.summary()["components"].items():
+            print(f"> {component}: " + ", ".join(f"{phase} {seconds}s" for phase, seconds in phases.items()))
+
+    def summary(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_seconds": self.ready_seconds,
+            "warm_up": WARM_UP,
+            "error": self.error,
+            "components": dict(sorted(self.components.items(), key=lambda item: -sum(item[1].values()))),
+        }
+
+
+startup_timer = StartupTimer()
@@ -1,45 +1,177 @@
+import asyncio
 import os
-from typing import List
-import requests
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+import httpx
 from dotenv import load_dotenv
 
 from llama_index.core.schema import Document
 
+from metrics import record_cache_lookups, record_search_call
+from search_cache import SearchCache
 
-async def get_docs_from_tavily_search(sub_query: str, visited_urls: set[str]):
-    load_dotenv()
-    api_key = os.getenv("TAVILY_API_KEY")
-    base_url = "https://api.tavily.com/search"
-    headers = {
-        "Content-Type": "application/json",
-    }
-    data = {
-        "query": sub_query,
-        "api_key": api_key,
-        "include_raw_content": True,
-    }
 
+DEFAULT_BASE_URL = "https://api.tavily.com"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TavilyClient:
+    """Async Tavily search client sharing one keep-alive connection pool.
+
+    At most `max_concurrency` searches are in flight at once, and requests that
+    fail with 429/5xx or a transport error are retried with jittered exponential
+    backoff, or after the response's Retry-After when it asks for longer. A slot
+    is only held while a request is in flight, not during the wait. When a
+    `cache` is given, cached results are returned without touching the network.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: int = 5,
+        timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        cache: Optional[SearchCache] = None,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+
+    @classmethod
+    def from_env(cls) -> "TavilyClient":
+        load_dotenv()
+        return cls(
+            api_key=os.getenv("TAVILY_API_KEY"),
+            base_url=os.getenv("TAVILY_BASE_URL") or DEFAULT_BASE_URL,
+            max_concurrency=int(os.getenv("TAVILY_MAX_CONCURRENCY") or 5),
+            timeout=float(os.getenv("TAVILY_TIMEOUT") or 30),
+            max_retries=int(os.getenv("TAVILY_MAX_RETRIES") or 3),
+            cache=SearchCache.from_env(),
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: sleep somewhere in [0, min(max, base * 2^attempt)].
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        delay = self._backoff(attempt)
+        retry_after = retry_after_seconds(response) if response is not None else None
+        return delay if retry_after is None else max(delay, retry_after)
+
+    async def search(self, query: str) -> List[dict]:
+        """Run one search and return the raw Tavily results."""
+        if self.cache is not None:
+            # SQLite reads and commits, kept off the event loop.
+            cached = await asyncio.to_thread(self.cache.get, query)
+            record_cache_lookups("search", int(cached is not None), int(cached is None))
+            if cached is not None:
+                print(f"\n> Search cache hit for: {query}\n")
+                return cached
+        results = await self._post_search(query)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, query, results)
+        return results
+
+    async def _post_search(self, query: str) -> List[dict]:
+        data = {
+            "query": query,
+            "api_key": self.api_key,
+            "include_raw_content": True,
+        }
+        record_search_call()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with self._semaphore:
+                try:
+                    response = await self._client.post("/search", json=data)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+            if response is not None:
+                if response.status_code == 200:
+                    return response.json().get("results", [])
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.max_retries
+                ):
+                    response.raise_for_status()
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_client: Optional[TavilyClient] = None
+
+
+def get_tavily_client() -> TavilyClient:
+    global _client
+    if _client is None:
+        _client = TavilyClient.from_env()
+    return _client
+
+
+async def close_tavily_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_docs_from_tavily_search(sub_query: str, visited_urls: set[str]):
     docs = []
     print(f"\n> Searching Tavily for sub query: {sub_query}\n")
-    response = requests.post(base_url, headers=headers, json=data)
-    if response.status_code == 200:
-        search_results = response.json().get("results", [])
-        for search_result in search_results:
-            url = search_result.get("url")
-            if not search_result.get("raw_content"):
-                continue
-            if url not in visited_urls:
-                visited_urls.add(url)
-                docs.append(
-                    Document(
-                        text=search_result.get("raw_content"),
-                        metadata={
-                            "source": url,
-                            "title": search_result.get("title"),
-                        },
-                    )
+    search_results = await get_tavily_client().search(sub_query)
+    for search_result in search_results:
+        url = search_result.get("url")
+        if not search_result.get("raw_content"):
+            continue
+        if url not in visited_urls:
+            visited_urls.add(url)
+            docs.append(
+                Document(
+                    text=search_result.get("raw_content"),
+                    metadata={
+                        "source": url,
+                        "title": search_result.get("title"),
+                    },
                 )
-        print(f"\n> Found {len(docs)} docs from Tavily search on {sub_query}\n")
-        return docs, visited_urls
-    else:
-        response.raise_for_status()
+            )
+    print(f"\n> Found {len(docs)} docs from Tavily search on {sub_query}\n")
+    return docs, visited_urls
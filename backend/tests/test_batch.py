@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+import batch
+from batch import BatchCompany, ResultWriter, load_companies, run_batch, start_batch
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Replaces the workflow run; companies named "fail*" fail."""
+    names = []
+
+    async def analyze_company(app_context, company):
+        names.append(company.company_name)
+        failed = company.company_name.startswith("fail")
+        return {
+            "company_name": company.company_name,
+            "status": "failed" if failed else "completed",
+            "error": "boom" if failed else None,
+            "seconds": 0.0,
+        }
+
+    monkeypatch.setattr(batch, "analyze_company", analyze_company)
+    return names
+
+
+def companies(*names):
+    return [BatchCompany(name) for name in names]
+
+
+def test_load_companies_formats(tmp_path):
+    csv_path = tmp_path / "companies.csv"
+    csv_path.write_text("company_name,docs_dir\nAcme,/docs/acme\n  ,\nGlobex,\n")
+    jsonl_path = tmp_path / "companies.jsonl"
+    jsonl_path.write_text('{"company_name": "Acme"}\n\n{"company_name": "Globex", "docs_dir": "/docs/globex"}\n')
+    text_path = tmp_path / "companies.txt"
+    text_path.write_text("Acme\n\nGlobex\n")
+
+    assert load_companies(str(csv_path)) == [BatchCompany("Acme", "/docs/acme"), BatchCompany("Globex")]
+    assert load_companies(str(jsonl_path)) == [BatchCompany("Acme"), BatchCompany("Globex", "/docs/globex")]
+    assert load_companies(str(text_path)) == companies("Acme", "Globex")
+
+
+def test_result_writer_skips_a_truncated_last_line(tmp_path):
+    writer = ResultWriter(str(tmp_path / "results.jsonl"))
+    writer.append({"company_name": "Acme", "status": "completed"})
+    writer.append({"company_name": "Globex", "status": "failed"})
+    with open(writer.path, "a") as f:
+        f.write('{"company_name": "Init')
+
+    assert [record["company_name"] for record in writer.read()] == ["Acme", "Globex"]
+    assert writer.completed_companies() == {"Acme"}
+
+
+def test_run_batch_resumes_and_retries_failures(tmp_path, analyzed):
+    output_path = str(tmp_path / "results.jsonl")
+    first = asyncio.run(run_batch(None, companies("Acme", "fail-Globex"), output_path, concurrency=2))
+    assert (first.completed, first.failed, first.skipped) == (1, 1, 0)
+
+    analyzed.clear()
+    second = asyncio.run(run_batch(None, companies("Acme", "fail-Globex", "Initech"), output_path, concurrency=2))
+    assert sorted(analyzed) == ["Initech", "fail-Globex"]
+    assert (second.total, second.skipped, second.completed, second.failed) == (3, 1, 1, 1)
+    assert second.status == "completed"
+
+    with open(output_path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record["company_name"] for record in records].count("fail-Globex") == 2
+
+
+def test_run_batch_respects_its_concurrency(tmp_path, monkeypatch):
+    running = []
+    peak = []
+
+    async def analyze_company(app_context, company):
+        running.append(company)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(company)
+        return {"company_name": company.company_name, "status": "completed", "seconds": 0.01}
+
+    monkeypatch.setattr(batch, "analyze_company", analyze_company)
+    asyncio.run(run_batch(None, companies(*"abcdef"), str(tmp_path / "results.jsonl"), concurrency=2))
+    assert max(peak) == 2
+
+
+@pytest.mark.parametrize(
+    "batch_id, concurrency",
+    [("../../etc/passwd", 1), ("A" * 32, 1), (123, 1), ("a" * 32, 0)],
+)
+def test_start_batch_rejects_invalid_arguments(batch_id, concurrency):
+    async def scenario():
+        start_batch(None, companies("Acme"), batch_id=batch_id, concurrency=concurrency)
+
+    with pytest.raises(ValueError):
+        asyncio.run(scenario())
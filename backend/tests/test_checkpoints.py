@@ -0,0 +1,62 @@
+import os
+import time
+import uuid
+
+import pytest
+
+from checkpoints import ASSESSING, CheckpointStore, is_run_id
+
+INVALID_RUN_IDS = ["../../etc/passwd", "", "ABCDEF" * 6, uuid.uuid4().hex + "/x", None, 42]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints"))
+
+
+def test_is_run_id():
+    assert is_run_id(uuid.uuid4().hex)
+    for run_id in INVALID_RUN_IDS:
+        assert not is_run_id(run_id)
+
+
+def test_checkpoints_round_trip(store):
+    checkpoint = store.create("Acme")
+    checkpoint.update(stage=ASSESSING, gri_topics=["305 - Emissions"])
+    checkpoint.set_topic_value("topic_assessments", "305 - Emissions", "material")
+
+    loaded = store.load(checkpoint.run_id)
+    assert loaded.stage == ASSESSING
+    assert loaded.get("company_name") == "Acme"
+    assert loaded.get("gri_topics") == ["305 - Emissions"]
+
+    store.delete(checkpoint.run_id)
+    assert store.load(checkpoint.run_id) is None
+
+
+# An empty or missing run id makes create() pick a new one, so it is not listed here.
+@pytest.mark.parametrize("run_id", [run_id for run_id in INVALID_RUN_IDS if run_id])
+def test_invalid_run_ids_never_reach_the_file_system(store, run_id):
+    assert store.load(run_id) is None
+    with pytest.raises(ValueError):
+        store.create("Acme", run_id=run_id)
+    with pytest.raises(ValueError):
+        store.delete(run_id)
+
+
+def test_sweep_removes_only_stale_checkpoints(store):
+    stale = store.create("Stale")
+    fresh = store.create("Fresh")
+    leftover = os.path.join(store.checkpoint_dir, f"{uuid.uuid4().hex}.json.tmp")
+    unrelated = os.path.join(store.checkpoint_dir, "notes.txt")
+    for path in (leftover, unrelated):
+        open(path, "w").close()
+    old = time.time() - 3600
+    for path in (stale.path, leftover, unrelated):
+        os.utime(path, (old, old))
+
+    assert store.sweep(ttl=60) == 2
+    assert store.load(stale.run_id) is None
+    assert store.load(fresh.run_id) is not None
+    assert not os.path.exists(leftover)
+    assert os.path.exists(unrelated)
@@ -0,0 +1,69 @@
+from typing import List
+
+import pytest
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding, EmbeddingStore, embed_model_id
+
+
+class CountingEmbedding(MockEmbedding):
+    """MockEmbedding that records the texts it was asked to embed."""
+
+    embedded: List[str] = Field(default_factory=list)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.embedded.append(query)
+        return [0.0, 1.0, float(len(query))]
+
+
+def test_embed_model_id_prefers_the_called_model():
+    model = MockEmbedding(embed_dim=3)
+    assert embed_model_id(model) == model.model_name
+
+    object.__setattr__(model, "model", "NV-Embed-QA")
+    assert embed_model_id(model) == "NV-Embed-QA"
+
+
+def test_only_misses_reach_the_wrapped_model(tmp_path):
+    inner = CountingEmbedding(embed_dim=3)
+    cached = CachedEmbedding(inner, cache_dir=str(tmp_path))
+
+    first = cached.get_text_embedding_batch(["alpha", "beta", "alpha"])
+    second = cached.get_text_embedding_batch(["beta", "gamma"])
+
+    assert inner.embedded == ["alpha", "beta", "gamma"]
+    assert first[0] == first[2] == [5.0, 1.0, 0.0]
+    assert second[0] == first[1]
+    assert cached.stats()["hits"] == 2
+
+
+def test_queries_and_texts_are_cached_separately(tmp_path):
+    inner = CountingEmbedding(embed_dim=3)
+    cached = CachedEmbedding(inner, cache_dir=str(tmp_path))
+
+    text_vector = cached.get_text_embedding("emissions")
+    query_vector = cached.get_query_embedding("emissions")
+
+    assert text_vector != query_vector
+    assert inner.embedded == ["emissions", "emissions"]
+
+
+def test_store_reads_rows_written_by_another_instance(tmp_path):
+    key = b"k" * 32
+    EmbeddingStore(str(tmp_path)).add_many([key], [[1.0, 2.0]])
+
+    (vector,) = EmbeddingStore(str(tmp_path)).get_many([key])
+    assert vector.tolist() == [1.0, 2.0]
+
+
+def test_store_rejects_a_different_dimension(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add_many([b"a" * 32], [[1.0, 2.0]])
+
+    with pytest.raises(ValueError):
+        store.add_many([b"b" * 32], [[1.0, 2.0, 3.0]])
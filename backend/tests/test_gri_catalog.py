@@ -0,0 +1,57 @@
+import pytest
+
+from gri_catalog import GRICatalog
+
+
+def entry(title, year):
+    return {"title": title, "year": year, "reporting_requirements": f"{title} requirements"}
+
+
+@pytest.fixture
+def catalog():
+    return GRICatalog(
+        {
+            "3": entry("Material Topics", 2021),
+            "101": entry("Biodiversity", 2024),
+            "303": entry("Water and Effluents", 2018),
+            "304": entry("Biodiversity", 2016),
+            "305": entry("Emissions", 2016),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "gri_topic, code",
+    [
+        ("GRI 305: Emissions", "305"),
+        ("305 - Emissions", "305"),
+        # The code the LLM picked wins over the title, even when another standard is newer or titled differently.
+        ("304 - Biodiversity", "304"),
+        ("305 - GHG Emissions", "305"),
+        ("303: Water", "303"),
+        # Without a code, titles resolve to the most recent standard.
+        ("Biodiversity", "101"),
+        ("water & effluents", "303"),
+    ],
+)
+def test_resolve_code(catalog, gri_topic, code):
+    assert catalog.resolve_code(gri_topic) == code
+
+
+@pytest.mark.parametrize("gri_topic", ["Top 3 Emissions", "Emissions in 3 regions", "999 - Unknown", "Labor"])
+def test_numbers_outside_a_code_do_not_pick_a_standard(catalog, gri_topic):
+    assert catalog.resolve_code(gri_topic) is None
+
+
+def test_lookup_returns_the_requirements(catalog):
+    assert catalog.lookup("305 - Emissions") == "Emissions requirements"
+    assert catalog.lookup("Labor") is None
+
+
+def test_save_and_load_round_trip(catalog, tmp_path):
+    path = str(tmp_path / "catalog.json")
+    catalog.save(path)
+
+    loaded = GRICatalog.load(path)
+    assert loaded.entries == catalog.entries
+    assert loaded.resolve_code("Biodiversity") == "101"
@@ -0,0 +1,81 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import MetadataMode, TextNode
+
+from gri_index import FAISS_FILE, NODE_STORE_FILE, GRIIndex, NodeStore, _reciprocal_rank_fusion, node_gri_code
+from rerank import VECTOR_SCORE_KEY
+
+EMISSIONS = "GRI 305_ Emissions 2016.pdf"
+WATER = "GRI 303_ Water and Effluents 2018.pdf"
+
+NODES = [
+    (EMISSIONS, "Scope 1 greenhouse gas emissions shall be reported.", [1.0, 0.0, 0.0]),
+    (EMISSIONS, "Energy intensity ratio of the organization.", [0.0, 1.0, 0.0]),
+    (WATER, "Total water withdrawal shall be reported.", [0.0, 0.0, 1.0]),
+    (WATER, "Water discharge and related emissions.", [0.9, 0.1, 0.0]),
+]
+
+
+@pytest.fixture
+def gri_index(tmp_path):
+    faiss_index = faiss.IndexFlatL2(3)
+    faiss_index.add(np.asarray([vector for _, _, vector in NODES], dtype=np.float32))
+    faiss.write_index(faiss_index, os.path.join(tmp_path, FAISS_FILE))
+    NodeStore.create(
+        os.path.join(tmp_path, NODE_STORE_FILE),
+        {
+            position: TextNode(text=text, metadata={"file_name": file_name})
+            for position, (file_name, text, _) in enumerate(NODES)
+        },
+    )
+    return GRIIndex(str(tmp_path))
+
+
+def test_reciprocal_rank_fusion_favours_items_in_both_rankings():
+    scores = _reciprocal_rank_fusion([1, 2, 3], [3, 4])
+    assert max(scores, key=scores.get) == 3
+    assert scores[1] == pytest.approx(1 / 61)
+    assert scores[4] == pytest.approx(1 / 62)
+
+
+def test_node_gri_code_falls_back_to_the_file_name():
+    assert node_gri_code(TextNode(text="", metadata={"file_name": EMISSIONS})) == "305"
+    assert node_gri_code(TextNode(text="", metadata={"gri_code": "2", "file_name": EMISSIONS})) == "2"
+    assert node_gri_code(TextNode(text="", metadata={"file_name": "GRI Standards Glossary 2022.pdf"})) is None
+
+
+def test_index_knows_the_codes_of_its_standards(gri_index):
+    assert gri_index.gri_codes == {"303", "305"}
+    assert sorted(gri_index.node_store.positions_for_code("303")) == [2, 3]
+
+
+def test_keyword_search_ranks_matching_nodes(gri_index):
+    hits = gri_index.node_store.keyword_search("water withdrawal", top_k=4)
+    assert hits[0][0] == 2
+    assert {position for position, _ in hits} == {2, 3}
+    assert gri_index.node_store.keyword_search("water", top_k=4, positions=[0, 1]) == []
+
+
+def test_search_is_restricted_to_the_named_standard(gri_index):
+    results = gri_index.search([1.0, 0.0, 0.0], top_k=2, gri_code="303")
+    assert [result.node.metadata["file_name"] for result in results] == [WATER, WATER]
+    assert results[0].node.get_content() == NODES[3][1]
+
+
+def test_unknown_code_searches_every_standard(gri_index):
+    results = gri_index.search([1.0, 0.0, 0.0], top_k=1, gri_code="999")
+    assert results[0].node.get_content() == NODES[0][1]
+
+
+def test_fused_results_carry_their_vector_similarity(gri_index):
+    results = gri_index.search([1.0, 0.0, 0.0], top_k=3, query_str="water withdrawal")
+    by_text = {result.node.get_content(): result for result in results}
+
+    # Position 2 is only a keyword hit, so its similarity is looked up separately.
+    vector_hit, keyword_hit = by_text[NODES[0][1]], by_text[NODES[2][1]]
+    assert vector_hit.node.metadata[VECTOR_SCORE_KEY] == pytest.approx(1.0)
+    assert keyword_hit.node.metadata[VECTOR_SCORE_KEY] == pytest.approx(1 / 3)
+    assert VECTOR_SCORE_KEY not in keyword_hit.node.get_content(metadata_mode=MetadataMode.LLM)
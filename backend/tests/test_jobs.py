@@ -0,0 +1,51 @@
+import asyncio
+
+from jobs import COMPLETED, Job
+
+
+async def collect(job, after=0):
+    return [message async for message in job.stream(after)]
+
+
+def test_tokens_are_streamed_live_but_not_buffered():
+    async def scenario():
+        job = Job(job_id="job", company_name="Acme")
+        await job.publish({"type": "company_details", "payload": "Acme Corp"})
+        live = asyncio.create_task(collect(job))
+        await asyncio.sleep(0)
+
+        await job.publish({"type": "token", "payload": "Ac"})
+        await job.publish({"type": "topic_assesment", "payload": "Acme is..."})
+        await job.set_status(COMPLETED)
+        return job, await live
+
+    job, live = asyncio.run(scenario())
+    assert [message["type"] for message in live] == ["company_details", "token", "topic_assesment"]
+    assert [message["seq"] for message in job.messages] == [0, 1]
+    assert all(message["type"] != "token" for message in job.to_json()["messages"])
+
+
+def test_stream_replays_from_a_sequence_number():
+    async def scenario():
+        job = Job(job_id="job", company_name="Acme")
+        for i in range(3):
+            await job.publish({"type": "topic_assesment", "payload": i})
+        await job.set_status(COMPLETED)
+        return await collect(job, after=1)
+
+    assert [message["payload"] for message in asyncio.run(scenario())] == [1, 2]
+
+
+def test_messages_published_during_the_replay_are_sent_once():
+    async def scenario():
+        job = Job(job_id="job", company_name="Acme")
+        await job.publish({"type": "company_details", "payload": 0})
+        received = []
+        async for message in job.stream():
+            received.append(message["payload"])
+            if message["payload"] == 0:
+                await job.publish({"type": "gri_topics", "payload": 1})
+                await job.set_status(COMPLETED)
+        return received
+
+    assert asyncio.run(scenario()) == [0, 1]
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+import llm_scheduler
+from llm_scheduler import BATCH, INTERACTIVE, RequestScheduler, TokenBucket, is_rate_limit_error
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"value": 1000.0}
+    monkeypatch.setattr(llm_scheduler.time, "monotonic", lambda: now["value"])
+    return now
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+    clock["value"] += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock["value"] += 0.5
+    assert bucket.wait_time(1) == 0.0
+
+
+def test_token_bucket_caps_requests_at_its_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.take(1)
+    # More than a minute's worth waits for a full bucket instead of forever.
+    assert bucket.wait_time(1000) == pytest.approx(1.0)
+
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0)
+    bucket.take(10**6)
+    assert bucket.wait_time(10**6) == 0.0
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimitError())
+    assert is_rate_limit_error(Exception("Too Many Requests"))
+    assert not is_rate_limit_error(ValueError("bad input"))
+
+
+def test_rate_limit_halves_the_limit_once_per_burst(clock):
+    scheduler = RequestScheduler("test", max_concurrency=8, min_concurrency=1)
+    scheduler.release(clock["value"], RateLimitError())
+    scheduler.release(clock["value"], RateLimitError())
+    assert scheduler.limit == 4
+
+    clock["value"] += 1.5
+    scheduler.release(clock["value"], RateLimitError())
+    assert scheduler.limit == 2
+    assert scheduler.rate_limited == 3
+
+
+def test_limit_never_drops_below_the_minimum(clock):
+    scheduler = RequestScheduler("test", max_concurrency=4, min_concurrency=2)
+    for _ in range(5):
+        clock["value"] += 2
+        scheduler.release(clock["value"], RateLimitError())
+    assert scheduler.limit == 2
+
+
+def test_successes_grow_the_limit_additively_up_to_the_maximum(clock):
+    scheduler = RequestScheduler("test", max_concurrency=4)
+    scheduler.limit = 2.0
+    scheduler.release(clock["value"])
+    scheduler.release(clock["value"])
+    assert 2.0 < scheduler.limit < 3.1
+
+    for _ in range(50):
+        scheduler.release(clock["value"])
+    assert scheduler.limit == 4
+
+
+def test_interactive_calls_are_admitted_before_batch_calls():
+    async def scenario():
+        scheduler = RequestScheduler("test", max_concurrency=1)
+        first = await scheduler.acquire()
+        admitted = []
+
+        async def wait(priority, label):
+            await scheduler.acquire(priority=priority)
+            admitted.append(label)
+
+        batch = asyncio.create_task(wait(BATCH, "batch"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(wait(INTERACTIVE, "interactive"))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queue_depth"] == 2
+
+        scheduler.release(first)
+        await asyncio.sleep(0)
+        assert admitted == ["interactive"]
+        scheduler.release(first)
+        await asyncio.gather(batch, interactive)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["interactive", "batch"]
+
+
+def test_run_retries_rate_limited_calls():
+    async def scenario():
+        scheduler = RequestScheduler("test", max_retries=2, backoff_base=0)
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitError()
+            return "ok"
+
+        return await scheduler.run(call), len(attempts), scheduler.stats()
+
+    result, attempts, stats = asyncio.run(scenario())
+    assert (result, attempts) == ("ok", 3)
+    assert stats["rate_limited"] == 2 and stats["completed"] == 1 and stats["in_flight"] == 0
+
+
+def test_run_gives_up_after_max_retries():
+    async def scenario():
+        scheduler = RequestScheduler("test", max_retries=1, backoff_base=0)
+
+        async def call():
+            raise RateLimitError()
+
+        await scheduler.run(call)
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(scenario())
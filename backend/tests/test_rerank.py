@@ -0,0 +1,62 @@
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from rerank import BM25, VECTOR_SCORE_KEY, HybridRerank, tokenize
+
+EMISSIONS = "GRI 305_ Emissions 2016.pdf"
+WATER = "GRI 303_ Water and Effluents 2018.pdf"
+
+
+def node(text, score, file_name=EMISSIONS, vector_score=None):
+    metadata = {"file_name": file_name}
+    if vector_score is not None:
+        metadata[VECTOR_SCORE_KEY] = vector_score
+    return NodeWithScore(node=TextNode(text=text, metadata=metadata), score=score)
+
+
+def rerank(nodes, query, **kwargs):
+    return HybridRerank(top_n=len(nodes), **kwargs).postprocess_nodes(nodes, QueryBundle(query))
+
+
+def test_tokenize_lowercases_and_splits_on_punctuation():
+    assert tokenize("Scope-1 GHG emissions (tCO2e)") == ["scope", "1", "ghg", "emissions", "tco2e"]
+
+
+def test_bm25_scores_documents_with_rarer_query_terms_higher():
+    corpus = [tokenize("water withdrawal"), tokenize("water discharge"), tokenize("energy use")]
+    bm25 = BM25(corpus)
+    query = tokenize("water withdrawal")
+    assert bm25.score(query, corpus[0]) > bm25.score(query, corpus[1]) > bm25.score(query, corpus[2]) == 0
+
+
+def test_vector_score_metadata_is_used_instead_of_the_fused_score():
+    nodes = [
+        node("Energy intensity.", score=0.9, vector_score=0.2),
+        node("Energy consumption.", score=0.1, vector_score=0.8),
+    ]
+    ranked = rerank(nodes, "fuel", lexical_weight=0.0, vector_weight=1.0, code_match_bonus=0.0)
+    assert ranked[0].node.get_content() == "Energy consumption."
+
+
+def test_node_score_is_used_without_vector_score_metadata():
+    nodes = [node("Energy intensity.", score=0.9), node("Energy consumption.", score=0.1)]
+    ranked = rerank(nodes, "fuel", lexical_weight=0.0, vector_weight=1.0, code_match_bonus=0.0)
+    assert ranked[0].node.get_content() == "Energy intensity."
+
+
+def test_lexical_matches_lift_a_node():
+    nodes = [node("Energy intensity ratio.", score=0.5), node("Water withdrawal by source.", score=0.5)]
+    ranked = rerank(nodes, "water withdrawal", code_match_bonus=0.0)
+    assert ranked[0].node.get_content() == "Water withdrawal by source."
+
+
+def test_code_bonus_needs_a_gri_prefix():
+    nodes = [node("Requirement.", score=0.6, file_name=WATER), node("Requirement.", score=0.5)]
+
+    assert rerank(nodes, "GRI 305 requirements", code_match_bonus=1.0)[0].node.metadata["file_name"] == EMISSIONS
+    # A bare number such as "top 305" is not a reference to a standard.
+    assert rerank(nodes, "top 305 requirements", code_match_bonus=1.0)[0].node.metadata["file_name"] == WATER
+
+
+def test_top_n_limits_the_results():
+    nodes = [node(f"Requirement {i}.", score=i / 10) for i in range(5)]
+    assert len(HybridRerank(top_n=2).postprocess_nodes(nodes, QueryBundle("requirement"))) == 2
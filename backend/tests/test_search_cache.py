@@ -0,0 +1,69 @@
+import itertools
+
+import pytest
+
+import search_cache
+from search_cache import SearchCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = itertools.count(1000)
+    now = {"value": None}
+
+    def fake_time():
+        return now["value"] if now["value"] is not None else float(next(ticks))
+
+    monkeypatch.setattr(search_cache.time, "time", fake_time)
+    return now
+
+
+def test_normalize_query_collapses_case_quotes_and_punctuation():
+    assert normalize_query('  "Acme Corp  GHG emissions?" ') == "acme corp ghg emissions"
+    assert normalize_query("scope-3 emissions!") == "scope-3 emissions"
+
+
+def test_get_returns_results_for_an_equivalent_query(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    results = [{"url": "https://example.com", "raw_content": "text"}]
+    cache.set("Acme emissions", results)
+
+    assert cache.get("acme   EMISSIONS?") == results
+    assert cache.get("acme water") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entries_are_misses(tmp_path, clock):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    clock["value"] = 1000.0
+    cache.set("query", [{"url": "u"}])
+
+    clock["value"] = 1059.0
+    assert cache.get("query") is not None
+    clock["value"] = 1061.0
+    assert cache.get("query") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", [{"url": "a"}])
+    cache.set("b", [{"url": "b"}])
+    cache.get("a")
+    cache.set("c", [{"url": "c"}])
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SearchCache(path).set("query", [{"url": "u"}])
+
+    assert SearchCache(path).get("query") == [{"url": "u"}]
+
+
+def test_from_env_disables_the_cache_with_zero_ttl(monkeypatch):
+    monkeypatch.setenv("SEARCH_CACHE_TTL", "0")
+    assert SearchCache.from_env() is None
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from company_index import company_docs_dir
+from uploads import (
+    DUPLICATE,
+    REJECTED,
+    REPLACED,
+    STORED,
+    TEMP_PREFIX,
+    UploadSizeLimit,
+    UploadTooLargeError,
+    safe_filename,
+    store_uploads,
+    stream_to_file,
+)
+
+
+class FakeUpload:
+    """The part of UploadFile that store_uploads uses."""
+
+    def __init__(self, filename, content):
+        self.filename = filename
+        self._file = io.BytesIO(content)
+
+    async def read(self, size=-1):
+        return self._file.read(size)
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def store(*uploads, replace=False):
+    return asyncio.run(store_uploads("Acme", [FakeUpload(*upload) for upload in uploads], replace=replace))
+
+
+def docs():
+    return sorted(os.listdir(company_docs_dir("Acme")))
+
+
+def test_safe_filename():
+    assert safe_filename("../../report.pdf") == "report.pdf"
+    assert safe_filename("C:\\reports\\report.pdf") == "report.pdf"
+    for filename in (None, "", ".env", "reports/"):
+        with pytest.raises(ValueError):
+            safe_filename(filename)
+
+
+@pytest.mark.parametrize("company_name", ["", "..", "a/b", "a\\b"])
+def test_company_names_must_be_a_single_folder(company_name):
+    with pytest.raises(ValueError):
+        company_docs_dir(company_name)
+
+
+def test_new_files_are_stored():
+    (result,) = store(("report.pdf", b"2023 report"))
+    assert result["status"] == STORED
+    assert result["stored_as"] == "report.pdf"
+    assert result["sha256"] == hashlib.sha256(b"2023 report").hexdigest()
+    assert docs() == ["report.pdf"]
+
+
+def test_same_content_is_a_duplicate_under_any_name():
+    store(("report.pdf", b"2023 report"))
+    first, second = store(("copy.pdf", b"2023 report"), ("again.pdf", b"2023 report"))
+
+    assert (first["status"], first["stored_as"]) == (DUPLICATE, "report.pdf")
+    assert (second["status"], second["stored_as"]) == (DUPLICATE, "report.pdf")
+    assert docs() == ["report.pdf"]
+
+
+def test_different_content_under_an_existing_name_is_renamed():
+    store(("report.pdf", b"2023 report"))
+    (result,) = store(("report.pdf", b"2024 report"))
+
+    renamed = f"report-{hashlib.sha256(b'2024 report').hexdigest()[:8]}.pdf"
+    assert (result["status"], result["stored_as"]) == (STORED, renamed)
+    assert docs() == sorted(["report.pdf", renamed])
+
+
+def test_replace_overwrites_an_existing_name():
+    store(("report.pdf", b"2023 report"))
+    (result,) = store(("report.pdf", b"2024 report"), replace=True)
+
+    assert (result["status"], result["stored_as"]) == (REPLACED, "report.pdf")
+    with open(os.path.join(company_docs_dir("Acme"), "report.pdf"), "rb") as f:
+        assert f.read() == b"2024 report"
+
+
+def test_rejected_uploads_leave_no_temporary_files():
+    rejected, stored = store((".hidden", b"secret"), ("report.pdf", b"2023 report"))
+
+    assert rejected["status"] == REJECTED and "detail" in rejected
+    assert stored["status"] == STORED
+    assert not [name for name in docs() if name.startswith(TEMP_PREFIX)]
+
+
+def test_stream_to_file_enforces_the_size_limit(work_dir):
+    path = str(work_dir / "upload")
+    result = asyncio.run(stream_to_file(FakeUpload("small.pdf", b"x" * 10), path, max_bytes=10))
+    assert result["size"] == 10
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(stream_to_file(FakeUpload("big.pdf", b"x" * 11), path, max_bytes=10))
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.post("/other")
+    async def other(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(UploadSizeLimit, max_bytes=10)
+    return TestClient(app)
+
+
+def test_size_limit_uses_content_length(client):
+    assert client.post("/upload", content=b"x" * 10).json() == {"size": 10}
+    assert client.post("/upload", content=b"x" * 11).status_code == 413
+    assert client.post("/other", content=b"x" * 11).status_code == 200
+
+
+def test_size_limit_cuts_off_streamed_bodies(client):
+    def chunks():
+        for _ in range(4):
+            yield b"x" * 4
+
+    assert client.post("/upload", content=chunks()).status_code == 413
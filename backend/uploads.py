@@ -0,0 +1,260 @@
+"""Company document uploads and their background ingestion.
+
+Uploaded files are streamed to disk in chunks, off the event loop, and hashed
+on the way. A file whose content the company already has is not stored again;
+a different file under an existing name is stored next to it unless the
+upload asks to replace it. Files over UPLOAD_MAX_BYTES are rejected.
+
+Starlette spools the whole multipart body before the endpoint runs, so
+UPLOAD_MAX_BYTES is checked after the request has been received.
+UploadSizeLimit bounds what is spooled: requests whose Content-Length is over
+UPLOAD_MAX_REQUEST_BYTES get a 413 before the body is read, and bodies without
+one are cut off once they pass it.
+
+Every upload that stores new files schedules an ingestion of the company's
+documents (parse, chunk and embed, see company_index.sync_company_index), so
+the index is ready before the analysis asks for it. Ingestion status is kept
+per company and can be polled.
+"""
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from logging import getLogger
+from typing import BinaryIO, Dict, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from llama_index.core.embeddings import BaseEmbedding
+
+from company_index import company_docs_dir, company_file_hashes, get_company_index
+from llm_scheduler import batch_priority
+
+
+logger = getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES") or 200 * 1024 * 1024)
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES") or 5 * UPLOAD_MAX_BYTES)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Hidden, so company_index skips files still being written.
+TEMP_PREFIX = ".upload-"
+
+STORED = "stored"
+REPLACED = "replaced"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+_locks: Dict[str, asyncio.Lock] = {}
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class UploadSizeLimit:
+    """ASGI middleware answering 413 to POST requests on `path` larger than `max_bytes`."""
+
+    def __init__(self, app, path: str = "/upload", max_bytes: int = UPLOAD_MAX_REQUEST_BYTES) -> None:
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        detail = f"Upload requests are limited to {self.max_bytes} bytes."
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name or name.startswith("."):
+        raise ValueError(f"Invalid file name {filename!r}.")
+    return name
+
+
+def _write_chunk(f: BinaryIO, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def stream_to_file(upload: UploadFile, path: str, max_bytes: int = UPLOAD_MAX_BYTES) -> dict:
+    """Copy an upload to `path` chunk by chunk and return its sha256 and size."""
+    digest = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"{upload.filename} is larger than {max_bytes} bytes.")
+            await asyncio.to_thread(_write_chunk, f, digest, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    return {"sha256": digest.hexdigest(), "size": size}
+
+
+def _renamed(name: str, sha256: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}-{sha256[:8]}{ext}"
+
+
+async def store_uploads(company_name: str, uploads: List[UploadFile], replace: bool = False) -> List[dict]:
+    """Save uploads into the company's docs folder; returns one result per file.
+
+    Results have `status` stored, replaced, duplicate or rejected, and
+    `stored_as`, the name of the file holding that content in the folder.
+    """
+    docs_dir = company_docs_dir(company_name)
+    await asyncio.to_thread(os.makedirs, docs_dir, exist_ok=True)
+
+    results = []
+    pending = []
+    try:
+        for upload in uploads:
+            result = {"filename": upload.filename, "status": REJECTED, "stored_as": None}
+            results.append(result)
+            try:
+                result["filename"] = safe_filename(upload.filename)
+                temp_path = os.path.join(docs_dir, f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+                pending.append((result, temp_path))
+                result.update(await stream_to_file(upload, temp_path))
+            except ValueError as e:
+                result["detail"] = str(e)
+
+        # Hash check and rename under one lock, so concurrent uploads of the same file store it once.
+        lock = _locks.setdefault(company_name, asyncio.Lock())
+        async with lock:
+            known = await asyncio.to_thread(company_file_hashes, company_name)
+            for result, temp_path in pending:
+                if result.get("detail"):
+                    continue
+                name = result["filename"]
+                target = os.path.join(docs_dir, name)
+                if result["sha256"] in known:
+                    result.update(status=DUPLICATE, stored_as=known[result["sha256"]])
+                    continue
+                status = STORED
+                if os.path.exists(target):
+                    if replace:
+                        status = REPLACED
+                    else:
+                        name = _renamed(name, result["sha256"])
+                        target = os.path.join(docs_dir, name)
+                await asyncio.to_thread(os.replace, temp_path, target)
+                known[result["sha256"]] = name
+                result.update(status=status, stored_as=name)
+    finally:
+        # Rejected, duplicate and failed uploads; stored ones were renamed already.
+        for _, temp_path in pending:
+            await asyncio.to_thread(_remove, temp_path)
+    return results
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@dataclass
+class Ingestion:
+    company_name: str
+    status: str = QUEUED
+    queued_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    num_nodes: Optional[int] = None
+    error: Optional[str] = None
+
+    def summary(self) -> dict:
+        return {
+            "company_name": self.company_name,
+            "status": self.status,
+            "queued_at": self.queued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "num_nodes": self.num_nodes,
+            "error": self.error,
+        }
+
+
+class IngestionManager:
+    """Indexes uploaded company documents in the background, one run per company at a time."""
+
+    def __init__(self, embed_model: BaseEmbedding) -> None:
+        self.embed_model = embed_model
+        self.ingestions: Dict[str, Ingestion] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._rerun: Dict[str, bool] = {}
+
+    def schedule(self, company_name: str) -> Ingestion:
+        ingestion = self.ingestions.get(company_name)
+        if ingestion is None:
+            ingestion = self.ingestions[company_name] = Ingestion(company_name)
+        task = self._tasks.get(company_name)
+        if task is not None and not task.done():
+            # Files stored after the running sync scanned the folder need another pass.
+            self._rerun[company_name] = True
+            return ingestion
+        ingestion.status = QUEUED
+        ingestion.queued_at = time.time()
+        self._rerun[company_name] = True
+        self._tasks[company_name] = asyncio.create_task(self._run(ingestion))
+        return ingestion
+
+    def get(self, company_name: str) -> Optional[Ingestion]:
+        return self.ingestions.get(company_name)
+
+    def list_ingestions(self) -> List[dict]:
+        return [ingestion.summary() for ingestion in self.ingestions.values()]
+
+    async def _run(self, ingestion: Ingestion) -> None:
+        company_name = ingestion.company_name
+        while self._rerun.get(company_name):
+            self._rerun[company_name] = False
+            ingestion.status = RUNNING
+            ingestion.started_at = time.time()
+            ingestion.finished_at = None
+            ingestion.error = None
+            try:
+                print(f"\n> Ingesting uploaded documents of {company_name}\n")
+                # Background work, so it queues behind interactive sessions for the embedding model.
+                with batch_priority():
+                    index = await get_company_index(company_name, self.embed_model)
+                ingestion.num_nodes = len(index.docstore.docs)
+                ingestion.status = COMPLETED
+            except Exception as e:
+                logger.exception(f"Ingestion of {company_name} failed")
+                ingestion.error = str(e)
+                ingestion.status = FAILED
+            ingestion.finished_at = time.time()
+
+    async def close(self) -> None:
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -21,12 +21,14 @@ from llama_index.core.response_synthesizers import (
     get_response_synthesizer,
 )
 
-from typing import Union, List
+from typing import Callable, Optional, Union, List
 from llama_index.core.node_parser import SentenceSplitter
 
 from llama_index.core.workflow import Event
 from llama_index.core.schema import NodeWithScore
 
+from metrics import instrument_steps
+
 
 class RetrieverEvent(Event):
     """Result of running retrieval"""
@@ -97,12 +99,15 @@ DEFAULT_CITATION_CHUNK_SIZE = 512
 DEFAULT_CITATION_CHUNK_OVERLAP = 20
 
 
+@instrument_steps
 class CompanyDocsWorkflow(Workflow):
-    def __init__(self,llm: LLM,embed_model: BaseEmbedding, index: VectorStoreIndex, *args, **kwargs):
+    def __init__(self,llm: LLM,embed_model: BaseEmbedding, index: VectorStoreIndex, *args, token_callback: Optional[Callable[[str], None]] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.index = index
         self.llm = llm
         self.embed_model = embed_model
+        # Receives answer tokens as they are generated when set.
+        self.token_callback = token_callback
 
 
 
@@ -186,7 +191,12 @@ class CompanyDocsWorkflow(Workflow):
             refine_template=CITATION_REFINE_TEMPLATE,
             response_mode=ResponseMode.COMPACT,
             use_async=True,
+            streaming=self.token_callback is not None,
         )
 
         response = await synthesizer.asynthesize(query, nodes=ev.nodes)
+        if self.token_callback is not None:
+            async for delta in response.async_response_gen():
+                self.token_callback(delta)
+            response = await response.get_response()
         return StopEvent(result=response)
\ No newline at end of file
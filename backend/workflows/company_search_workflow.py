@@ -1,5 +1,5 @@
 from logging import getLogger
-from typing import List, Any
+from typing import List, Any, Optional
 from llama_index.core.schema import Document
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.llms.llm import LLM
@@ -14,8 +14,9 @@ from llama_index.core.workflow import (
 
 from subquery import get_sub_queries
 from tavily import get_docs_from_tavily_search
-from compress import get_compressed_context
+from compress import CompressionEngine, DocumentPool, format_context
 from llm_prompts import generate_response_from_context
+from metrics import instrument_steps, record_cache_lookups
 
 
 
@@ -45,17 +46,21 @@ class LLMResponseEvent(Event):
     response: str
 
 
+@instrument_steps
 class CompanySearchWorkflow(Workflow):
     def __init__(
         self,
         *args: Any,
         llm: LLM,
         embed_model: BaseEmbedding,
+        document_pool: Optional[DocumentPool] = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(*args, **kwargs)
         self.llm = llm
         self.embed_model = embed_model
+        # Pages scraped earlier in the same analysis; searched before the web.
+        self.document_pool = document_pool
         self.visited_urls: set[str] = set()
 
     @step
@@ -63,7 +68,8 @@ class CompanySearchWorkflow(Workflow):
         
         query = ev.get("query")
         await ctx.set("query", query)
-        company_queries = await get_sub_queries(query, self.llm, num_sub_queries=2)
+        # Callers that already know what to look up can skip sub-query generation.
+        company_queries = ev.get("sub_queries") or await get_sub_queries(query, self.llm, num_sub_queries=2)
         await ctx.set("num_company_queries", len(company_queries))
         return CompanyQueriesCreatedEvent(company_queries=company_queries)
     
@@ -76,26 +82,58 @@ class CompanySearchWorkflow(Workflow):
             ctx.send_event(ToProcessCompanyQueryEvent(company_query=company_query))
         return None
     
-    @step
+    @step(num_workers=3)
     async def get_docs_for_subquery(
         self, ev: ToProcessCompanyQueryEvent
     ) -> DocsScrapedEvent:
         company_query = ev.company_query
-        docs, visited_urls = await get_docs_from_tavily_search(
-            company_query, self.visited_urls
+        if self.document_pool is None:
+            docs, visited_urls = await get_docs_from_tavily_search(
+                company_query, self.visited_urls
+            )
+            self.visited_urls = visited_urls
+            return DocsScrapedEvent(company_query=company_query, docs=docs)
+
+        covered = await self.document_pool.covers(company_query)
+        record_cache_lookups("document_pool", int(covered), int(not covered))
+        if covered:
+            print(f"\n> Answering sub query from {len(self.document_pool.urls)} pooled pages: {company_query}\n")
+            return DocsScrapedEvent(company_query=company_query, docs=[])
+        # Only pages that are not pooled yet are returned.
+        docs, _ = await get_docs_from_tavily_search(
+            company_query, self.visited_urls | self.document_pool.urls
         )
-        self.visited_urls = visited_urls
+        self.visited_urls.update(doc.metadata["source"] for doc in docs)
         return DocsScrapedEvent(company_query=company_query, docs=docs)
     
-    @step(num_workers=3)
-    async def compress_docs(self, ev: DocsScrapedEvent) -> ToCombineContextEvent:
-        company_query = ev.company_query
-        docs = ev.docs
-        print(f"\n> Compressing docs for sub query: {company_query}\n")
-        compressed_context = await get_compressed_context(
-            company_query, docs, self.embed_model
+    @step
+    async def compress_docs(self, ctx: Context, ev: DocsScrapedEvent) -> ToCombineContextEvent:
+        events = ctx.collect_events(
+            ev, [DocsScrapedEvent] * await ctx.get("num_company_queries")
         )
-        return ToCombineContextEvent(company_query=company_query, context=compressed_context)
+        if events is None:
+            return None
+
+        # Chunk and embed every scraped doc once, then answer all sub-queries
+        # against the shared chunk matrix.
+        engine = self.document_pool if self.document_pool is not None else CompressionEngine(self.embed_model)
+        await engine.add_documents([doc for event in events for doc in event.docs])
+        company_queries = [event.company_query for event in events]
+        print(f"\n> Compressing {len(engine)} chunks for sub queries: {company_queries}\n")
+        results = await engine.retrieve(company_queries)
+        # Pooled pages scraped by an earlier search are sources of this answer too.
+        self.visited_urls.update(
+            node.node.metadata["source"]
+            for nodes in results
+            for node in nodes
+            if node.node.metadata.get("source")
+        )
+
+        for company_query, nodes in zip(company_queries, results):
+            ctx.send_event(
+                ToCombineContextEvent(company_query=company_query, context=format_context(nodes))
+            )
+        return None
    
     @step
     async def combine_contexts(
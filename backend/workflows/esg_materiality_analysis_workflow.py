@@ -1,7 +1,18 @@
+import asyncio
 import json
+import os
 from logging import getLogger
-from typing import List, Any
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+from typing import Callable, Any, Optional
+from gri_index import GRIIndex
+from gri_catalog import GRICatalog, reporting_requirements_query
+from checkpoints import (
+    ASSESSING,
+    AWAITING_COMPANY_DETAILS,
+    AWAITING_GRI_TOPICS,
+    COMPLETED,
+    STARTED,
+    RunCheckpoint,
+)
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.llms.llm import LLM
 
@@ -19,15 +30,25 @@ from llama_index.core.workflow.events import (
 )
 
 from llm_prompts import *
+from company_index import get_company_index, has_company_docs
 
+from compress import DocumentPool
+from metrics import instrument_steps
 from workflows.company_search_workflow import CompanySearchWorkflow
-from workflows.gri_workflow import GRIWorkflow, get_gri_workflow
+from workflows.gri_workflow import get_gri_workflow
 from workflows.company_docs_workflow import CompanyDocsWorkflow
 
 
 
 logger = getLogger(__name__)
 
+# GRI topics in each stage at the same time: live reporting-requirements lookups
+# (topics missing from the catalog) and, separately, topic assessments. Each
+# assessment runs the company docs and search branches side by side, and the
+# docs branch formats each of its N source nodes with another LLM call, so a run
+# can ask for up to TOPIC_CONCURRENCY x (2 + N) LLM calls at once, plus the
+# lookups. The LLM scheduler's LLM_MAX_CONCURRENCY caps how many actually run.
+TOPIC_CONCURRENCY = int(os.getenv("TOPIC_CONCURRENCY") or 4)
 
 
 class CompanyDetailsAvailableEvent(HumanResponseEvent):
@@ -72,6 +93,20 @@ class FormattedTopicAssesmentAvailableEvent(Event):
 class ProgressEvent(Event):
     pass
 
+class TokenStreamEvent(Event):
+    """A chunk of LLM output streamed while an answer is being generated.
+
+    `stream` names the answer being generated ("company_docs", "assesment" or
+    "un_sdg_list") and `gri_topic` the topic it belongs to, so chunks from
+    topics assessed concurrently can be told apart.
+    """
+    stream: str
+    delta: str
+    gri_topic: Optional[str] = None
+
+    def to_json(self):
+        return {"gri_topic": self.gri_topic, "stream": self.stream, "delta": self.delta}
+
 class InputRequiredOnMaterialityTopicsEvent(InputRequiredEvent):
     pass
 
@@ -87,21 +122,71 @@ class UserInputOnCompanyDetailsEvent(HumanResponseEvent):
 
 
 
+@instrument_steps
 class ESGMaterialityAnalysisWorkflow(Workflow):
     def __init__(
         self,
         *args: Any,
         llm: LLM,
         embed_model: BaseEmbedding,
+        gri_index: GRIIndex = None,
+        gri_catalog: GRICatalog = None,
+        checkpoint: Optional[RunCheckpoint] = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(*args, **kwargs)
         self.llm = llm
         self.embed_model = embed_model
+        self.gri_index = gri_index
+        self.gri_catalog = gri_catalog
+        # Finished step outputs are recorded here and reused when the run is resumed.
+        self.checkpoint = checkpoint
+        # Every page scraped during this run, reused by revisions and topic searches.
+        self.document_pool = DocumentPool(embed_model)
         self.visited_urls: set[str] = set()
 
+    @staticmethod
+    def _token_writer(ctx: Context, stream: str, gri_topic: Optional[str] = None) -> Callable[[str], None]:
+        def write_token(delta: str) -> None:
+            ctx.write_event_to_stream(TokenStreamEvent(stream=stream, delta=delta, gri_topic=gri_topic))
+        return write_token
+
+    async def _resume_from_checkpoint(self, ctx: Context) -> Event:
+        """Restore the context from the checkpoint and continue after its last finished step."""
+        checkpoint = self.checkpoint
+        company_name = checkpoint.get("company_name")
+        company_details = checkpoint.get("company_details")
+        gri_topics = checkpoint.get("gri_topics")
+        ctx.write_event_to_stream(ProgressEvent(msg=f"Resuming analysis for {company_name}...."))
+
+        await ctx.set("company_name", company_name)
+        for key, value in company_details.items():
+            await ctx.set(key, value)
+        ctx.write_event_to_stream(CompanyDetailsAvailableEvent(**company_details, response=""))
+        if checkpoint.stage == AWAITING_COMPANY_DETAILS:
+            return InputRequiredOnCompanyDetailsEvent(prefix="",payload=f"Do you agree with GICS classification for {company_name}?")
+
+        await ctx.set("gri_topics", gri_topics)
+        ctx.write_event_to_stream(GRITopicsAvailableEvent(gri_topics = gri_topics, response=""))
+        if checkpoint.stage == AWAITING_GRI_TOPICS:
+            return InputRequiredOnMaterialityTopicsEvent(prefix="",payload=f"Do you agree with the list of applicable GRI materilaity topics for {company_name}?")
+
+        if checkpoint.stage == COMPLETED:
+            topic_assesments = checkpoint.get("topic_assesments", {})
+            for gri_topic in gri_topics:
+                ctx.write_event_to_stream(TopicAssesmentAvailableEvent(**topic_assesments[gri_topic]))
+            return StopEvent(result=checkpoint.get("un_sdg_list"))
+
+        # The topics were confirmed, pick up the topic assessments.
+        return GRITopicsAvailableEvent(gri_topics = gri_topics, response="yes")
+
     @step
-    async def get_company_details(self, ctx: Context, ev: StartEvent | UserInputOnCompanyDetailsEvent) -> InputRequiredOnCompanyDetailsEvent:
+    async def get_company_details(
+        self, ctx: Context, ev: StartEvent | UserInputOnCompanyDetailsEvent
+    ) -> InputRequiredOnCompanyDetailsEvent | InputRequiredOnMaterialityTopicsEvent | GRITopicsAvailableEvent | StopEvent:
+        if isinstance(ev, StartEvent) and self.checkpoint is not None and self.checkpoint.stage != STARTED:
+            return await self._resume_from_checkpoint(ctx)
+
         company_name = ev.get("company_name")
         await ctx.set("company_name", company_name)
         progress_message = f"Retrieving GICS Sector, Industry, and Key Description for {company_name}...."
@@ -109,7 +194,7 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
         
         if isinstance(ev, StartEvent):
             query = f"Find out GICS Sector, GICS Industry Group, GICS Industry and high level description for company {company_name}"
-            company_search_workflow = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, timeout=120.0 * 4)
+            company_search_workflow = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, document_pool=self.document_pool, timeout=120.0 * 4)
             result = await company_search_workflow.run(query=query)
             company_details = str(result["response"])
             structured_company_details = await generate_structured_output(context=company_details, schema=CompanyDetailsAvailableEvent.model_json_schema(), llm=self.llm)
@@ -119,8 +204,14 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
             company_name = ev.company_name
             user_input = ev.user_input
             query = f"Find out GICS Sector, GICS Industry Group, GICS Industry and high level description for company {company_name}. Make sure you consider user input: {user_input} when formulating a response."
-            company_search_workflow = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, timeout=120.0 * 4)
-            result = await company_search_workflow.run(query=query)
+            # The pool holds the pages of earlier rounds, so look up the feedback directly
+            # instead of generating sub-queries; only pages it does not cover are fetched.
+            sub_queries = [
+                f"GICS classification and business description of {company_name}",
+                f"{company_name}: {user_input}",
+            ]
+            company_search_workflow = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, document_pool=self.document_pool, timeout=120.0 * 4)
+            result = await company_search_workflow.run(query=query, sub_queries=sub_queries)
             company_details = str(result["response"])
             structured_company_details = await generate_structured_output(context=company_details, schema=CompanyDetailsAvailableEvent.model_json_schema(), llm=self.llm)
             company_details_json = json.loads(structured_company_details)
@@ -134,6 +225,17 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
         await ctx.set("gics_industry_group", gics_industry_group)
         await ctx.set("gics_industry", gics_industry)
         await ctx.set("company_description", company_description)
+        if self.checkpoint is not None:
+            self.checkpoint.update(
+                stage=AWAITING_COMPANY_DETAILS,
+                company_name=company_name,
+                company_details={
+                    "gics_sector": gics_sector,
+                    "gics_industry_group": gics_industry_group,
+                    "gics_industry": gics_industry,
+                    "company_description": company_description,
+                },
+            )
 
         ctx.write_event_to_stream(CompanyDetailsAvailableEvent(gics_sector=gics_sector,gics_industry_group=gics_industry_group
                                             ,gics_industry=gics_industry,company_description=company_description,response=""))
@@ -167,6 +269,8 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
         
         ctx.write_event_to_stream(GRITopicsAvailableEvent(gri_topics = gri_topics, response=""))
         await ctx.set("gri_topics", gri_topics)
+        if self.checkpoint is not None:
+            self.checkpoint.update(stage=AWAITING_GRI_TOPICS, gri_topics=gri_topics)
         return InputRequiredOnMaterialityTopicsEvent(prefix="",payload=f"Do you agree with the list of applicable GRI materilaity topics for {company_name}?")
         
     
@@ -177,71 +281,104 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
     ) -> GRIReportingRequirementsAvailableEvent:
         gri_topics = ev.gri_topics
         
-        gri_workflow = get_gri_workflow(llm=self.llm, embed_model=self.embed_model)
         progress_message = f"Analyzing reporting requirements for the chosen GRI Topics..."
         ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
         await ctx.set("num_gri_topics_to_collect", len(gri_topics))
-        for gri_topic in gri_topics:
-            query = f"""List top 3 reporting requirements for GRI topic: {gri_topic}. 
-            Do not include any headings or subheading in the assesment.
-            Return reporting requirements as formatted markdown but without ```markdown string."""
-            reporting_requirements = await gri_workflow.run(query = query)
-            self.send_event(GRIReportingRequirementsAvailableEvent(gri_topic=gri_topic, reporting_requirements=reporting_requirements))
+        if self.checkpoint is not None:
+            self.checkpoint.update(stage=ASSESSING, gri_topics=gri_topics)
+        semaphore = asyncio.Semaphore(TOPIC_CONCURRENCY)
+
+        async def get_reporting_requirements(gri_topic: str) -> None:
+            reporting_requirements = None
+            if self.checkpoint is not None:
+                topic_assesment = self.checkpoint.get("topic_assesments", {}).get(gri_topic)
+                if topic_assesment is not None:
+                    # Assessed before the run was interrupted.
+                    event = TopicAssesmentAvailableEvent(**topic_assesment)
+                    ctx.write_event_to_stream(event)
+                    ctx.send_event(event)
+                    return
+                reporting_requirements = self.checkpoint.get("reporting_requirements", {}).get(gri_topic)
+
+            if reporting_requirements is None and self.gri_catalog:
+                reporting_requirements = self.gri_catalog.lookup(gri_topic)
+            if reporting_requirements is None:
+                # Not in the precomputed catalog, fall back to the live GRI workflow.
+                gri_workflow = get_gri_workflow(llm=self.llm, embed_model=self.embed_model, index=self.gri_index)
+                async with semaphore:
+                    reporting_requirements = await gri_workflow.run(query = reporting_requirements_query(gri_topic))
+            if self.checkpoint is not None:
+                self.checkpoint.set_topic_value("reporting_requirements", gri_topic, str(reporting_requirements))
+            # Hand each topic to get_topic_assesment as soon as its requirements are ready.
+            ctx.send_event(GRIReportingRequirementsAvailableEvent(gri_topic=gri_topic, reporting_requirements=reporting_requirements))
+
+        await asyncio.gather(*[get_reporting_requirements(gri_topic) for gri_topic in gri_topics])
 
     
-    @step
+    @step(num_workers=TOPIC_CONCURRENCY)
     async def get_topic_assesment(
         self, ctx: Context, ev: GRIReportingRequirementsAvailableEvent
     ) -> TopicAssesmentAvailableEvent:
         gri_topic = ev.gri_topic
         reporting_requirements = ev.reporting_requirements
         company_name = await ctx.get("company_name")
-        documents = SimpleDirectoryReader(f"data/company_docs/{company_name}").load_data()
-        index = VectorStoreIndex.from_documents(
-            documents=documents,
-            embed_model=self.embed_model,
-        )
 
-        progress_message = f"Preparing assement summary using company documents...."
-        ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
         doc_query = f"""Prepare an assesment report in about 200 words on gri topic {gri_topic} covering the reporting requirements listed below: 
         ------------------------------------------------------------------------------------------------------------------------------------
         {reporting_requirements}. 
         ------------------------------------------------------------------------------------------------------------------------------------
 
         """
-
-        workflow_docs = CompanyDocsWorkflow(index=index,llm=self.llm,embed_model=self.embed_model, timeout=120.0 * 4)
-        result_docs = await workflow_docs.run(query=doc_query)
-        assesment_docs = str(result_docs)
-        source_texts = []
-        for source_node in result_docs.source_nodes:
-
-            formatted_source_text = await generate_formatted_markdown_text(context = source_node.node.get_text(), llm=self.llm)
-            source_texts.append(formatted_source_text)
-
-        
-        progress_message = f"Preparing assement summary using internet search data...."
-        ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
         search_query = f"""Prepare an assesment report in about 200 words for company {company_name} on gri topic {gri_topic} covering the reporting requirements listed below: 
         ------------------------------------------------------------------------------------------------------------------------------------
         {reporting_requirements}. 
         ------------------------------------------------------------------------------------------------------------------------------------
 
         """
-        workflow_search = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, timeout=120.0 * 4)
-        result_search = await workflow_search.run(query=search_query)
-        assesment_search = str(result_search["response"])
-        visited_urls = list(result_search["visited_urls"])
-        source_texts.extend(visited_urls)
-        
-        progress_message = f"Finalizing assement summary...."
-        ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
-        assesment = await consolidate_assesment(assesment_1 = assesment_docs,assesment_2 = assesment_search,llm=self.llm)
+
+        async def assess_from_company_docs() -> tuple[str, list[str]]:
+            index = await get_company_index(company_name, self.embed_model)
+            workflow_docs = CompanyDocsWorkflow(index=index,llm=self.llm,embed_model=self.embed_model, timeout=120.0 * 4,
+                                                token_callback=self._token_writer(ctx, "company_docs", gri_topic))
+            result_docs = await workflow_docs.run(query=doc_query)
+            source_texts = await asyncio.gather(*[
+                generate_formatted_markdown_text(context = source_node.node.get_text(), llm=self.llm)
+                for source_node in result_docs.source_nodes
+            ])
+            return str(result_docs), list(source_texts)
+
+        async def assess_from_search() -> tuple[str, list[str]]:
+            workflow_search = CompanySearchWorkflow(llm=self.llm,embed_model=self.embed_model, document_pool=self.document_pool, timeout=120.0 * 4)
+            result_search = await workflow_search.run(query=search_query)
+            return str(result_search["response"]), list(result_search["visited_urls"])
+
+        if not await asyncio.to_thread(has_company_docs, company_name):
+            # Without uploaded documents the search branch alone makes the assesment.
+            progress_message = f"No company documents found, preparing assement summary using internet search data...."
+            ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
+            assesment, source_texts = await assess_from_search()
+        else:
+            # Only consolidate_assesment needs both branches, so they run side by side.
+            progress_message = f"Preparing assement summary using company documents...."
+            ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
+            progress_message = f"Preparing assement summary using internet search data...."
+            ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
+            (assesment_docs, source_texts), (assesment_search, visited_urls) = await asyncio.gather(
+                assess_from_company_docs(), assess_from_search()
+            )
+            source_texts.extend(visited_urls)
+
+            progress_message = f"Finalizing assement summary...."
+            ctx.write_event_to_stream(ProgressEvent(msg=progress_message))
+            assesment = await consolidate_assesment(assesment_1 = assesment_docs,assesment_2 = assesment_search,llm=self.llm,
+                                                    on_token=self._token_writer(ctx, "assesment", gri_topic))
         
         
-        ctx.write_event_to_stream(TopicAssesmentAvailableEvent(gri_topic=gri_topic,reporting_requirements=reporting_requirements,assesment=assesment,source_texts=source_texts))
-        return TopicAssesmentAvailableEvent(gri_topic=gri_topic,reporting_requirements=reporting_requirements,assesment=assesment,source_texts=source_texts)
+        topic_assesment = TopicAssesmentAvailableEvent(gri_topic=gri_topic,reporting_requirements=reporting_requirements,assesment=assesment,source_texts=source_texts)
+        if self.checkpoint is not None:
+            self.checkpoint.set_topic_value("topic_assesments", gri_topic, topic_assesment.to_json())
+        ctx.write_event_to_stream(topic_assesment)
+        return topic_assesment
 
         
     @step
@@ -264,7 +401,10 @@ class ESGMaterialityAnalysisWorkflow(Workflow):
 
             """
 
-        un_sdg_list = await get_applicable_un_sdg_list(company_name = company_name,assesment = consolidated_assesment,llm=self.llm)
+        un_sdg_list = await get_applicable_un_sdg_list(company_name = company_name,assesment = consolidated_assesment,llm=self.llm,
+                                                       on_token=self._token_writer(ctx, "un_sdg_list"))
+        if self.checkpoint is not None:
+            self.checkpoint.update(stage=COMPLETED, un_sdg_list=un_sdg_list)
 
         return StopEvent(result=un_sdg_list)
 
@@ -1,6 +1,6 @@
+import asyncio
+import os
 from logging import getLogger
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, load_index_from_storage, StorageContext
-from llama_index.core.node_parser import SemanticSplitterNodeParser, SentenceSplitter
 from llama_index.core.response_synthesizers import CompactAndRefine
 from llama_index.core.workflow import (
     Context,
@@ -14,12 +14,19 @@ from llama_index.core.schema import NodeWithScore
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.llms.llm import LLM
 from llama_index.postprocessor.rankgpt_rerank import RankGPTRerank
-from llama_index.vector_stores.faiss import FaissVectorStore
-import faiss
+
+from build_gri_index import build_gri_index
+from gri_index import GRIIndex, load_gri_index
+from metrics import instrument_steps
+from rerank import HybridRerank
 
 
 logger = getLogger(__name__)
 
+# "hybrid" reranks in-process; "rankgpt" asks the LLM to rank the retrieved nodes.
+RERANK_MODES = ("hybrid", "rankgpt")
+DEFAULT_RERANK_MODE = os.getenv("GRI_RERANK_MODE") or "hybrid"
+
 
 class RetrieverEvent(Event):
     """Result of running retrieval"""
@@ -33,12 +40,16 @@ class RerankEvent(Event):
     nodes: list[NodeWithScore]
 
 
+@instrument_steps
 class GRIWorkflow(Workflow):
-    def __init__(self,llm: LLM,embed_model: BaseEmbedding, index: VectorStoreIndex, *args, **kwargs):
+    def __init__(self,llm: LLM,embed_model: BaseEmbedding, index: GRIIndex, *args, rerank_mode: str = DEFAULT_RERANK_MODE, **kwargs):
         super().__init__(*args, **kwargs)
+        if rerank_mode not in RERANK_MODES:
+            raise ValueError(f"Unknown rerank mode {rerank_mode}, expected one of {RERANK_MODES}.")
         self.index = index
         self.llm = llm
         self.embed_model = embed_model
+        self.rerank_mode = rerank_mode
 
     @step
     async def retrieve(self, ctx: Context, ev: StartEvent) -> RetrieverEvent | None:
@@ -56,7 +67,7 @@ class GRIWorkflow(Workflow):
         await ctx.set("top_k", top_k)
         await ctx.set("top_n", top_n)
 
-        retriever = self.index.as_retriever(similarity_top_k=top_k)
+        retriever = self.index.as_retriever(similarity_top_k=top_k, embed_model=self.embed_model)
         nodes = await retriever.aretrieve(query)
         return RetrieverEvent(nodes=nodes)
 
@@ -66,13 +77,20 @@ class GRIWorkflow(Workflow):
         top_n = await ctx.get("top_n")
         query = await ctx.get("query")
 
+        if self.rerank_mode == "hybrid":
+            ranker = HybridRerank(top_n=top_n)
+            new_nodes = ranker.postprocess_nodes(ev.nodes, query_str=query)
+            return RerankEvent(nodes=new_nodes)
+
         ranker = RankGPTRerank(top_n=top_n, llm=self.llm)
 
         try:
-            new_nodes = ranker.postprocess_nodes(ev.nodes, query_str=query)
-        except Exception:
+            # RankGPT makes a blocking LLM call, keep it off the event loop.
+            new_nodes = await asyncio.to_thread(ranker.postprocess_nodes, ev.nodes, query_str=query)
+        except Exception as e:
             # Handle errors in the LLM response
-            new_nodes = ev.nodes
+            logger.warning(f"RankGPT rerank failed, keeping retrieval order: {e}")
+            new_nodes = ev.nodes[:top_n]
         return RerankEvent(nodes=new_nodes)
 
     @step
@@ -88,28 +106,13 @@ class GRIWorkflow(Workflow):
 
 
 def create_index(embed_model: BaseEmbedding) -> None:
-    # create a faiss index
-    d = 1024
-    faiss_index = faiss.IndexFlatL2(d)
-    vector_store = FaissVectorStore(faiss_index=faiss_index)
-    documents = SimpleDirectoryReader("data/gri").load_data()
-    
-    # vector_store = FaissVectorStore(faiss_index=faiss_index)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    
-    index = VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context, embed_model=embed_model
-    )
-    index.storage_context.persist(persist_dir="./storage/gri")
-
-
-
-def get_gri_workflow(llm: LLM,embed_model: BaseEmbedding) -> GRIWorkflow:
-
-    vector_store = FaissVectorStore.from_persist_dir("./storage/gri")
-    storage_context = StorageContext.from_defaults(
-        vector_store=vector_store, persist_dir="./storage/gri"
-    )
-    index = load_index_from_storage(storage_context=storage_context)
+    build_gri_index(embed_model)
+
+
+
+def get_gri_workflow(llm: LLM,embed_model: BaseEmbedding, index: GRIIndex = None) -> GRIWorkflow:
+
+    if index is None:
+        index = load_gri_index()
 
     return GRIWorkflow(llm= llm,embed_model= embed_model, index=index, timeout=120.0)
@@ -12,11 +12,13 @@ export default function Home() {
   const [comment, setComment] = useState('');
   const [loading, setLoading] = useState(false); 
   const [loadingMessage, setLoadingMessage] = useState(''); 
+  const [liveStreams, setLiveStreams] = useState<Record<string, { gri_topic: string | null, stream: string, text: string }>>({});
 
 
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault();
     setProgress([]);
+    setLiveStreams({});
 
     if (files.length > 0) {
       const formData = new FormData();
@@ -62,6 +64,13 @@ export default function Home() {
       console.log('Received:', data);
       if (data.type === 'progress') {
         setLoadingMessage(data.payload);
+      } else if (data.type === 'token') {
+        const { gri_topic, stream, delta } = data.payload;
+        const key = `${gri_topic ?? ''}|${stream}`;
+        setLiveStreams(prev => ({
+          ...prev,
+          [key]: { gri_topic, stream, text: (prev[key]?.text ?? '') + delta },
+        }));
       } else if (data.type === 'company_details') {
         setLoading(false);
         const { gics_sector, gics_industry_group, gics_industry, company_description } = data.payload;
@@ -110,6 +119,9 @@ export default function Home() {
       } else if (data.type === 'topic_assesment') {
         setLoading(false);
         const { gri_topic, reporting_requirements, assesment, source_texts } = data.payload;
+        setLiveStreams(prev => Object.fromEntries(
+          Object.entries(prev).filter(([, live]) => live.gri_topic !== gri_topic)
+        ));
         const topicAssessment = (
           <TopicAssessment 
             gri_topic={gri_topic} 
@@ -121,6 +133,7 @@ export default function Home() {
         setProgress(prev => [...prev, topicAssessment]);
       } else if (data.type === 'un_sdg_list') {
         const unSDGList = data.payload;
+        setLiveStreams({});
         const formattedSDGList = (
           <div className={styles.topicsContainer}>
             <h4>UN Sustainable Development Goals</h4>
@@ -235,6 +248,12 @@ export default function Home() {
             </button>
           </div>
         )}
+        {Object.entries(liveStreams).map(([key, live]) => (
+          <div key={key} className={styles.message}>
+            <strong>{live.gri_topic ? `${live.gri_topic} (${live.stream})` : live.stream}</strong>
+            <ReactMarkdown>{live.text}</ReactMarkdown>
+          </div>
+        ))}
         {loading && (
           <div className={styles.loadingContainer}>
             <div className={styles.spinner}></div>